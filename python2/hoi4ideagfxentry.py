@@ -3,6 +3,7 @@ import argparse
 import os
 import sys
 import re
+import sqlite3
 
 #############################
 ###
@@ -35,8 +36,17 @@ import re
 ###                         Format of icon files, without dot (default: dds)
 ###   -np, --no_prefix      Do not add idea_ prefix to icon file names (Default:
 ###                         True)
+###   -i index, --index index
+###                         Symbol index database made by hoi4symbolindex.py - GFX
+###                         entries defined anywhere in the mod will be skipped
+###                         (default:"")
 ###
 #############################
+# Contract with python3/hoi4symbolindex.py - keep in sync with SCHEMA_VERSION and
+# IS_DEFINED_QUERY there
+INDEX_SCHEMA_VERSION = 1
+INDEX_IS_DEFINED_QUERY = "SELECT 1 FROM symbols WHERE kind = ? AND name = ? AND is_definition = 1 LIMIT 1"
+
 def readfile(name):
     print("Reading file " + name + "...")
     with open(name, "r") as f:
@@ -67,6 +77,17 @@ def readfile(name):
     print("File %s read successfully, %s unique idea pictures found." % (name, str(len(pictures))))
     return pictures
 
+def open_index(name):
+    connection = sqlite3.connect(name) if os.path.isfile(name) else None
+    if connection is None or connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+        if connection is not None:
+            connection.close()
+        sys.exit("Symbol index " + name + " does not exist or was made by another version of hoi4symbolindex.py. Run hoi4symbolindex.py on the mod to update it.")
+    return connection
+
+def is_in_index(connection, kind, name):
+    return connection.execute(INDEX_IS_DEFINED_QUERY, (kind, name)).fetchone() is not None
+
 def find_index_before_bracket(lines):
     after_bracket = False
     index_to_insert = 0
@@ -88,6 +109,8 @@ parser.add_argument('--icon_format', metavar='icon_format', default="dds", requi
                     help='Format of icon files, without dot (default: dds)')
 parser.add_argument( '-np', '--no_prefix', action='store_true', required=False,
                     help='Do not add idea_ prefix to icon file names (Default: True)')
+parser.add_argument('-i', '--index', metavar='index', default="", required=False,
+                    help='Symbol index database made by hoi4symbolindex.py - GFX entries defined anywhere in the mod will be skipped (default:\"\")')
 
 args = parser.parse_args()
 prefix = ""
@@ -103,6 +126,16 @@ if os.path.exists(args.gfx_file):
 if len(lines) < 1:
     lines = ["spriteTypes = {", "}"]
 
+existing_names = set()
+for line in lines:
+    match = re.search(r'name\s*=\s*"([^"]+)"', re.sub('#.*', "", line))
+    if match:
+        existing_names.add(match.group(1))
+
+index = None
+if args.index:
+    index = open_index(args.index)
+
 if args.icon_directory != "":
     args.icon_directory = "/" + args.icon_directory
 
@@ -111,8 +144,9 @@ for idea in parsed_file:
 
     gfx_entry_name = "GFX_idea_%s" % idea
 
-    if any(re.search(("name(\s|).*=(\s|).*\"%s\"" % gfx_entry_name), line) for line in lines):
+    if gfx_entry_name in existing_names or (index is not None and is_in_index(index, "sprite", gfx_entry_name)):
         continue
+    existing_names.add(gfx_entry_name)
 
     lines.insert(index_to_insert, "\t}")
     lines.insert(index_to_insert, "\t\ttexturefile = \"gfx/interface/ideas%s/%s.%s\"" % (args.icon_directory, ("%s%s" % (prefix, idea)), args.icon_format))
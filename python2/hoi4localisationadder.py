@@ -4,6 +4,9 @@ import os
 import sys
 import re
 import collections
+import sqlite3
+import glob
+import multiprocessing
 
 #############################
 ###
@@ -15,7 +18,9 @@ import collections
 ### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
-### usage: hoi4localisationadder.py [-h] [-t] input output
+### usage: hoi4localisationadder.py [-h] [-t] [-i INDEX] [-m]
+###                                  [-l [LANGUAGES [LANGUAGES ...]]] [-j JOBS]
+###                                  input [output]
 ### 
 ### Given an event, national_focus or ideas file, add missing localisation entries
 ### to a specified localisation file. Note: custom tooltips are not supported. In
@@ -24,18 +29,41 @@ import collections
 ### and descriptions will be added. For decisions and decision_categories, names
 ### and category names will be added. WARNING: The script defaults to a decisions
 ### file if it cannot determine the type of file.
+### With -m, the whole mod is synced at once - every events, national_focus,
+### ideas, decisions and decision_categories file is parsed in parallel and the
+### keys missing from each language are added to <file name>_l_<language>.yml.
 ### 
 ### positional arguments:
-###   input       Event, national_focus, decisions, decision_categories or ideas file to parse
+###   input       Event, national_focus, decisions, decision_categories or ideas
+###               file to parse (with -m, the root mod folder)
 ###   output      Localisation file to write to (if empty/non-existing, a new
-###               English localisation file will be created)
+###               English localisation file will be created). With -m, the
+###               localisation folder (Default: MOD/localisation)
 ### 
 ### optional arguments:
 ###   -h, --help  show this help message and exit
 ###   -t, --todo  Add "#TODO" to every added line instead of just once (Default:
 ###               False)
+###   -i INDEX, --index INDEX
+###               Symbol index database made by hoi4symbolindex.py - keys
+###               defined anywhere in the mod will be skipped (Default: "")
+###   -m, --mod   Sync the whole mod - parse every events, national_focus, ideas,
+###               decisions and decision_categories file in parallel and add the
+###               keys missing from all *_l_<language>.yml files of each language
+###               to <file name>_l_<language>.yml (Default: False)
+###   -l [LANGUAGES [LANGUAGES ...]], --languages [LANGUAGES [LANGUAGES ...]]
+###               With -m, languages to sync (Default: every language found in
+###               the localisation folder)
+###   -j JOBS, --jobs JOBS
+###               With -m, number of worker processes (Default: CPU count)
 ### 
 #############################
+LOC_KEY_REGEX = re.compile(r"^([^#:]*):")
+# Contract with python3/hoi4symbolindex.py - keep in sync with SCHEMA_VERSION and
+# IS_DEFINED_QUERY there
+INDEX_SCHEMA_VERSION = 1
+INDEX_IS_DEFINED_QUERY = "SELECT 1 FROM symbols WHERE kind = ? AND name = ? AND is_definition = 1 LIMIT 1"
+
 def readfile(name):
     print("Reading file " + name + "...")
     try:
@@ -116,53 +144,177 @@ def readfile(name):
 
     print("File " + name + " read successfully!")
     return list(tags.keys()), (is_event_file, is_focus_file, is_idea_file, is_decision_categories_file)
-###################################################################
-parser = argparse.ArgumentParser(description='Given an event, national_focus, decisions, decision_categories or ideas file, add missing localisation entries to a specified localisation file. Note: custom tooltips are not supported. In case of events, title, description and option names will be added (triggered titles and descriptions are supported). For national_focus and ideas, names and descriptions will be added. For decisions and decision_categories, names and category names will be added. WARNING: The script defaults to a decisions file if it cannot determine the type of file.')
-parser.add_argument('input', metavar='input',
-                    help='Event, national_focus, decisions, decision_categories or ideas file to parse')
-parser.add_argument( 'output', metavar='output',
-                    help='Localisation file to write to (if empty/non-existing, a new English localisation file will be created)')
-parser.add_argument( '-t', '--todo', action='store_true',
-                    help='Add "#TODO" to every added line instead of just once (Default: False)')
-
-args = parser.parse_args()
-
-parsed_file = readfile(args.input)
-#if not parsed_file[1][0] and not parsed_file[1][1] and not parsed_file[1][2:]:
-#    sys.exit("File " + args.input + " is not a valid event, national_focus or ideas file.")
-lines = list()
-try:
-    with open(args.output, "r") as f:
-        lines = f.read().splitlines()
-except:
+
+def read_lines(name):
+    lines = list()
     try:
-        with open(args.output, "r", encoding='utf-8') as f:
+        with open(name, "r") as f:
             lines = f.read().splitlines()
     except:
         try:
-            with open(args.output, "r", encoding='utf-8-sig') as f:
+            with open(name, "r", encoding='utf-8') as f:
                 lines = f.read().splitlines()
         except:
-            print("Could not read file " + args.output + "!")
-output_lines = list()
-if len(lines) < 1:
-    print("Output file " + args.output + " is empty or doesn't exist, creating a new english localisation file.")
-    output_lines.append("l_english:")
-for line in lines:
-    for i, parsed_line in enumerate(parsed_file[0]):
-        match = re.match(r"^([^#:]*):", line)
-        if match and match.group(1).strip() == parsed_line.strip():
-            print(parsed_line + " already in output file, skipping")
-            parsed_file[0].remove(parsed_file[0][i])
-if len(parsed_file[0]) > 0:
-    if not args.todo:
+            try:
+                with open(name, "r", encoding='utf-8-sig') as f:
+                    lines = f.read().splitlines()
+            except:
+                print("Could not read file " + name + "!")
+    return lines
+
+def read_localisation_keys(lines):
+    # Every key defined in a localisation file, parsed once into a set
+    keys = set()
+    for line in lines:
+        match = LOC_KEY_REGEX.match(line)
+        if match:
+            keys.add(match.group(1).strip())
+    return keys
+
+def read_localisation_file(name):
+    return read_localisation_keys(read_lines(name))
+
+def find_missing_keys(keys, existing_keys, verbose=True):
+    # Set difference which keeps the order keys were found in the input file
+    missing_keys = list()
+    for key in keys:
+        if key.strip() in existing_keys:
+            if verbose:
+                print(key + " already in output file, skipping")
+        else:
+            missing_keys.append(key)
+    return missing_keys
+
+def open_index(name):
+    connection = sqlite3.connect(name) if os.path.isfile(name) else None
+    if connection is None or connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+        if connection is not None:
+            connection.close()
+        sys.exit("Symbol index " + name + " does not exist or was made by another version of hoi4symbolindex.py. Run hoi4symbolindex.py on the mod to update it.")
+    return connection
+
+def is_in_index(connection, kind, name):
+    return connection.execute(INDEX_IS_DEFINED_QUERY, (kind, name)).fetchone() is not None
+
+def remove_indexed_keys(keys, index_name, verbose=True):
+    index = open_index(index_name)
+    indexed_keys = set(x for x in keys if is_in_index(index, "localisation", x))
+    index.close()
+    if verbose:
+        for key in keys:
+            if key in indexed_keys:
+                print(key + " already in mod localisation, skipping")
+    return [x for x in keys if x not in indexed_keys]
+
+def append_keys(name, keys, todo, language="english"):
+    output_lines = list()
+    if not os.path.isfile(name) or os.path.getsize(name) < 1:
+        print("Output file " + name + " is empty or doesn't exist, creating a new " + language + " localisation file.")
+        output_lines.append("l_" + language + ":")
+    if not todo:
         output_lines.append("\n #TODO")
     else:
         output_lines.append("\n")
-    for line in parsed_file[0]:
-        if args.todo:
+    for key in keys:
+        if todo:
             output_lines.append(" #TODO")
-        output_lines.append(" " + line + ":0 \"\"")
-    with open(args.output,"a") as f:
+        output_lines.append(" " + key + ":0 \"\"")
+    with open(name, "a") as f:
         f.writelines(str(line) + "\n" for line in output_lines)
-print("Appended " + str(len(parsed_file[0])) + " lines to output file " + args.output + " successfully!")
+
+###################################################################
+MOD_SOURCE_FOLDERS = ("events", "common/national_focus", "common/ideas", "common/decisions", "common/decisions/categories")
+LOC_FILE_REGEX = re.compile(r"_l_(\w+)\.yml$")
+
+def find_mod_files(mod_path, localisation_path):
+    sources = list()
+    for folder in MOD_SOURCE_FOLDERS:
+        sources += sorted(glob.glob(os.path.join(mod_path, folder, "*.txt")))
+    localisation_files = collections.OrderedDict()
+    for root, dirs, filenames in os.walk(localisation_path):
+        dirs.sort()
+        for filename in sorted(filenames):
+            match = LOC_FILE_REGEX.search(filename)
+            if match:
+                localisation_files.setdefault(match.group(1), list()).append(os.path.join(root, filename))
+    return sources, localisation_files
+
+def sync_mod(mod_path, localisation_path, languages, todo, index_name, jobs):
+    sources, localisation_files = find_mod_files(mod_path, localisation_path)
+    if not languages:
+        languages = list(localisation_files.keys()) or ["english"]
+    print("Scanning " + str(len(sources)) + " files for " + ", ".join(languages) + " localisation...")
+    all_localisation_files = [x for language in languages for x in localisation_files.get(language, [])]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        parsed_files = pool.map(readfile, sources)
+        localisation_keys = pool.map(read_localisation_file, all_localisation_files)
+    finally:
+        pool.close()
+        pool.join()
+    keys_by_file = dict(zip(all_localisation_files, localisation_keys))
+
+    added = 0
+    for language in languages:
+        existing_keys = set()
+        for name in localisation_files.get(language, []):
+            existing_keys |= keys_by_file[name]
+        # New files are put next to the existing ones of the same language
+        if localisation_files.get(language):
+            output_folder = os.path.dirname(localisation_files[language][0])
+        else:
+            output_folder = localisation_path
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+        for source, parsed_file in zip(sources, parsed_files):
+            keys = find_missing_keys(parsed_file[0], existing_keys, False)
+            if keys and index_name:
+                keys = remove_indexed_keys(keys, index_name, False)
+            if not keys:
+                continue
+            name = os.path.join(output_folder, os.path.splitext(os.path.basename(source))[0] + "_l_" + language + ".yml")
+            append_keys(name, keys, todo, language)
+            # A key used in several files is only added once
+            existing_keys.update(keys)
+            added += len(keys)
+            print("Appended " + str(len(keys)) + " lines from " + source + " to output file " + name)
+    print("Appended " + str(added) + " lines to " + str(len(languages)) + " languages successfully!")
+
+###################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Given an event, national_focus, decisions, decision_categories or ideas file, add missing localisation entries to a specified localisation file. Note: custom tooltips are not supported. In case of events, title, description and option names will be added (triggered titles and descriptions are supported). For national_focus and ideas, names and descriptions will be added. For decisions and decision_categories, names and category names will be added. WARNING: The script defaults to a decisions file if it cannot determine the type of file.')
+    parser.add_argument('input', metavar='input',
+                        help='Event, national_focus, decisions, decision_categories or ideas file to parse (with -m, the root mod folder)')
+    parser.add_argument( 'output', metavar='output', nargs='?',
+                        help='Localisation file to write to (if empty/non-existing, a new English localisation file will be created). With -m, the localisation folder (Default: MOD/localisation)')
+    parser.add_argument( '-t', '--todo', action='store_true',
+                        help='Add "#TODO" to every added line instead of just once (Default: False)')
+    parser.add_argument( '-i', '--index', default="",
+                        help='Symbol index database made by hoi4symbolindex.py - keys defined anywhere in the mod will be skipped (Default: "")')
+    parser.add_argument( '-m', '--mod', action='store_true',
+                        help='Sync the whole mod - parse every events, national_focus, ideas, decisions and decision_categories file in parallel and add the keys missing from all *_l_<language>.yml files of each language to <file name>_l_<language>.yml (Default: False)')
+    parser.add_argument( '-l', '--languages', nargs="*", default=[],
+                        help='With -m, languages to sync (Default: every language found in the localisation folder)')
+    parser.add_argument( '-j', '--jobs', type=int, default=None,
+                        help='With -m, number of worker processes (Default: CPU count)')
+
+    args = parser.parse_args()
+
+    if args.mod:
+        if not os.path.isdir(args.input):
+            sys.exit(args.input + " is not a directory or does not exist.")
+        sync_mod(args.input, args.output or os.path.join(args.input, "localisation"), args.languages, args.todo, args.index, args.jobs)
+        sys.exit()
+    if not args.output:
+        parser.error("output is required unless -m is given")
+
+    parsed_file = readfile(args.input)
+    if args.index:
+        parsed_file = (remove_indexed_keys(parsed_file[0], args.index), parsed_file[1])
+    #if not parsed_file[1][0] and not parsed_file[1][1] and not parsed_file[1][2:]:
+    #    sys.exit("File " + args.input + " is not a valid event, national_focus or ideas file.")
+    lines = read_lines(args.output)
+    parsed_file = (find_missing_keys(parsed_file[0], read_localisation_keys(lines)), parsed_file[1])
+    if len(parsed_file[0]) > 0:
+        append_keys(args.output, parsed_file[0], args.todo)
+    print("Appended " + str(len(parsed_file[0])) + " lines to output file " + args.output + " successfully!")
@@ -2,9 +2,10 @@
 import argparse
 import os
 import sys
-import glob
 import re
 import datetime
+import collections
+import multiprocessing
 
 #############################
 ###
@@ -19,13 +20,16 @@ import datetime
 ### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
-### usage: hoi4transfertechsegen.py [-h] [-en effectname] [-a | -o] input output
+### usage: hoi4transfertechsegen.py [-h] [-en effectname] [-n] [-j JOBS]
+###                                 [-a | -o]
+###                                 input output
 ###
 ### Given an input technology file or folder, generate a Transfer Technology
 ### scripted effect.
 ###
 ### positional arguments:
 ###   input                 Technology file name/folder containing files
+###                         (searched recursively)
 ###   output                File name to write the scripted effect to
 ###
 ### optional arguments:
@@ -35,6 +39,16 @@ import datetime
 ###                         (default:"transfer_technology")
 ###   -a, --add             Will add new technologies to an already existing
 ###                         transfer_technology effect (first set name with -en)
+###   -n, --nested          Will nest the check of every technology inside the
+###                         check of the technology leading to it (path =
+###                         { leads_to_tech = ... }), so technologies after one
+###                         PREV doesn't have are not checked at all.
+###                         Technologies with several prerequisites are not
+###                         nested. Technologies PREV got without their
+###                         prerequisite (eg. from an event) will not be
+###                         transferred
+###   -j JOBS, --jobs JOBS  Number of worker processes used to read a folder
+###                         (default: CPU count)
 ###   -o, --overwrite       Will overwrite the output file if it already exists
 ###
 #############################
@@ -54,6 +68,7 @@ def readfile(name):
     with open(name, "r") as f:
         lines = f.read().splitlines()
     names = list()
+    links = list()
 
     open_blocks = 0
     is_tech_file = False
@@ -65,101 +80,160 @@ def readfile(name):
             temp_line = line
             temp_line = re.sub('\s|=(\s|){', "", temp_line)
             names.append(temp_line)
+        if open_blocks > 1 and names:
+            for child in re.findall(r'leads_to_tech\s*=\s*([^\s}]+)', line):
+                links.append((names[-1], child))
         open_blocks += line.count('{')
         open_blocks -= line.count('}')
     if is_tech_file:
         print("File " + name + " read successfully!")
-        return names
+        return (names, links)
     else:
         print("File " + name + " is not a valid technology file.")
         return
 
-#############################
-parser = argparse.ArgumentParser(description='Given an input technology file or folder, generate a Transfer Technology scripted effect.')
-parser.add_argument('input', metavar='input',
-                    help='Technology file name/folder containing files')
-parser.add_argument( 'output', metavar='output',
-                    help='File name to write the scripted effect to')
-parser.add_argument( '-en', '--effectname', metavar='effectname', default="transfer_technology", required=False,
-                    help='Name of the scripted effect (default:\"transfer_technology\")')
-action = parser.add_mutually_exclusive_group(required=False)                    
-action.add_argument( '-a', '--add', action='store_true',
-                    help='Will add new technologies to an already existing transfer_technology effect (first set name with -en)')
-action.add_argument( '-o', '--overwrite', action='store_true',
-                    help='Will overwrite the output file if it already exists')
-
-args = parser.parse_args()
-names_global = list()
-is_dir = False
-try:
-    dir = readable_dir(args.input)
-    is_dir = True
-except:
-    print("Not a directory, treating as file.")
-
-if is_dir:
-    for file in glob.glob(dir+"/*.*"):
-        parsed_file = readfile(file)
+def find_children(names, links):
+    # Technology -> technologies nested in it. Only technologies with exactly one
+    # prerequisite (out of the ones being generated) are nested
+    name_set = set(names)
+    parents = dict()
+    for parent, child in links:
+        if parent in name_set and child in name_set and parent != child:
+            parents.setdefault(child, set()).add(parent)
+    children = dict()
+    for name in names:
+        if len(parents.get(name, ())) == 1:
+            children.setdefault(next(iter(parents[name])), list()).append(name)
+    return children
+
+def tech_lines(name, children, emitted, indent=2):
+    emitted.add(name)
+    tabs = "\t" * indent
+    yield ""
+    yield tabs + "if = {"
+    yield tabs + "\tlimit = {"
+    yield tabs + "\t\tPREV = {"
+    yield tabs + "\t\t\thas_tech = " + name + ""
+    yield tabs + "\t\t}"
+    yield tabs + "\t}"
+    yield tabs + "\tset_technology = {"
+    yield tabs + "\t\t" + name + " = 1"
+    yield tabs + "\t}"
+    for child in children.get(name, ()):
+        if child not in emitted:
+            for line in tech_lines(child, children, emitted, indent + 1):
+                yield line
+    yield tabs + "}"
+
+
+def find_files(name):
+    files = list()
+    for root, dirs, filenames in os.walk(name):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".txt"):
+                files.append(os.path.join(root, filename))
+    return files
+
+def read_files(files, jobs=None):
+    # Technologies in the order they were found, without duplicates, and their links
+    if len(files) > 1 and jobs != 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            parsed_files = pool.map(readfile, files)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parsed_files = [readfile(x) for x in files]
+    names = collections.OrderedDict()
+    links = list()
+    for parsed_file in parsed_files:
         if parsed_file:
-            names_global = names_global + parsed_file
-else:
-    parsed_file = readfile(args.input)
-    if parsed_file:
-            names_global = names_global + parsed_file
-
-if os.path.exists(args.output):
-    if not args.overwrite and not args.add:
-        sys.exit("File " + args.output + " already exists. Use -o parameter if you want to overwrite.")
-elif args.add:
-    sys.exit("File " + args.output + " doesn't exists. -a parameter requires an existing file.")
-
-if args.add:
-    with open(args.output,"r") as f:
-        read_file = f.read()
-        if not "### Automatically generated by Yard1's transfer_technology generator, originally for Equestria at War\n### File last modified: " in read_file:
-            sys.exit("File " + args.output + " is not a vaild file to add to.")
-        lines = read_file.splitlines()
-        for line in lines:
-            if "has_tech" in line:
-                duplicate = re.sub("^\s*has_tech = ", "", line).strip()
-                if duplicate in names_global:
-                    names_global.remove(duplicate)
-if not names_global or all(False for item in names_global):
-    sys.exit("Nothing to add - every technology is already in " + args.output)    
-output_lines = list()
-if not args.add:
-    output_lines.append("### DO NOT REMOVE OR CHANGE THE COMMENTS BELOW")
-    output_lines.append("### Transfer Technology Effect (" + args.effectname + ")")
-    output_lines.append("### Automatically generated by Yard1's transfer_technology generator, originally for Equestria at War")
-    output_lines.append("### File last modified: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "")
-    output_lines.append("### PREV is the giver, THIS is the reciever")
-
-    output_lines.append(args.effectname + " = {")
-    output_lines.append("\thidden_effect = {")
-
-for name in names_global:
-    output_lines.append("")
-    output_lines.append("\t\tif = {")
-    output_lines.append("\t\t\tlimit = {")
-    output_lines.append("\t\t\t\tPREV = {")
-    output_lines.append("\t\t\t\t\thas_tech = " + name + "")
-    output_lines.append("\t\t\t\t}")
-    output_lines.append("\t\t\t}")
-    output_lines.append("\t\t\tset_technology = {")
-    output_lines.append("\t\t\t\t" + name + " = 1")
-    output_lines.append("\t\t\t}")
-    output_lines.append("\t\t}")
-
-if not args.add:
-    output_lines.append("\t}")
-    output_lines.append("}")
-
-if args.add:
-    with open(args.output,"r+") as f:
-        read_lines = f.read().splitlines()
+            for name in parsed_file[0]:
+                names[name] = None
+            links.extend(parsed_file[1])
+    return (names, links)
+#############################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Given an input technology file or folder, generate a Transfer Technology scripted effect.')
+    parser.add_argument('input', metavar='input',
+                        help='Technology file name/folder containing files (searched recursively)')
+    parser.add_argument( 'output', metavar='output',
+                        help='File name to write the scripted effect to')
+    parser.add_argument( '-en', '--effectname', metavar='effectname', default="transfer_technology", required=False,
+                        help='Name of the scripted effect (default:\"transfer_technology\")')
+    parser.add_argument( '-n', '--nested', action='store_true',
+                        help='Will nest the check of every technology inside the check of the technology leading to it (path = { leads_to_tech = ... }), so technologies after one PREV doesn\'t have are not checked at all. Technologies with several prerequisites are not nested. Technologies PREV got without their prerequisite (eg. from an event) will not be transferred')
+    parser.add_argument( '-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes used to read a folder (default: CPU count)')
+    action = parser.add_mutually_exclusive_group(required=False)                    
+    action.add_argument( '-a', '--add', action='store_true',
+                        help='Will add new technologies to an already existing transfer_technology effect (first set name with -en)')
+    action.add_argument( '-o', '--overwrite', action='store_true',
+                        help='Will overwrite the output file if it already exists')
+
+    args = parser.parse_args()
+    is_dir = False
+    try:
+        dir = readable_dir(args.input)
+        is_dir = True
+    except:
+        print("Not a directory, treating as file.")
+
+    if is_dir:
+        names_global, links_global = read_files(find_files(dir), args.jobs)
+    else:
+        names_global, links_global = read_files([args.input])
+
+    if os.path.exists(args.output):
+        if not args.overwrite and not args.add:
+            sys.exit("File " + args.output + " already exists. Use -o parameter if you want to overwrite.")
+    elif args.add:
+        sys.exit("File " + args.output + " doesn't exists. -a parameter requires an existing file.")
+
+    read_lines = list()
+    if args.add:
+        with open(args.output,"r") as f:
+            read_file = f.read()
+            if not "### Automatically generated by Yard1's transfer_technology generator, originally for Equestria at War\n### File last modified: " in read_file:
+                sys.exit("File " + args.output + " is not a vaild file to add to.")
+            read_lines = read_file.splitlines()
+            for line in read_lines:
+                if "has_tech" in line:
+                    duplicate = re.sub("^\s*has_tech = ", "", line).strip()
+                    names_global.pop(duplicate, None)
+    names_global = list(names_global)
+    if not names_global:
+        sys.exit("Nothing to add - every technology is already in " + args.output)    
+    output_lines = list()
+    if not args.add:
+        output_lines.append("### DO NOT REMOVE OR CHANGE THE COMMENTS BELOW")
+        output_lines.append("### Transfer Technology Effect (" + args.effectname + ")")
+        output_lines.append("### Automatically generated by Yard1's transfer_technology generator, originally for Equestria at War")
+        output_lines.append("### File last modified: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "")
+        output_lines.append("### PREV is the giver, THIS is the reciever")
+
+        output_lines.append(args.effectname + " = {")
+        output_lines.append("\thidden_effect = {")
+
+    children = find_children(names_global, links_global) if args.nested else dict()
+    nested_names = set(x for y in children.values() for x in y)
+    emitted = set()
+    # Nested technologies are written inside their prerequisite - the second pass
+    # only catches ones whose prerequisites lead to each other in a loop
+    for name in [x for x in names_global if x not in nested_names] + names_global:
+        if name not in emitted:
+            output_lines.extend(tech_lines(name, children, emitted))
+
+    if not args.add:
+        output_lines.append("\t}")
+        output_lines.append("}")
+
+    if args.add:
         correct_format = False
         after_hidden_effect = False
-        start_index = -1
+        insert_index = len(read_lines) - 1
         for i, line in enumerate(read_lines):
             if "### File last modified:" in line:
                 read_lines[i] = "### File last modified: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -170,19 +244,18 @@ if args.add:
                 after_hidden_effect = True    
                 continue
             if after_hidden_effect:
-                start_index = i+1
+                insert_index = i
                 break
-        for j, line in enumerate(output_lines):
-            read_lines.insert(i+j, str(line))
-        output_lines = read_lines 
-print("Backuping " + args.output + "...")  
-try:
-    os.remove(args.output + '.bak')
-    os.rename(args.output, args.output + '.bak')
-except OSError as os.errno.ENOENT:
-    pass
-print("Writing to " + args.output + "...")      
-with open(args.output,"w+") as f:
-    f.writelines(str(line) + "\n" for line in output_lines)
-print("Written to " + args.output + " successfully!")         
-print("Added " + str(len(names_global)) + " technologies.")
+        # New technologies go right after hidden_effect = {, merged in one pass
+        output_lines = read_lines[:insert_index] + output_lines + read_lines[insert_index:]
+    print("Backuping " + args.output + "...")  
+    try:
+        os.remove(args.output + '.bak')
+        os.rename(args.output, args.output + '.bak')
+    except OSError as os.errno.ENOENT:
+        pass
+    print("Writing to " + args.output + "...")      
+    with open(args.output,"w+") as f:
+        f.writelines(str(line) + "\n" for line in output_lines)
+    print("Written to " + args.output + " successfully!")         
+    print("Added " + str(len(names_global)) + " technologies.")
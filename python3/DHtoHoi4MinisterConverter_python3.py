@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 import argparse
 import sys
+import os
 import re
 import codecs
 import string
 import collections
+import functools
+import multiprocessing
 try:
     from unidecode import unidecode
 except:
@@ -22,7 +25,8 @@ except:
 ### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
-### usage: DHtoHoi4MinisterConverter_python3.py [-h] [-l LOCALISATION]
+### usage: DHtoHoi4MinisterConverter_python3.py [-h] [-l LOCALISATION] [-b]
+###                                            [-j JOBS]
 ###                                            input output
 ###
 ### Given a HoI Darkest Hour .csv Minister file, create a HoI 4 ideas file with a
@@ -31,21 +35,41 @@ except:
 ### also be created.
 ### 
 ### positional arguments:
-###   input                 Darkest Hour .csv minister file
-###   output                Name of HoI4 ideas file to write (overwrites)
+###   input                 Darkest Hour .csv minister file (with -b, a folder of
+###                         them)
+###   output                Name of HoI4 ideas file to write (overwrites). With -b,
+###                         the folder to write the ideas files to
 ### 
 ### optional arguments:
 ###   -h, --help            show this help message and exit
 ###   -l LOCALISATION, --localisation LOCALISATION
-###                         Localisation file to write (overwrites)
+###                         Localisation file to write (overwrites). With -b, the
+###                         ministers of every country are written to this file
+###   -b, --batch           Convert every .csv file in the input folder (eg. a
+###                         whole Darkest Hour database) in parallel. Each ideas
+###                         file is named like its .csv file (Default: False)
+###   -j JOBS, --jobs JOBS  Number of worker processes for -b (Default: CPU count)
 ###
 #############################
-if not sys.version_info >= (3,0):
-    sys.exit("Wrong Python version. Version 3.0 or higher is required to run this script!")
 blocked_positions = ["Head of State"]
 positions = collections.OrderedDict([("Head_of_Government", "HoG"), ("Foreign_Minister", "FM"), ("Minister_of_Security", "MoS"), ("Armaments_Minister", "AM"), ("Head_of_Intelligence", "HoI"), ("Chief_of_Staff", "CoStaff"), ("Chief_of_Army", "CoArmy"), ("Chief_of_Navy", "CoNavy"), ("Chief_of_Airforce", "CoAir")])
 ideologies = ["NS", "FA", "PA", "SC", "ML", "SL", "SD", "LWR", "LE", "ST"]
 position_translation = dict([("Minister of Armament", "Armaments Minister"), ("Head of Military Intelligence", "Head of Intelligence"), ("Chief of Air Force", "Chief of Airforce")])
+position_ranks = {position: idx for idx, position in enumerate(positions)}
+ideology_ranks = {ideology: idx for idx, ideology in enumerate(ideologies)}
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+@functools.lru_cache(maxsize=None)
+def parse_name(name):
+    # The same ministers serve in many countries and positions, so each name is only transliterated once
+    return re.sub(" ", "_", re.sub('[^A-Za-z0-9 ]+', '', unidecode(name)))
 
 class minister:    
     def __init__(self, position, name, start_year, end_year, ideology, trait, country_tag):
@@ -57,7 +81,7 @@ class minister:
         self.end_year = end_year
         self.ideology = ideology
         self.trait = string.capwords(trait)
-        self.parsed_name = re.sub(" ", "_", re.sub('[^A-Za-z0-9 ]+', '', unidecode(self.name)))
+        self.parsed_name = parse_name(self.name)
         self.idea_tag = "%s_%s_%s" % (country_tag, positions[self.position], self.parsed_name)
     
     def __repr__(self):
@@ -97,53 +121,114 @@ def readDHfile(name):
             continue 
         if split_line[1] not in blocked_positions:
             ministers.append(minister(split_line[1], split_line[2], split_line[3], split_line[4], split_line[6], split_line[7], tag))
-    return (sorted(ministers, key=lambda minister: (list(positions.keys()).index(minister.position), ideologies.index(minister.ideology), minister.start_year)), tag) 
+    return (sorted(ministers, key=lambda minister: (position_ranks[minister.position], ideology_ranks[minister.ideology], minister.start_year)), tag) 
 
-def createHOI4ideasfile(name, ministers, country_tag):
-    lines = list()
-    lines.append("ideas = {")
+def HOI4ideaslines(ministers, country_tag):
+    yield "ideas = {"
     current_position = ""
     append_brace = False
     for minister in ministers:      
         if current_position != minister.position:
             if append_brace:
-                lines.append("}")
-            lines.append("#################################################")
-            lines.append("### %s" % (re.sub("_", " ", minister.position)))
-            lines.append("#################################################")
-            lines.append("\t%s = {" % minister.position)
+                yield "}"
+            yield "#################################################"
+            yield "### %s" % (re.sub("_", " ", minister.position))
+            yield "#################################################"
+            yield "\t%s = {" % minister.position
             append_brace = True
         current_position = minister.position
-        lines.extend(minister.convert(country_tag).splitlines()) 
+        yield from minister.convert(country_tag).splitlines()
         append_brace = True   
-    lines.append("\t}")
-    lines.append("}")
+    yield "\t}"
+    yield "}"
+
+def HOI4localisationlines(ministers):
+    for minister in ministers:
+        yield " %s:0 \"%s\"" % (minister.idea_tag, minister.name)
+
+def createHOI4ideasfile(name, ministers, country_tag):
     with codecs.open(name, encoding='utf-8-sig', mode="w") as f:
-        f.writelines(line + "\n" for line in lines)
+        f.writelines(line + "\n" for line in HOI4ideaslines(ministers, country_tag))
 
 def createHOI4localisationfile(name, ministers):
-    lines = ["l_english:"]
-    for minister in ministers:
-        lines.append(" %s:0 \"%s\"" % (minister.idea_tag, minister.name))
     with codecs.open(name, encoding='utf-8-sig', mode="w") as f:
-        f.writelines(line + "\n" for line in lines)
+        f.write("l_english:\n")
+        f.writelines(line + "\n" for line in HOI4localisationlines(ministers))
+
+def convert_job(job):
+    # Returns (input, ministers, localisation lines, error)
+    name, output = job
+    try:
+        ministers, country_tag = readDHfile(name)
+        createHOI4ideasfile(output, ministers, country_tag)
+        return (name, len(ministers), list(HOI4localisationlines(ministers)), None)
+    except Exception as e:
+        return (name, 0, [], "%s: %s" % (type(e).__name__, e))
+
+def convert_folder(input, output, localisation="", jobs=None):
+    names = sorted(x for x in os.listdir(input) if x.lower().endswith(".csv"))
+    os.makedirs(output, exist_ok=True)
+    job_list = [(os.path.join(input, x), os.path.join(output, os.path.splitext(x)[0] + ".txt")) for x in names]
+    errors = list()
+    total = 0
+    loc_file = codecs.open(localisation, encoding='utf-8-sig', mode="w") if localisation else None
+    try:
+        if loc_file:
+            loc_file.write("l_english:\n")
+        with multiprocessing.Pool(jobs) as pool:
+            # imap keeps the input order, so the localisation file is written as results come in
+            for name, count, loc_lines, error in pool.imap(convert_job, job_list):
+                if error:
+                    errors.append((name, error))
+                    continue
+                total += count
+                if loc_file:
+                    loc_file.writelines(line + "\n" for line in loc_lines)
+    finally:
+        if loc_file:
+            loc_file.close()
+    return (len(job_list), total, errors)
 ###################################################################
 
-parser = argparse.ArgumentParser(description='Given a HoI Darkest Hour .csv Minister file, create a HoI 4 ideas file with a given name with those ministers converted. Default format is for Darkest Hour mod by Algierian General. A localisation file with the names of ministers can also be created.')
-parser.add_argument('input',
-                    help='Darkest Hour .csv minister file')
-parser.add_argument( 'output',
-                    help='Name of HoI4 ideas file to write (overwrites)')
-parser.add_argument('-l', '--localisation', required=False, default="",
-                    help='Localisation file to write (overwrites - make sure the file name has "l_english" in it!)')
+def main():
+    parser = argparse.ArgumentParser(description='Given a HoI Darkest Hour .csv Minister file, create a HoI 4 ideas file with a given name with those ministers converted. Default format is for Darkest Hour mod by Algierian General. A localisation file with the names of ministers can also be created.')
+    parser.add_argument('input',
+                        help='Darkest Hour .csv minister file (with -b, a folder of them)')
+    parser.add_argument( 'output',
+                        help='Name of HoI4 ideas file to write (overwrites). With -b, the folder to write the ideas files to')
+    parser.add_argument('-l', '--localisation', required=False, default="",
+                        help='Localisation file to write (overwrites - make sure the file name has "l_english" in it!). With -b, the ministers of every country are written to this file')
+    parser.add_argument('-b', '--batch', action='store_true', required=False, default=False,
+                        help='Convert every .csv file in the input folder (eg. a whole Darkest Hour database) in parallel. Each ideas file is named like its .csv file (Default: False)')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes for -b (Default: CPU count)')
+
+    args = parser.parse_args()
+    if args.batch:
+        try:
+            readable_dir(args.input)
+        except:
+            sys.exit("%s is not a directory or does not exist." % args.input)
+        files, total, errors = convert_folder(args.input, args.output, args.localisation, args.jobs)
+        for name, error in errors:
+            print("File %s could not be converted - %s" % (name, error))
+        print("%s files converted, %s ministers written to %s" % (files - len(errors), total, args.output))
+        if args.localisation:
+            print(("Localisation file %s created successfully" % args.localisation))
+        if errors:
+            sys.exit(1)
+        return
+    parsed_file = readDHfile(args.input)
+    country_tag = parsed_file[1]
+    ministers = parsed_file[0]
+    print(("File %s read successfully, %s ministers found" % (args.input, len(ministers))))
+    createHOI4ideasfile(args.output, ministers, country_tag)
+    print(("Ideas file %s created successfully" % args.output))
+    if args.localisation:
+        createHOI4localisationfile(args.localisation, ministers)
+        print(("Localisation file %s created successfully" % args.localisation))
 
-args = parser.parse_args()
-parsed_file = readDHfile(args.input)
-country_tag = parsed_file[1]
-ministers = parsed_file[0]
-print(("File %s read successfully, %s ministers found" % (args.input, len(ministers))))
-createHOI4ideasfile(args.output, ministers, country_tag)
-print(("Ideas file %s created successfully" % args.output))
-if args.localisation:
-    createHOI4localisationfile(args.localisation, ministers)
-    print(("Localisation file %s created successfully" % args.localisation))
+if __name__ == "__main__":
+    if not sys.version_info >= (3,3):
+        sys.exit("Wrong Python version. Version 3.3 or higher is required to run this script!")
+    main()
@@ -4,6 +4,10 @@ import sys
 import re
 import codecs
 import collections
+import csv
+import glob
+import multiprocessing
+import os
 import string
 from itertools import islice
 from operator import itemgetter
@@ -21,18 +25,23 @@ from enum import Enum
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
 ### usage: USAElectionGenerator.py [-h] [-r REGION_NAMES] [-s]
-###                                [-loc SUMMARY_EVENT_LOCALIZATION]
-###                                input namespace starting_event_id_index output
+###                                [-loc SUMMARY_EVENT_LOCALIZATION] [-se] [-v]
+###                                [-mc MONTE_CARLO] [--seed SEED] [-b]
+###                                [-j JOBS]
+###                                input [namespace] [starting_event_id_index]
+###                                [output]
 ### 
 ### Given a properly formatted .csv file, create HoI 4 events simulating counting
 ### of votes USA elections (first past the post). Originally written for
 ### Fuhrerreich mod.
 ### 
 ### positional arguments:
-###   input                 Fuhrerreich .csv USA elections file
+###   input                 Fuhrerreich .csv USA elections file (with -b, a folder
+###                         of them)
 ###   namespace             Event ID namespace (Example: "usa.election.1936")
 ###   starting_event_id_index
-###                         A free event ID index (Example: "2")
+###                         A free event ID index (Example: "2"). Optional with
+###                         -b
 ###   output                Name of HoI4 event file to write to (appends)
 ### 
 ### optional arguments:
@@ -47,8 +56,47 @@ from enum import Enum
 ###                         Name of the localization file to write summary
 ###                         localization to (overwrites) (Default:
 ###                         OUTPUT_l_english.yml)
+###   -se, --scripted_effects
+###                         Move per state vote outcomes, state ownership and
+###                         campaign checks to scripted effects and triggers
+###                         shared by all candidate pairs, written to
+###                         OUTPUT_scripted_effects.txt and
+###                         OUTPUT_scripted_triggers.txt (overwrites) (Default:
+###                         False)
+###   -v, --variables       Count electoral votes in variables instead of country
+###                         flag values, so the summary events determine the
+###                         winner in one event instead of chained vote
+###                         subtracting events (Default: False)
+###   -mc MONTE_CARLO, --monte_carlo MONTE_CARLO
+###                         Instead of creating events, simulate this many
+###                         elections for every candidate pair and campaign
+###                         combination and print win, draw and electoral vote
+###                         statistics. Winners are determined like in the
+###                         summary events (with -v, like with variables).
+###                         Requires numpy. namespace, starting_event_id_index
+###                         and output are not needed (Default: 0)
+###   --seed SEED           Random seed for -mc (Default: random)
+###   -b, --batch           Generate one election for every .csv file in the input
+###                         folder (eg. one per election year), in parallel and in
+###                         name order. Event IDs are allocated one after another,
+###                         starting with starting_event_id_index or after the
+###                         highest ID of the namespace already in the output
+###                         file. Instead of appending, the events replace the
+###                         section of the output file managed by this script, so
+###                         runs can be repeated (Default: False)
+###   -j JOBS, --jobs JOBS  Number of worker processes for -b (Default: CPU count)
 ###
 #############################
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+#############################
 class electoral_vote:
     def __init__(self, state, chance_1, chance_2):
         self.state = state.strip()
@@ -75,423 +123,772 @@ class party(Enum):
 US_states = dict()
 candidates = set()
 flags_to_clear = set()
+variables_to_clear = set()
+region_names_dict = dict()
+
+# Electoral votes subtracted from each party, in order, when determining the winner
+VOTE_STEPS = (100, 80, 60, 40, 20, 10, 8, 6, 4, 2, 1)
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Batch mode rewrites everything between these lines in the output file
+MANAGED_SECTION_BEGIN = "### BEGIN USA Election Generator managed section - everything up to the END line is overwritten"
+MANAGED_SECTION_END = "### END USA Election Generator managed section"
+
+# Columns of the .csv file, in order. State, ID and electoral votes are only given in
+# the first row of a state and candidates only when they change - empty cells repeat
+# the last value. A row with "Sum:" in the first column ends a region.
+CSV_COLUMNS = (
+    "State",
+    "ID",
+    "Electoral votes",
+    "Candidate 1",
+    "Candidate 2",
+    "Candidate 1 campaigning poor",
+    "Candidate 2 campaigning poor",
+    "Candidate 1 campaigning middle",
+    "Candidate 2 campaigning middle",
+    "Candidate 1 campaigning rich",
+    "Candidate 2 campaigning rich",
+    "Chances candidate 1",
+    "Chances candidate 2",
+)
+CSV_STATE, CSV_IDS, CSV_VOTES, CSV_CANDIDATE_1, CSV_CANDIDATE_2 = range(5)
+CSV_CHANCES_1, CSV_CHANCES_2 = 11, 12
+# (column, campaign) for candidate 1 and candidate 2
+CSV_CAMPAIGNS = (
+    ((5, campaign_type.poor), (7, campaign_type.middle), (9, campaign_type.rich)),
+    ((6, campaign_type.poor), (8, campaign_type.middle), (10, campaign_type.rich)),
+)
+
+class CSVError(Exception):
+    pass
 
-def bool_campaign(line, indexes):
-    for idx in indexes:
-        if "Yes" in line[idx]:
-            return idx % indexes[0]
-    return -1
+def read_campaign(row, columns):
+    campaign = campaign_type.none
+    for idx, value in columns:
+        cell = row[idx].strip().lower()
+        if cell == "yes":
+            if campaign != campaign_type.none:
+                raise CSVError("more than one campaign for the same candidate")
+            campaign = value
+        elif cell not in ("no", ""):
+            raise CSVError("column \"%s\" has to be Yes, No or empty, not \"%s\"" % (CSV_COLUMNS[idx], row[idx]))
+    return campaign.value
+
+def read_int(row, idx):
+    try:
+        return int(row[idx])
+    except ValueError:
+        raise CSVError("column \"%s\" has to be a number, not \"%s\"" % (CSV_COLUMNS[idx], row[idx]))
+
+def sort_campaigns(campaigns):
+    return list(sorted(campaigns.items(), key=lambda x: (x[0][0], x[0][1], -x[0][2], -x[0][3])))
 
 def read_CSV_file(name):
+    # Rows are read one by one and validated - all errors are reported with their
+    # line numbers in a single CSVError
     print("Reading file %s\n" % name)
-    with open(name, "r") as f:
-        lines = f.read().splitlines()
     regions = list()
     campaigns = dict()
+    errors = list()
     last_state = ""
     last_candidate_1 = ""
     last_candidate_2 = ""
-    for line in islice(lines, 1, None):
-        split_line = line.split(",")
-
-        if "Sum:" in split_line[0]:
-            regions.append(list(sorted(campaigns.items(), key=lambda x: (x[0][0], x[0][1], -x[0][2], -x[0][3]))))
-            #print(len(regions))
-            #for key, value in regions[len(regions)-1].items():
-            #    print("%s %s" %(key, value))
-            campaigns = dict()
-            continue
+    with open(name, "r", newline="") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if reader.line_num == 1:
+                if len(row) < len(CSV_COLUMNS):
+                    raise CSVError("%s:1: expected %s columns (%s), found %s" % (name, len(CSV_COLUMNS), ", ".join(CSV_COLUMNS), len(row)))
+                continue
+            try:
+                if len(row) < len(CSV_COLUMNS):
+                    if not any(x.strip() for x in row):
+                        continue
+                    raise CSVError("expected %s columns, found %s" % (len(CSV_COLUMNS), len(row)))
+                if "Sum:" in row[CSV_STATE]:
+                    if campaigns:
+                        regions.append(sort_campaigns(campaigns))
+                    campaigns = dict()
+                    continue
+                # Totals and other rows without chances are skipped
+                if not row[CSV_CHANCES_1].strip() and not row[CSV_CHANCES_2].strip():
+                    continue
+
+                if row[CSV_STATE].strip():
+                    state_ids = [x.strip() for x in row[CSV_IDS].split(";") if x.strip()]
+                    if not state_ids or not all(x.isdigit() for x in state_ids):
+                        raise CSVError("column \"%s\" has to be state IDs separated by \";\", not \"%s\"" % (CSV_COLUMNS[CSV_IDS], row[CSV_IDS]))
+                    last_state = row[CSV_STATE].strip()
+                    votes = read_int(row, CSV_VOTES)
+                    if votes < 0:
+                        raise CSVError("column \"%s\" cannot be negative" % CSV_COLUMNS[CSV_VOTES])
+                    US_states[last_state] = (votes, state_ids)
+                elif not last_state:
+                    raise CSVError("no state given before this row")
+                if row[CSV_CANDIDATE_1].strip():
+                    last_candidate_1 = row[CSV_CANDIDATE_1].strip().lower().replace(" ", "_")
+                    candidates.add((last_candidate_1, party.republican, row[CSV_CANDIDATE_1].strip()))
+                if row[CSV_CANDIDATE_2].strip():
+                    last_candidate_2 = row[CSV_CANDIDATE_2].strip().lower().replace(" ", "_")
+                    candidates.add((last_candidate_2, party.democrat, row[CSV_CANDIDATE_2].strip()))
+                if not last_candidate_1 or not last_candidate_2:
+                    raise CSVError("no candidates given before this row")
+                chance_1 = read_int(row, CSV_CHANCES_1)
+                chance_2 = read_int(row, CSV_CHANCES_2)
+                if chance_1 < 0 or chance_2 < 0:
+                    print("WARNING: %s:%s: negative chance, the outcome will never happen in game" % (name, reader.line_num))
+                if chance_1 + chance_2 <= 0:
+                    raise CSVError("the sum of chances has to be positive")
+
+                key = (last_candidate_1, last_candidate_2, read_campaign(row, CSV_CAMPAIGNS[0]), read_campaign(row, CSV_CAMPAIGNS[1]))
+                if key in campaigns:
+                    campaigns[key].append(electoral_vote(last_state, chance_1, chance_2))
+                else:
+                    campaigns[key] = [electoral_vote(last_state, chance_1, chance_2)]
+            except CSVError as e:
+                errors.append("%s:%s: %s" % (name, reader.line_num, e))
+    # The last region does not need a "Sum:" row
+    if campaigns:
+        regions.append(sort_campaigns(campaigns))
+    if errors:
+        raise CSVError("File %s is not a valid USA elections file:\n%s" % (name, "\n".join(errors)))
+    if not regions:
+        raise CSVError("File %s has no regions!" % name)
 
-        if not split_line[6]:
-            break    
-        
-        if split_line[0]:
-            last_state = split_line[0].strip()
-            US_states[last_state] = (int(split_line[2]), [x.strip() for x in split_line[1].split(";")])
-        if split_line[3] and split_line[3] is not last_candidate_1:
-            last_candidate_1 = split_line[3].lower().replace(" ", "_")
-            candidates.add((last_candidate_1, party.republican, split_line[3]))
-        if split_line[4] and split_line[4] is not last_candidate_2:
-            last_candidate_2 = split_line[4].lower().replace(" ", "_")
-            candidates.add((last_candidate_2, party.democrat, split_line[4]))
-        if (last_candidate_1,last_candidate_2,bool_campaign(split_line, [5,7,9]),bool_campaign(split_line, [6,8,10])) in campaigns:
-            campaigns[(last_candidate_1,last_candidate_2,bool_campaign(split_line, [5,7,9]),bool_campaign(split_line, [6,8,10]))].append(electoral_vote(last_state, int(split_line[11]), int(split_line[12])))
-        else:
-            campaigns[(last_candidate_1,last_candidate_2,bool_campaign(split_line, [5,7,9]),bool_campaign(split_line, [6,8,10]))] = [electoral_vote(last_state, int(split_line[11]), int(split_line[12]))]
-    
     for idx, region in enumerate(regions):
         region_name = idx+1
         if idx in region_names_dict:
             region_name = region_names_dict[idx]
         print("Region %s: States: %s" % (region_name, region[1][1]))
 
-    return regions   
+    return regions
+
 
+def add_votes(part, votes, variables=False):
+    # Returns the effect adding electoral votes to the tally of part, kept either
+    # in a variable or as a country flag value
+    if variables:
+        variable = "USA_%s_electoral_votes" % part.name
+        variables_to_clear.add(variable)
+        return "add_to_variable = { %s = %s }" % (variable, votes)
+    flag = "USA_%s_electoral_votes" % part.name
+    flags_to_clear.add(flag)
+    return "modify_country_flag = { flag = %s value = %s }" % (flag, votes)
 
-def create_random_lists(idx, region, candidate_1, candidate_2, event_idx):
+def create_random_lists(idx, region, candidate_1, candidate_2, event_idx, scripted_effects=False, variables=False):
+    # With scripted_effects, campaign checks, state ownership and vote outcomes are
+    # calls to the effects and triggers made by create_scripted_effects/triggers
     region_name = idx+1
     if idx in region_names_dict:
         region_name = region_names_dict[idx]
+    region_key = str(region_name).lower().replace(" ", "_")
     print("Creating list for region %s, candidates %s and %s" % (region_name, candidate_1, candidate_2))
-    lines = list()
     for key, value in region:
         if candidate_1 not in key[0] or candidate_2 not in key[1]:
             continue
-        lines.append("\t\tif = {")
-        lines.append("\t\t\tlimit = {")
+        yield "\t\tif = {"
+        yield "\t\t\tlimit = {"
         if key[2] > -1:
             flag = "USA_%s_%s_%s" % (key[0], region_name.lower().replace(" ", "_"), campaign_type(key[2]).name)
             flags_to_clear.add(flag)
-            lines.append("\t\t\t\thas_country_flag = %s" % flag )
+            yield "\t\t\t\thas_country_flag = %s" % flag
+        elif scripted_effects:
+            yield "\t\t\t\tUSA_%s_%s_no_campaign = yes" % (key[0], region_key)
         else:
-            lines.append("\t\t\t\tNOT = {")
+            yield "\t\t\t\tNOT = {"
             for campaign in campaign_type:
                 if campaign.value < 0:
                     continue
                 flag = "USA_%s_%s_%s" % (key[0], region_name.lower().replace(" ", "_"), campaign.name)
-                lines.append("\t\t\t\t\thas_country_flag = %s" % flag )
-            lines.append("\t\t\t\t}")
+                yield "\t\t\t\t\thas_country_flag = %s" % flag
+            yield "\t\t\t\t}"
         if key[3] > -1:
             flag = "USA_%s_%s_%s" % (key[1], region_name.lower().replace(" ", "_"), campaign_type(key[3]).name)
             flags_to_clear.add(flag)
-            lines.append("\t\t\t\thas_country_flag = %s" % flag )
+            yield "\t\t\t\thas_country_flag = %s" % flag
+        elif scripted_effects:
+            yield "\t\t\t\tUSA_%s_%s_no_campaign = yes" % (key[1], region_key)
         else:
-            lines.append("\t\t\t\tNOT = {")
+            yield "\t\t\t\tNOT = {"
             for campaign in campaign_type:
                 if campaign.value < 0:
                     continue
                 flag = "USA_%s_%s_%s" % (key[1], region_name.lower().replace(" ", "_"), campaign.name)
-                lines.append("\t\t\t\t\thas_country_flag = %s" % flag )
-            lines.append("\t\t\t\t}")
-        lines.append("\t\t\t}")
+                yield "\t\t\t\t\thas_country_flag = %s" % flag
+            yield "\t\t\t\t}"
+        yield "\t\t\t}"
 
         for electoral_votes in value:
-            lines.append("\t\t\tif = {")
-            lines.append("\t\t\t\tlimit = {")
+            if scripted_effects:
+                state_key = str(electoral_votes.state).lower().replace(" ", "_")
+                yield "\t\t\tif = {"
+                yield "\t\t\t\tlimit = { USA_owns_%s = yes }" % state_key
+                yield "\t\t\t\trandom_list = {"
+                yield "\t\t\t\t\t%s = { USA_%s_%s_wins = yes }" % (electoral_votes.chance_1, state_key, party(0).name)
+                yield "\t\t\t\t\t%s = { USA_%s_%s_wins = yes }" % (electoral_votes.chance_2, state_key, party(1).name)
+                yield "\t\t\t\t}"
+                yield "\t\t\t}"
+                continue
+            yield "\t\t\tif = {"
+            yield "\t\t\t\tlimit = {"
             for state_id in US_states[str(electoral_votes.state)][1]:
-                lines.append("\t\t\t\t\t%s = { is_owned_and_controlled_by = ROOT }" % state_id)
-            lines.append("\t\t\t\t}")
-            lines.append("\t\t\t\trandom_list = {")
-            lines.append("\t\t\t\t\t%s = {" % str(electoral_votes.chance_1) )
-            flag = "USA_%s_electoral_votes" % party(0).name
-            flags_to_clear.add(flag)
-            lines.append("\t\t\t\t\t\tmodify_country_flag = { flag = %s value = %s }" % (flag ,US_states[str(electoral_votes.state)][0]) )
+                yield "\t\t\t\t\t%s = { is_owned_and_controlled_by = ROOT }" % state_id
+            yield "\t\t\t\t}"
+            yield "\t\t\t\trandom_list = {"
+            yield "\t\t\t\t\t%s = {" % str(electoral_votes.chance_1)
+            yield "\t\t\t\t\t\t%s" % add_votes(party(0), US_states[str(electoral_votes.state)][0], variables)
             flag = "USA_%s_won_%s" % (candidate_1,str(electoral_votes.state).lower().replace(" ", "_"))
             flags_to_clear.add(flag)
-            lines.append("\t\t\t\t\t\tset_country_flag = %s" % flag)
-            lines.append("\t\t\t\t\t}")
-            lines.append("\t\t\t\t\t%s = {" % str(electoral_votes.chance_2) )
-            flag = "USA_%s_electoral_votes" % party(1).name
-            flags_to_clear.add(flag)
-            lines.append("\t\t\t\t\t\tmodify_country_flag = { flag = %s value = %s }" % (flag, US_states[str(electoral_votes.state)][0]) )
+            yield "\t\t\t\t\t\tset_country_flag = %s" % flag
+            yield "\t\t\t\t\t}"
+            yield "\t\t\t\t\t%s = {" % str(electoral_votes.chance_2)
+            yield "\t\t\t\t\t\t%s" % add_votes(party(1), US_states[str(electoral_votes.state)][0], variables)
             flag = "USA_%s_won_%s" % (candidate_2, str(electoral_votes.state).lower().replace(" ", "_"))
             flags_to_clear.add(flag)
-            lines.append("\t\t\t\t\t\tset_country_flag = %s" % flag)
-            lines.append("\t\t\t\t\t}")
-            lines.append("\t\t\t\t}")
-            lines.append("\t\t\t}")
-        lines.append("\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (event_idx[0], str(event_idx[1]+idx+1)))
-        lines.append("\t\t\tbreak = yes")
-        lines.append("\t\t}")
-    print("List for region %s created, %d lines" % (region_name, len(lines)))
-    return lines
+            yield "\t\t\t\t\t\tset_country_flag = %s" % flag
+            yield "\t\t\t\t\t}"
+            yield "\t\t\t\t}"
+            yield "\t\t\t}"
+        yield "\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (event_idx[0], str(event_idx[1]+idx+1))
+        yield "\t\t\tbreak = yes"
+        yield "\t\t}"
+    print("List for region %s created" % region_name)
+
+def create_scripted_effects(variables=False):
+    # One effect per state and party, shared by all candidate pairs - adds the
+    # electoral votes and marks the state as won by whichever candidate is running
+    s_candidates = sorted(candidates, key=lambda x: (x[1].value, x[0]))
+    yield "### USA Election Simulator - scripted effects"
+    yield "### Automatically generated by Yard1's USA Election Generator, originally for Fuhrerreich"
+    for state, (votes, state_ids) in US_states.items():
+        state_key = state.lower().replace(" ", "_")
+        for x in party:
+            yield "USA_%s_%s_wins = {" % (state_key, x.name)
+            yield "\t%s" % add_votes(x, votes, variables)
+            for candidate in [i for i in s_candidates if i[1] == x]:
+                flag = "USA_%s_won_%s" % (candidate[0], state_key)
+                flags_to_clear.add(flag)
+                yield "\tif = { limit = { has_country_flag = USA_%s } set_country_flag = %s }" % (candidate[0], flag)
+            yield "}"
+    yield ""
+
+def create_scripted_triggers(region_count):
+    s_candidates = sorted(candidates, key=lambda x: (x[1].value, x[0]))
+    yield "### USA Election Simulator - scripted triggers"
+    yield "### Automatically generated by Yard1's USA Election Generator, originally for Fuhrerreich"
+    for state, (votes, state_ids) in US_states.items():
+        yield "USA_owns_%s = {" % state.lower().replace(" ", "_")
+        for state_id in state_ids:
+            yield "\t%s = { is_owned_and_controlled_by = ROOT }" % state_id
+        yield "}"
+    for idx in range(region_count):
+        region_name = idx+1
+        if idx in region_names_dict:
+            region_name = region_names_dict[idx]
+        region_key = str(region_name).lower().replace(" ", "_")
+        for candidate in s_candidates:
+            yield "USA_%s_%s_no_campaign = {" % (candidate[0], region_key)
+            yield "\tNOT = {"
+            for campaign in campaign_type:
+                if campaign.value < 0:
+                    continue
+                yield "\t\thas_country_flag = USA_%s_%s_%s" % (candidate[0], region_key, campaign.name)
+            yield "\t}"
+            yield "}"
+    yield ""
 
 def create_event_subtracting_votes(id, index, next_index, part):
-    finished_file = list()
-    finished_file.append("country_event = {")
-    finished_file.append("\tid = %s.%s" % (id, index))
-    finished_file.append("\tis_triggered_only = yes")
-    finished_file.append("\thidden = yes")
-    finished_file.append("\toption = {")
-
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 99 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -100 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 79 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -80 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 59 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -60 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 39 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -40 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 19 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -20 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 9 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -10 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 7 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -8 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 5 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -6 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 3 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -4 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 1 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -2 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > 0 } }" % part.name)
-    finished_file.append("\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -1 }" % part.name)
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\tbreak = yes")
-    finished_file.append("\t\t}")
-
-    finished_file.append("\t}")
-    finished_file.append("}")
-    return finished_file
+    yield "country_event = {"
+    yield "\tid = %s.%s" % (id, index)
+    yield "\tis_triggered_only = yes"
+    yield "\thidden = yes"
+    yield "\toption = {"
+
+    for votes in VOTE_STEPS:
+        yield "\t\tif = {"
+        yield "\t\t\tlimit = { has_country_flag = { flag = USA_%s_electoral_votes value > %s } }" % (part.name, votes - 1)
+        yield "\t\t\tmodify_country_flag = { flag = USA_%s_electoral_votes value = -%s }" % (part.name, votes)
+        yield "\t\t\tcountry_event = %s.%s" % (id, next_index)
+        yield "\t\t\tbreak = yes"
+        yield "\t\t}"
+
+    yield "\t}"
+    yield "}"
 
 def create_event_determining_winner(id, index, next_index, end_index):
-    finished_file = list()
-    finished_file.append("country_event = {")
-    finished_file.append("\tid = %s.%s" % (id, index))
-    finished_file.append("\tis_triggered_only = yes")
-    finished_file.append("\thidden = yes")
-    finished_file.append("\toption = {")
+    yield "country_event = {"
+    yield "\tid = %s.%s" % (id, index)
+    yield "\tis_triggered_only = yes"
+    yield "\thidden = yes"
+    yield "\toption = {"
     #hardcoding because i am lazy
-    finished_file.append("\t\tif = {")
-    finished_file.append("\t\t\tlimit = { ")
-    finished_file.append("\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value > 0 }")
-    finished_file.append("\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value > 0 }")
-    finished_file.append("\t\t\t}")
-    finished_file.append("\t\t\tcountry_event = %s.%s" % (id, next_index))
-    finished_file.append("\t\t\telse = {")
-    finished_file.append("\t\t\t\tif = {")
-    finished_file.append("\t\t\t\t\tlimit = { ")
-    finished_file.append("\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value > 0 }")
-    finished_file.append("\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value < 1 }")
-    finished_file.append("\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\tset_country_flag = USA_republican_won")
-    finished_file.append("\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index))
-    finished_file.append("\t\t\t\t\telse = {")
-    finished_file.append("\t\t\t\t\t\tif = {")
-    finished_file.append("\t\t\t\t\t\t\tlimit = { ")
-    finished_file.append("\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value < 1 }")
-    finished_file.append("\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value > 0 }")
-    finished_file.append("\t\t\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\t\t\tset_country_flag = USA_democrat_won")
-    finished_file.append("\t\t\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index))
-    finished_file.append("\t\t\t\t\t\t\telse = {")
-    finished_file.append("\t\t\t\t\t\t\t\tif = {")
-    finished_file.append("\t\t\t\t\t\t\t\t\tlimit = { ")
-    finished_file.append("\t\t\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value < 1 }")
-    finished_file.append("\t\t\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value < 1 }")
-    finished_file.append("\t\t\t\t\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\t\t\t\t\tset_country_flag = USA_draw")
-    finished_file.append("\t\t\t\t\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index))
-    finished_file.append("\t\t\t\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t\t}")
-    finished_file.append("\t\t\t\t}")
-    finished_file.append("\t\t\t}")
-    finished_file.append("\t\t}")
-    finished_file.append("\t}")
-    finished_file.append("}")
-    return finished_file
-
-def create_events_file(input, id, index):
-    finished_file = list()
+    yield "\t\tif = {"
+    yield "\t\t\tlimit = { "
+    yield "\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value > 0 }"
+    yield "\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value > 0 }"
+    yield "\t\t\t}"
+    yield "\t\t\tcountry_event = %s.%s" % (id, next_index)
+    yield "\t\t\telse = {"
+    yield "\t\t\t\tif = {"
+    yield "\t\t\t\t\tlimit = { "
+    yield "\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value > 0 }"
+    yield "\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value < 1 }"
+    yield "\t\t\t\t\t}"
+    yield "\t\t\t\t\tset_country_flag = USA_republican_won"
+    yield "\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index)
+    yield "\t\t\t\t\telse = {"
+    yield "\t\t\t\t\t\tif = {"
+    yield "\t\t\t\t\t\t\tlimit = { "
+    yield "\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value < 1 }"
+    yield "\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value > 0 }"
+    yield "\t\t\t\t\t\t\t}"
+    yield "\t\t\t\t\t\t\tset_country_flag = USA_democrat_won"
+    yield "\t\t\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index)
+    yield "\t\t\t\t\t\t\telse = {"
+    yield "\t\t\t\t\t\t\t\tif = {"
+    yield "\t\t\t\t\t\t\t\t\tlimit = { "
+    yield "\t\t\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_republican_electoral_votes value < 1 }"
+    yield "\t\t\t\t\t\t\t\t\t\thas_country_flag = { flag = USA_democrat_electoral_votes value < 1 }"
+    yield "\t\t\t\t\t\t\t\t\t}"
+    yield "\t\t\t\t\t\t\t\t\tset_country_flag = USA_draw"
+    yield "\t\t\t\t\t\t\t\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index)
+    yield "\t\t\t\t\t\t\t\t}"
+    yield "\t\t\t\t\t\t\t}"
+    yield "\t\t\t\t\t\t}"
+    yield "\t\t\t\t\t}"
+    yield "\t\t\t\t}"
+    yield "\t\t\t}"
+    yield "\t\t}"
+    yield "\t}"
+    yield "}"
+
+def create_event_tallying_votes(id, index, end_index):
+    # Variable tallies can be compared directly, so the winner is decided at once
+    yield "country_event = {"
+    yield "\tid = %s.%s" % (id, index)
+    yield "\tis_triggered_only = yes"
+    yield "\thidden = yes"
+    yield "\toption = {"
+    yield "\t\tif = {"
+    yield "\t\t\tlimit = { check_variable = { USA_republican_electoral_votes > USA_democrat_electoral_votes } }"
+    yield "\t\t\tset_country_flag = USA_republican_won"
+    yield "\t\t}"
+    yield "\t\telse_if = {"
+    yield "\t\t\tlimit = { check_variable = { USA_democrat_electoral_votes > USA_republican_electoral_votes } }"
+    yield "\t\t\tset_country_flag = USA_democrat_won"
+    yield "\t\t}"
+    yield "\t\telse = {"
+    yield "\t\t\tset_country_flag = USA_draw"
+    yield "\t\t}"
+    yield "\t\tcountry_event = { id = %s.%s hours = 1 }" % (id, end_index)
+    yield "\t}"
+    yield "}"
+
+def create_events_file(input, id, index, scripted_effects=False, variables=False):
     new_index = index - 1
     s_candidates = sorted(candidates, key=lambda x: (x[1].value, x[0]))
     first_democrat_index = s_candidates.index(next((x for x in s_candidates if x[1] == party.democrat)))
     
-    finished_file.append("")
-    finished_file.append("### USA Election Simulator")
-    finished_file.append("### Automatically generated by Yard1's USA Election Generator, originally for Fuhrerreich")
+    yield ""
+    yield "### USA Election Simulator"
+    yield "### Automatically generated by Yard1's USA Election Generator, originally for Fuhrerreich"
     
     for region in input:
         new_index = new_index + 1
         if (new_index-index) in region_names_dict:
-            finished_file.append("### REGION %s" % region_names_dict[new_index-index])
+            yield "### REGION %s" % region_names_dict[new_index-index]
         else:
-            finished_file.append("### REGION %s" % str(new_index-index+1))
-        finished_file.append("### STATES: %s" % region[1][1])
-        finished_file.append("country_event = {")
-        finished_file.append("\tid = %s.%s" % (id, new_index))
-        finished_file.append("\tis_triggered_only = yes")
-        finished_file.append("\tfire_only_once = yes")
-        finished_file.append("\thidden = yes")
+            yield "### REGION %s" % str(new_index-index+1)
+        yield "### STATES: %s" % region[1][1]
+        yield "country_event = {"
+        yield "\tid = %s.%s" % (id, new_index)
+        yield "\tis_triggered_only = yes"
+        yield "\tfire_only_once = yes"
+        yield "\thidden = yes"
         if new_index == index:
-            finished_file.append("\timmediate = {")
+            yield "\timmediate = {"
             for x in party:
-                finished_file.append("\t\tset_country_flag = { flag = USA_%s_electoral_votes value = 0 }" % x.name)
-            finished_file.append("\t}")
+                if variables:
+                    yield "\t\tset_variable = { USA_%s_electoral_votes = 0 }" % x.name
+                else:
+                    yield "\t\tset_country_flag = { flag = USA_%s_electoral_votes value = 0 }" % x.name
+            yield "\t}"
 
         for rep_candidate in islice(s_candidates, 0, first_democrat_index):
             for dem_candidate in islice(s_candidates, first_democrat_index, None):
-                finished_file.append("\toption = {")
-                finished_file.append("\t\ttrigger = {")
-                finished_file.append("\t\t\thas_country_flag = USA_%s" % rep_candidate[0])
-                finished_file.append("\t\t\thas_country_flag = USA_%s" % dem_candidate[0])
-                finished_file.append("\t\t}")
-                finished_file += create_random_lists(new_index-index, region, rep_candidate[0], dem_candidate[0], (id,index))
-                finished_file.append("\t}")
-
-        finished_file.append("}")
-    finished_file.append("")
-    return (finished_file, new_index+1)
-
-def create_summary_event(id, index):
+                yield "\toption = {"
+                yield "\t\ttrigger = {"
+                yield "\t\t\thas_country_flag = USA_%s" % rep_candidate[0]
+                yield "\t\t\thas_country_flag = USA_%s" % dem_candidate[0]
+                yield "\t\t}"
+                yield from create_random_lists(new_index-index, region, rep_candidate[0], dem_candidate[0], (id,index), scripted_effects, variables)
+                yield "\t}"
+
+        yield "}"
+    yield ""
+
+def create_summary_event(id, index, tooltips_to_be_localized):
+    # Fills tooltips_to_be_localized as the event is generated
     s_candidates = sorted(candidates, key=lambda x: (x[1].value, x[0]))
     first_democrat_index = s_candidates.index(next((x for x in s_candidates if x[1] == party.democrat)))
     sorted_states_list = sorted(US_states.items(), key=lambda x: (x[1],x[0][0]), reverse=True)
-    finished_file = list()
-    tooltips_to_be_localized = collections.OrderedDict()
     event_id = ("%s.%s" % (id, index))
-    finished_file.append("\n### SUMMARY EVENT")
+    yield "\n### SUMMARY EVENT"
     tooltips_to_be_localized["%s.colonnewline" % event_id] = r":\n"
     tooltips_to_be_localized["%s.newline" % event_id] = r" \n"
-    finished_file.append("country_event = {")
-    finished_file.append("\tid = %s" % event_id)
+    yield "country_event = {"
+    yield "\tid = %s" % event_id
     tooltip = "%s.t" % event_id
     tooltips_to_be_localized[tooltip] = r"TODO"
-    finished_file.append("\ttitle = %s" % tooltip)
-    finished_file.append("\tdesc = \"\"")
-    finished_file.append("\tpicture = CHANGEME #TODO")
-    finished_file.append("\tis_triggered_only = yes")
+    yield "\ttitle = %s" % tooltip
+    yield "\tdesc = \"\""
+    yield "\tpicture = CHANGEME #TODO"
+    yield "\tis_triggered_only = yes"
     tooltip = "%s.d" % event_id
     tooltips_to_be_localized[tooltip] = r"TODO"
-    finished_file.append("\tdesc = %s" % tooltip)
-    finished_file.append("\timmediate = { ")
+    yield "\tdesc = %s" % tooltip
+    yield "\timmediate = { "
     flags_to_clear.add("USA_draw")
     for x in party:
         flags_to_clear.add("USA_%s_won" % x.name)
-        finished_file.append("\t\tif = { \n\t\t\tlimit = { has_country_flag = USA_%s_won }" % x.name)
+        yield "\t\tif = { \n\t\t\tlimit = { has_country_flag = USA_%s_won }" % x.name
         for candidate in [i for i in s_candidates if i[1] == x]:
             flags_to_clear.add("USA_%s" % candidate[0])
             tooltip = "%s.%s" % (event_id, candidate[0])
             tooltips_to_be_localized[tooltip] = r"%s (%s)" % (candidate[2], candidate[1].name[0].upper())
-            finished_file.append("\t\t\tif = { limit = { has_country_flag = USA_%s } custom_effect_tooltip = %s }" % (candidate[0], tooltip))
-        finished_file.append("\t\t}")
+            yield "\t\t\tif = { limit = { has_country_flag = USA_%s } custom_effect_tooltip = %s }" % (candidate[0], tooltip)
+        yield "\t\t}"
     tooltip = "%s.won" % event_id
     tooltips_to_be_localized[tooltip] = r" won the elections!\n\nDetailed per state results:\n"
-    finished_file.append("\t\tcustom_effect_tooltip = %s" % tooltip)
+    yield "\t\tcustom_effect_tooltip = %s" % tooltip
     for rep_candidate in islice(s_candidates, 0, first_democrat_index):
-        finished_file.append("\t\tif = {")
-        finished_file.append("\t\t\tlimit = { has_country_flag = USA_%s }" % rep_candidate[0])
+        yield "\t\tif = {"
+        yield "\t\t\tlimit = { has_country_flag = USA_%s }" % rep_candidate[0]
         tooltip = "%s.%s" % (event_id, rep_candidate[0])
-        finished_file.append("\t\t\tcustom_effect_tooltip = %s" % tooltip)
-        finished_file.append("\t\t\tcustom_effect_tooltip = %s.colonnewline" % event_id)
+        yield "\t\t\tcustom_effect_tooltip = %s" % tooltip
+        yield "\t\t\tcustom_effect_tooltip = %s.colonnewline" % event_id
         for state in sorted_states_list:
             tooltip = "%s.%s" % (event_id, state[0].lower().replace(" ", "_"))
             tooltips_to_be_localized[tooltip] = r"%s (%s)" % (state[0], US_states[state[0]][0])
-            finished_file.append("\t\t\tif = { limit = { has_country_flag = USA_%s_won_%s } custom_effect_tooltip = %s }" % (rep_candidate[0], state[0].lower().replace(" ", "_"), tooltip ))
-        finished_file.append("\t\t}")
-    finished_file.append("\t\tcustom_effect_tooltip = %s.newline" % event_id)
+            yield "\t\t\tif = { limit = { has_country_flag = USA_%s_won_%s } custom_effect_tooltip = %s }" % (rep_candidate[0], state[0].lower().replace(" ", "_"), tooltip )
+        yield "\t\t}"
+    yield "\t\tcustom_effect_tooltip = %s.newline" % event_id
     for dem_candidate in islice(s_candidates, first_democrat_index, None):
-        finished_file.append("\t\tif = {")
-        finished_file.append("\t\t\tlimit = { has_country_flag = USA_%s }" % dem_candidate[0])
+        yield "\t\tif = {"
+        yield "\t\t\tlimit = { has_country_flag = USA_%s }" % dem_candidate[0]
         tooltip = "%s.%s" % (event_id, dem_candidate[0])
-        finished_file.append("\t\t\tcustom_effect_tooltip = %s" % tooltip)
-        finished_file.append("\t\t\tcustom_effect_tooltip = %s.colonnewline" % event_id)
+        yield "\t\t\tcustom_effect_tooltip = %s" % tooltip
+        yield "\t\t\tcustom_effect_tooltip = %s.colonnewline" % event_id
         for state in sorted_states_list:
             tooltip = "%s.%s" % (event_id, state[0].lower().replace(" ", "_"))
             tooltips_to_be_localized[tooltip] = r"%s (%s), " % (state[0], US_states[state[0]][0])
-            finished_file.append("\t\t\tif = { limit = { has_country_flag = USA_%s_won_%s } custom_effect_tooltip = %s }" % (dem_candidate[0], state[0].lower().replace(" ", "_"), tooltip ))
-        finished_file.append("\t\t}")
-    finished_file.append("\t}")
-
-    finished_file.append("\toption = {")
-    finished_file.append("\t\tname = %s.a" % event_id)
-    finished_file.append("\t\thidden_effect = {")
-    for flag in flags_to_clear:
-        finished_file.append("\t\t\tclr_country_flag = %s" % flag)
-    finished_file.append("\t\t}")
-    finished_file.append("\t}")
-    finished_file.append("}")
-    finished_file.append("")
-    return (finished_file, tooltips_to_be_localized)
+            yield "\t\t\tif = { limit = { has_country_flag = USA_%s_won_%s } custom_effect_tooltip = %s }" % (dem_candidate[0], state[0].lower().replace(" ", "_"), tooltip )
+        yield "\t\t}"
+    yield "\t}"
+
+    yield "\toption = {"
+    yield "\t\tname = %s.a" % event_id
+    yield "\t\thidden_effect = {"
+    for flag in sorted(flags_to_clear):
+        yield "\t\t\tclr_country_flag = %s" % flag
+    for variable in sorted(variables_to_clear):
+        yield "\t\t\tclear_variable = %s" % variable
+    yield "\t\t}"
+    yield "\t}"
+    yield "}"
+    yield ""
 
 def create_localization_file(tooltips):
-    finished_file = list()
-    finished_file.append("l_english:")
+    yield "l_english:"
     for tooltip in tooltips.items():
-        finished_file.append(" %s:0 \"%s\"" % (tooltip[0], tooltip[1]))
-    return finished_file
+        yield " %s:0 \"%s\"" % (tooltip[0], tooltip[1])
+
+def count_subtraction_steps(votes):
+    # Number of vote subtracting events needed to bring votes down to 0
+    steps = 0
+    for step in VOTE_STEPS:
+        steps += votes // step
+        votes %= step
+    return steps
+
+def simulate_election(np, rng, states, trials, variables=False, chunk_size=100000):
+    # states is a list of (chance_1, chance_2, electoral votes). Returns
+    # (republican electoral votes array, outcome array) with outcomes
+    # 0 - republican won, 1 - democrat won, 2 - draw, 3 - winner never determined
+    chances = np.array([x[0] / (x[0] + x[1]) if x[0] + x[1] else 0.0 for x in states], dtype=np.float32)
+    # float32 sums of electoral votes are exact and use BLAS for the product
+    votes = np.array([x[2] for x in states], dtype=np.float32)
+    total = int(votes.sum())
+    rep_votes = np.empty(trials, dtype=np.int64)
+    for start in range(0, trials, chunk_size):
+        size = min(chunk_size, trials - start)
+        won = rng.random((size, len(states)), dtype=np.float32) < chances
+        rep_votes[start:start+size] = won.astype(np.float32) @ votes
+    dem_votes = total - rep_votes
+    if variables:
+        outcomes = np.where(rep_votes > dem_votes, 0, np.where(dem_votes > rep_votes, 1, 2))
+    else:
+        # Chained events subtract from both tallies in turns, starting with the
+        # republican one - whichever runs out of steps first loses
+        steps = np.array([count_subtraction_steps(x) for x in range(total + 1)])
+        rep_steps = steps[rep_votes]
+        dem_steps = steps[dem_votes]
+        outcomes = np.where(dem_steps < rep_steps, 0, 1)
+        outcomes = np.where(dem_steps == 0, np.where(rep_steps == 1, 2, 0), outcomes)
+        outcomes = np.where(rep_votes == 0, 3, outcomes)
+    return (rep_votes, outcomes)
+
+def analyze_elections(regions, trials, variables=False, seed=None):
+    try:
+        import numpy as np
+    except:
+        sys.exit("Requires numpy pip package to be installed for -mc. Run:\npip install numpy\nor\npip3 install numpy\ndepending on your installation and start the script again.\nMore info on installing packages: https://docs.python.org/3/installing/index.html")
+    rng = np.random.default_rng(seed)
+    s_candidates = sorted(candidates, key=lambda x: (x[1].value, x[0]))
+    rep_candidates = [x for x in s_candidates if x[1] == party.republican]
+    dem_candidates = [x for x in s_candidates if x[1] == party.democrat]
+    combinations = sorted(set(key[2:] for region in regions for key, value in region))
+    print("Simulating %s elections for every candidate pair and campaign combination (same in every region)...\n" % trials)
+    for rep_candidate in rep_candidates:
+        for dem_candidate in dem_candidates:
+            for combination in combinations:
+                key = (rep_candidate[0], dem_candidate[0]) + combination
+                states = list()
+                missing_regions = list()
+                for idx, region in enumerate(regions):
+                    value = next((x[1] for x in region if x[0] == key), None)
+                    if value is None:
+                        missing_regions.append(str(region_names_dict.get(idx, idx+1)))
+                        continue
+                    states += [(x.chance_1, x.chance_2, US_states[x.state][0]) for x in value]
+                campaigns = "%s/%s" % (campaign_type(combination[0]).name, campaign_type(combination[1]).name)
+                print("%s vs %s, campaigns %s:" % (rep_candidate[2], dem_candidate[2], campaigns))
+                if not states:
+                    print("\tNot in the .csv file\n")
+                    continue
+                rep_votes, outcomes = simulate_election(np, rng, states, trials, variables)
+                rates = np.bincount(outcomes, minlength=4) / trials
+                print("\t%s won %.2f%%, %s won %.2f%%, draw %.2f%%, undetermined %.2f%%" % (rep_candidate[2], rates[0] * 100, dem_candidate[2], rates[1] * 100, rates[2] * 100, rates[3] * 100))
+                percentiles = np.percentile(rep_votes, [5, 50, 95])
+                print("\t%s electoral votes: mean %.1f, std %.1f, 5%% %d, median %d, 95%% %d (of %s)" % (rep_candidate[2], rep_votes.mean(), rep_votes.std(), percentiles[0], percentiles[1], percentiles[2], sum(x[2] for x in states)))
+                if missing_regions:
+                    print("\tWARNING: no entries for region(s) %s - the election stops there in game" % ", ".join(missing_regions))
+                print("")
+
+def write_election(f, parsed_csv, namespace, start_idx, args, tooltips):
+    # Events are streamed to the file as they are generated, so memory use does not
+    # grow with the number of candidates
+    f.writelines(line + "\n" for line in create_events_file(parsed_csv, namespace, start_idx, args.scripted_effects, args.variables))
+    if args.summary_event:
+        f.write("### EVENTS TO DETERMINE WINNER\n")
+        idx = start_idx + len(parsed_csv)
+        if args.variables:
+            end_idx = idx+1
+            f.writelines(line + "\n" for line in create_event_tallying_votes(namespace, idx, end_idx))
+        else:
+            #has to be done two times since an event cannot call itself
+            end_idx = idx+(len(party)*2)
+            for i, x in enumerate(party):
+                f.writelines(line + "\n" for line in create_event_subtracting_votes(namespace, idx, idx+1, x))
+                temp = start_idx + len(parsed_csv) if i == len(party)-1 else idx+2
+                f.writelines(line + "\n" for line in create_event_determining_winner(namespace, idx+1, temp, end_idx))
+                idx = idx+2
+        f.writelines(line + "\n" for line in create_summary_event(namespace, end_idx, tooltips))
+
+def count_election_events(region_count, args):
+    # Without summary events, the last region calls the event after its own, so
+    # that ID is reserved too
+    if not args.summary_event:
+        return region_count + 1
+    return region_count + (1 if args.variables else len(party)*2) + 1
+
+def reset_election(region_names):
+    US_states.clear()
+    candidates.clear()
+    flags_to_clear.clear()
+    variables_to_clear.clear()
+    region_names_dict.clear()
+    region_names_dict.update(region_names)
+
+def count_regions_job(job):
+    # Returns (region count, error) - errors are returned instead of exiting, as
+    # exiting a worker process would leave the pool waiting for its result forever
+    name, region_names = job
+    reset_election(region_names)
+    try:
+        return (len(read_CSV_file(name)), None)
+    except CSVError as e:
+        return (None, str(e))
+
+def generate_election_job(job):
+    # Runs in a worker process - the election is written to its own temporary file.
+    # Returns (tooltips, error)
+    name, namespace, start_idx, args, region_names, temp_name = job
+    reset_election(region_names)
+    try:
+        parsed_csv = read_CSV_file(name)
+    except CSVError as e:
+        return (None, str(e))
+    tooltips = collections.OrderedDict()
+    with open(temp_name, encoding='utf-8', mode="w", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write("### ELECTION %s\n" % os.path.basename(name))
+        write_election(f, parsed_csv, namespace, start_idx, args, tooltips)
+    return (tooltips, None)
+
+def read_unmanaged_lines(name):
+    # Returns (lines before, lines after) the managed section of the file
+    if not os.path.exists(name):
+        return ([], [])
+    with open(name, encoding='utf-8-sig', mode="r") as f:
+        lines = f.read().splitlines()
+    if MANAGED_SECTION_BEGIN not in lines:
+        return (lines, [])
+    begin = lines.index(MANAGED_SECTION_BEGIN)
+    end = lines.index(MANAGED_SECTION_END, begin) if MANAGED_SECTION_END in lines[begin:] else len(lines) - 1
+    return (lines[:begin], lines[end+1:])
+
+def find_free_event_index(lines, namespace):
+    event_id_regex = re.compile(r'\bid\s*=\s*%s\.(\d+)\b' % re.escape(namespace))
+    indexes = [int(match.group(1)) for line in lines for match in event_id_regex.finditer(re.sub('#.*', "", line))]
+    return max(indexes) + 1 if indexes else 1
+
+def write_managed_section(name, before, after, section_files):
+    temp_name = name + ".tmp"
+    with open(temp_name, encoding='utf-8-sig', mode="w", buffering=WRITE_BUFFER_SIZE) as f:
+        f.writelines(line + "\n" for line in before)
+        f.write(MANAGED_SECTION_BEGIN + "\n")
+        for section_file in section_files:
+            with open(section_file, encoding='utf-8', mode="r") as section:
+                for line in section:
+                    f.write(line)
+        f.write(MANAGED_SECTION_END + "\n")
+        f.writelines(line + "\n" for line in after)
+    os.replace(temp_name, name)
+
+def exit_on_errors(results):
+    # Every failing file is reported before exiting, so they can all be fixed at once
+    errors = [error for result, error in results if error]
+    if errors:
+        sys.exit("%s of %s files are not valid, nothing was written:\n\n%s" % (len(errors), len(results), "\n\n".join(errors)))
+
+def run_batch(args, region_names):
+    try:
+        names = sorted(glob.glob(os.path.join(readable_dir(args.input), "*.csv")))
+    except:
+        sys.exit("%s is not a directory or does not exist." % args.input)
+    if not names:
+        sys.exit("No .csv files found in %s!" % args.input)
+    before, after = read_unmanaged_lines(args.output)
+    if args.starting_event_id_index is not None:
+        start_idx = int(args.starting_event_id_index)
+    else:
+        start_idx = find_free_event_index(before + after, args.namespace)
+    with multiprocessing.Pool(args.jobs) as pool:
+        results = pool.map(count_regions_job, [(name, region_names) for name in names])
+        exit_on_errors(results)
+        region_counts = [x[0] for x in results]
+        jobs = list()
+        idx = start_idx
+        for name, region_count in zip(names, region_counts):
+            event_count = count_election_events(region_count, args)
+            print("Election %s: events %s.%s - %s.%s" % (os.path.basename(name), args.namespace, idx, args.namespace, idx + event_count - 1))
+            jobs.append((name, args.namespace, idx, args, region_names, "%s.%s.tmp" % (args.output, len(jobs))))
+            idx += event_count
+        try:
+            results = pool.map(generate_election_job, jobs)
+            exit_on_errors(results)
+            all_tooltips = [x[0] for x in results]
+            write_managed_section(args.output, before, after, [x[5] for x in jobs])
+        finally:
+            for job in jobs:
+                if os.path.exists(job[5]):
+                    os.remove(job[5])
+    if args.summary_event:
+        with open(args.summary_event_localization, encoding='utf-8-sig', mode="w") as f:
+            f.write("l_english:\n")
+            for tooltips in all_tooltips:
+                f.writelines(line + "\n" for line in islice(create_localization_file(tooltips), 1, None))
+    print("\n%s elections written to the managed section of %s" % (len(names), args.output))
 
 ###################################################################
-if not sys.version_info >= (3,0):
-    sys.exit("Wrong Python version. Version 3.0 or higher is required to run this script!")
-parser = argparse.ArgumentParser(description='Given a properly formatted .csv file, create HoI 4 events simulating counting of votes USA elections (first past the post). Originally written for Fuhrerreich mod.')
-parser.add_argument('input',
-                    help='Fuhrerreich .csv USA elections file')
-parser.add_argument('namespace',
-                    help='Event ID namespace (Example: "usa.election.1936")')
-parser.add_argument('starting_event_id_index',
-                    help='A free event ID index (Example: "2")')
-parser.add_argument( 'output',
-                    help='Name of HoI4 event file to write to (appends)')
-parser.add_argument('-r', '--region_names', required=False, default="",
-                    help='Optional region names separated by comma "," ordered as in the .csv file (Example: "West,North Central,Southeast,Northeast"). If not given, indexes will be used instead.')
-parser.add_argument( '-s', '--summary_event', action='store_true', required=False, default=False,
-                    help='Generate summary and winner determination events? (Default: False)')
-parser.add_argument( '-loc', '--summary_event_localization', required=False, default="",
-                    help='Name of the localization file to write summary localization to (overwrites) (Default: OUTPUT_l_english.yml)')
-args = parser.parse_args()
-args.summary_event_localization = "%s_l_english.yml" % args.output.split(".")[0]
-region_names_dict = dict()
-if args.region_names:
-    args.region_names = args.region_names.split(",")
-    for idx, name in enumerate(args.region_names):
-        region_names_dict[idx] = name.strip()
-parsed_csv = read_CSV_file(args.input)
-print("\nFile %s read successfully!" % (args.input))
-print("Adding to event file %s...\n" % (args.output))
-events_file = create_events_file(parsed_csv, args.namespace, int(args.starting_event_id_index))
-events_file_l = events_file[0]
-if args.summary_event:
-    #has to be done two times since an event cannot call itself
-    events_file_l.append("### EVENTS TO DETERMINE WINNER")
-    idx = events_file[1]
-    end_idx = idx+(len(party)*2)
-    for i, x in enumerate(party):
-        events_file_l += create_event_subtracting_votes(args.namespace, idx, idx+1, x)
-        temp = events_file[1] if i == len(party)-1 else idx+2
-        events_file_l += create_event_determining_winner(args.namespace, idx+1, temp, end_idx)
-        idx = idx+2
-        
-    summary_event = create_summary_event(args.namespace, end_idx)
-    events_file_l += summary_event[0]
-    with open(args.summary_event_localization, encoding='utf-8-sig', mode="w") as f:
-        f.writelines(str(line) + "\n" for line in create_localization_file(summary_event[1]))
-
-with open(args.output, encoding='utf-8-sig', mode="a") as f:
-        f.writelines(str(line) + "\n" for line in events_file_l)
-print("\nFile %s written to successfully!" % (args.output))
-#createHOI4ideasfile(args.output, ministers, country_tag)
-#print("Ideas file %s created successfully" % args.output)
+def main():
+    parser = argparse.ArgumentParser(description='Given a properly formatted .csv file, create HoI 4 events simulating counting of votes USA elections (first past the post). Originally written for Fuhrerreich mod.')
+    parser.add_argument('input',
+                        help='Fuhrerreich .csv USA elections file (with -b, a folder of them)')
+    parser.add_argument('namespace', nargs='?',
+                        help='Event ID namespace (Example: "usa.election.1936")')
+    parser.add_argument('starting_event_id_index', nargs='?',
+                        help='A free event ID index (Example: "2"). Optional with -b')
+    parser.add_argument( 'output', nargs='?',
+                        help='Name of HoI4 event file to write to (appends)')
+    parser.add_argument('-r', '--region_names', required=False, default="",
+                        help='Optional region names separated by comma "," ordered as in the .csv file (Example: "West,North Central,Southeast,Northeast"). If not given, indexes will be used instead.')
+    parser.add_argument( '-s', '--summary_event', action='store_true', required=False, default=False,
+                        help='Generate summary and winner determination events? (Default: False)')
+    parser.add_argument( '-loc', '--summary_event_localization', required=False, default="",
+                        help='Name of the localization file to write summary localization to (overwrites) (Default: OUTPUT_l_english.yml)')
+    parser.add_argument( '-se', '--scripted_effects', action='store_true', required=False, default=False,
+                        help='Move per state vote outcomes, state ownership and campaign checks to scripted effects and triggers shared by all candidate pairs, written to OUTPUT_scripted_effects.txt and OUTPUT_scripted_triggers.txt (overwrites) (Default: False)')
+    parser.add_argument( '-v', '--variables', action='store_true', required=False, default=False,
+                        help='Count electoral votes in variables instead of country flag values, so the summary events determine the winner in one event instead of chained vote subtracting events (Default: False)')
+    parser.add_argument( '-mc', '--monte_carlo', type=int, required=False, default=0,
+                        help='Instead of creating events, simulate this many elections for every candidate pair and campaign combination and print win, draw and electoral vote statistics. Winners are determined like in the summary events (with -v, like with variables). Requires numpy. namespace, starting_event_id_index and output are not needed (Default: 0)')
+    parser.add_argument( '--seed', type=int, required=False, default=None,
+                        help='Random seed for -mc (Default: random)')
+    parser.add_argument( '-b', '--batch', action='store_true', required=False, default=False,
+                        help='Generate one election for every .csv file in the input folder (eg. one per election year), in parallel and in name order. Event IDs are allocated one after another, starting with starting_event_id_index or after the highest ID of the namespace already in the output file. Instead of appending, the events replace the section of the output file managed by this script, so runs can be repeated (Default: False)')
+    parser.add_argument( '-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes for -b (Default: CPU count)')
+    args = parser.parse_args()
+    if args.batch and args.output is None and args.starting_event_id_index is not None and not args.starting_event_id_index.isdigit():
+        # starting_event_id_index was left out, so the output file took its place
+        args.output = args.starting_event_id_index
+        args.starting_event_id_index = None
+    if args.batch and (args.namespace is None or args.output is None):
+        parser.error("namespace and output are required")
+    if args.batch and args.scripted_effects:
+        parser.error("-se cannot be used with -b - elections would share scripted effect names")
+    if args.batch and args.monte_carlo:
+        parser.error("-mc cannot be used with -b")
+    if not args.batch and not args.monte_carlo and (args.namespace is None or args.starting_event_id_index is None or args.output is None):
+        parser.error("namespace, starting_event_id_index and output are required unless -mc is given")
+    if args.region_names:
+        args.region_names = args.region_names.split(",")
+        for idx, name in enumerate(args.region_names):
+            region_names_dict[idx] = name.strip()
+    if args.output is not None:
+        args.summary_event_localization = "%s_l_english.yml" % args.output.split(".")[0]
+    if args.batch:
+        run_batch(args, dict(region_names_dict))
+        return
+    try:
+        parsed_csv = read_CSV_file(args.input)
+    except CSVError as e:
+        sys.exit(str(e))
+    print("\nFile %s read successfully!" % (args.input))
+    if args.monte_carlo:
+        analyze_elections(parsed_csv, args.monte_carlo, args.variables, args.seed)
+        return
+    print("Adding to event file %s...\n" % (args.output))
+    start_idx = int(args.starting_event_id_index)
+    tooltips = collections.OrderedDict()
+    if args.scripted_effects:
+        scripted_name = args.output.split(".")[0]
+        with open("%s_scripted_effects.txt" % scripted_name, encoding='utf-8-sig', mode="w") as f:
+            f.writelines(line + "\n" for line in create_scripted_effects(args.variables))
+        with open("%s_scripted_triggers.txt" % scripted_name, encoding='utf-8-sig', mode="w") as f:
+            f.writelines(line + "\n" for line in create_scripted_triggers(len(parsed_csv)))
+        print("Scripted effects and triggers written to %s_scripted_effects.txt and %s_scripted_triggers.txt" % (scripted_name, scripted_name))
+    with open(args.output, encoding='utf-8-sig', mode="a", buffering=WRITE_BUFFER_SIZE) as f:
+        write_election(f, parsed_csv, args.namespace, start_idx, args, tooltips)
+    if args.summary_event:
+        with open(args.summary_event_localization, encoding='utf-8-sig', mode="w") as f:
+            f.writelines(line + "\n" for line in create_localization_file(tooltips))
+    print("\nFile %s written to successfully!" % (args.output))
+    #createHOI4ideasfile(args.output, ministers, country_tag)
+    #print("Ideas file %s created successfully" % args.output)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,0):
+        sys.exit("Wrong Python version. Version 3.0 or higher is required to run this script!")
+    main()
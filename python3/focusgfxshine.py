@@ -65,6 +65,47 @@ def get_shine_def(name, path):
     )
 
 
+goal_regex = re.compile(
+    r"name\s*=\s*\"([^\"]+)?\"(?:[^\}]*?)texturefile\s*=\s*\"([^\"]+)?\"",  re.MULTILINE | re.DOTALL | re.IGNORECASE
+)
+goal_name_regex = re.compile(
+    r"name\s*=\s*\"([^\"]+)?\"",  re.MULTILINE | re.DOTALL | re.IGNORECASE
+)
+comments_regex = re.compile(
+    r"#*$"
+)
+
+
+def find_missing_shines(goals, goals_shine):
+    goals_shine_matches = goal_name_regex.findall(
+        comments_regex.sub(goals_shine, '')
+    )
+    goals_shine_matches = set(goals_shine_matches)
+
+    goals_matches = goal_regex.findall(
+        comments_regex.sub(goals, '')
+    )
+    return {
+        k: v for k, v in goals_matches if not f"{k}_shine" in goals_shine_matches
+    }
+
+
+def add_shine_defs(goals_shine, goals_matches):
+    last_bracket_idx = 0
+
+    for i in range(len(goals_shine) - 1, -1, -1):
+        if goals_shine[i] == "}":
+            last_bracket_idx = abs(i)
+            break
+
+    goals_shine_split = [goals_shine[:last_bracket_idx], goals_shine[last_bracket_idx:]]
+
+    for k, v in goals_matches.items():
+        goals_shine_split.insert(1, get_shine_def(k, v))
+
+    return "\n".join(goals_shine_split)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Given a goals GFX file, add all missing shine entries to the goals_shine GFX file."
@@ -76,54 +117,24 @@ def main():
 
     args = parser.parse_args()
 
-    goal_regex = re.compile(
-        r"name\s*=\s*\"([^\"]+)?\"(?:[^\}]*?)texturefile\s*=\s*\"([^\"]+)?\"",  re.MULTILINE | re.DOTALL | re.IGNORECASE
-    )
-    goal_name_regex = re.compile(
-        r"name\s*=\s*\"([^\"]+)?\"",  re.MULTILINE | re.DOTALL | re.IGNORECASE
-    )
-    comments_regex = re.compile(
-        r"#*$"
-    )
-
     print(f"Reading {args.goals_shine}...")
     with open(args.goals_shine, "r") as f:
         goals_shine = f.read()
 
-    goals_shine_matches = goal_name_regex.findall(
-        comments_regex.sub(goals_shine, '')
-    )
-    goals_shine_matches = set(goals_shine_matches)
-
-    last_bracket_idx = 0
-
-    for i in range(len(goals_shine) - 1, -1, -1):
-        if goals_shine[i] == "}":
-            last_bracket_idx = abs(i)
-            break
-
-    goals_shine_split = [goals_shine[:last_bracket_idx], goals_shine[last_bracket_idx:]]
-
     print(f"Reading {args.goals}...")
     with open(args.goals, "r") as f:
         goals = f.read()
 
-    goals_matches = goal_regex.findall(
-        comments_regex.sub(goals, '')
-    )
-    goals_matches = {
-        k: v for k, v in goals_matches if not f"{k}_shine" in goals_shine_matches
-    }
+    goals_matches = find_missing_shines(goals, goals_shine)
 
     print(f"Found {len(goals_matches)} missing shine entries...")
 
     for k, v in goals_matches.items():
         print(f'"{k}" not found in "{args.goals_shine}", adding as "{k}_shine"...')
-        goals_shine_split.insert(1, get_shine_def(k, v))
 
     print(f"Saving modified {args.goals_shine}...")
     with open(args.goals_shine, "w") as f:
-        f.write("\n".join(goals_shine_split))
+        f.write(add_shine_defs(goals_shine, goals_matches))
 
 
 if __name__ == "__main__":
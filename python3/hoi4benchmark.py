@@ -0,0 +1,281 @@
+#!/usr/bin/python3
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import hoi4modgenerator
+
+#############################
+###
+### HoI 4 Scripts Benchmark by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Generates synthetic mods of the given scales with hoi4modgenerator.py (from
+### the same folder) and times the scripts on them. Every run gets a fresh copy
+### of the mod, as most scripts modify it. Scripts which take a single file are
+### run once for every file of that type and timed together. The best of the
+### repeats is kept and throughput is reported as files/s and lines/s of input.
+###
+### Scaling is the run time ratio between the largest and the smallest scale
+### divided by the size ratio - around 1.0 is linear, much more means a
+### quadratic hot path. With -b, results are compared to an earlier JSON file
+### and the script exits with 1 if any throughput dropped below 1/THRESHOLD of
+### the baseline or any scaling grew above THRESHOLD times the baseline.
+###
+### usage: hoi4benchmark.py [-h] [-s [SCALES [SCALES ...]]] [-r REPEATS]
+###                         [--scripts [SCRIPTS [SCRIPTS ...]]]
+###                         [--python2 python2] [--per_file PER_FILE]
+###                         [-b BASELINE] [-t THRESHOLD]
+###                         output
+###
+### Time the text-processing scripts on synthetic mods and write the results to a
+### JSON file.
+###
+### positional arguments:
+###   output                JSON file to write the results to
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -s [SCALES [SCALES ...]], --scales [SCALES [SCALES ...]]
+###                         Mod scales to benchmark, see hoi4modgenerator.py
+###                         (Default: 1 4)
+###   -r REPEATS, --repeats REPEATS
+###                         Number of runs of every script, the best one is kept
+###                         (Default: 3)
+###   --scripts [SCRIPTS [SCRIPTS ...]]
+###                         Scripts to benchmark (Default: all of
+###                         hoi4fileformatter hoi4localisationadder
+###                         hoi4transfertechsegen hoi4ideagfxentry focusgfxshine
+###                         hoi4newspaperheaderadded)
+###   --python2 python2     Python 2 interpreter for the python2 folder scripts. If
+###                         it cannot be run, those scripts are skipped (Default:
+###                         python2)
+###   --per_file PER_FILE   Number of entries in every generated file (Default:
+###                         50)
+###   -b BASELINE, --baseline BASELINE
+###                         Earlier results to compare to (Default: "")
+###   -t THRESHOLD, --threshold THRESHOLD
+###                         Allowed slowdown factor when comparing to the
+###                         baseline (Default: 1.5)
+###
+#############################
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHON2_DIR = os.path.join(REPOSITORY_DIR, "python2")
+PYTHON3_DIR = os.path.join(REPOSITORY_DIR, "python3")
+
+#############################
+
+# Every benchmark returns (invocations, input files) for a mod folder, invocations
+# being lists of arguments for the interpreter given in BENCHMARKS.
+
+def files_in(mod, folder, extension):
+    return sorted(glob.glob(os.path.join(mod, folder, "*" + extension)))
+
+def fileformatter_benchmark(mod):
+    files = [x for x in glob.glob(os.path.join(mod, "**", "*.*"), recursive=True) if os.path.splitext(x)[1] in (".txt", ".gfx")]
+    return ([[os.path.join(PYTHON3_DIR, "hoi4fileformatter.py"), mod, "-r", "-nc"]], sorted(files))
+
+def localisationadder_benchmark(mod):
+    output = os.path.join(mod, hoi4modgenerator.LOC_FOLDER, "generated_0_l_english.yml")
+    files = files_in(mod, hoi4modgenerator.EVENT_FOLDER, ".txt") + files_in(mod, hoi4modgenerator.FOCUS_FOLDER, ".txt") + files_in(mod, hoi4modgenerator.IDEA_FOLDER, ".txt")
+    return ([[os.path.join(PYTHON2_DIR, "hoi4localisationadder.py"), x, output] for x in files], files)
+
+def transfertechsegen_benchmark(mod):
+    folder = os.path.join(mod, hoi4modgenerator.TECH_FOLDER)
+    output = os.path.join(mod, "common", "scripted_effects", "transfer_technology.txt")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    return ([[os.path.join(PYTHON2_DIR, "hoi4transfertechsegen.py"), folder, output, "-o"]], files_in(mod, hoi4modgenerator.TECH_FOLDER, ".txt"))
+
+def ideagfxentry_benchmark(mod):
+    output = os.path.join(mod, hoi4modgenerator.GFX_FOLDER, "generated_ideas.gfx")
+    files = files_in(mod, hoi4modgenerator.IDEA_FOLDER, ".txt")
+    return ([[os.path.join(PYTHON2_DIR, "hoi4ideagfxentry.py"), x, output] for x in files], files)
+
+def focusgfxshine_benchmark(mod):
+    goals = os.path.join(mod, hoi4modgenerator.GFX_FOLDER, "goals.gfx")
+    goals_shine = os.path.join(mod, hoi4modgenerator.GFX_FOLDER, "goals_shine.gfx")
+    return ([[os.path.join(PYTHON3_DIR, "focusgfxshine.py"), goals, goals_shine]], [goals, goals_shine])
+
+def newspaperheaderadded_benchmark(mod):
+    files = files_in(mod, hoi4modgenerator.EVENT_FOLDER, ".txt") + files_in(mod, hoi4modgenerator.LOC_FOLDER, ".yml")
+    return ([[os.path.join(PYTHON3_DIR, "hoi4newspaperheaderadded.py"), mod]], files)
+
+BENCHMARKS = (
+    ("hoi4fileformatter", "python3", fileformatter_benchmark),
+    ("hoi4localisationadder", "python2", localisationadder_benchmark),
+    ("hoi4transfertechsegen", "python2", transfertechsegen_benchmark),
+    ("hoi4ideagfxentry", "python2", ideagfxentry_benchmark),
+    ("focusgfxshine", "python3", focusgfxshine_benchmark),
+    ("hoi4newspaperheaderadded", "python3", newspaperheaderadded_benchmark),
+)
+
+#############################
+
+def count_lines(files):
+    lines = 0
+    for name in files:
+        with open(name, "rb") as f:
+            lines += f.read().count(b"\n")
+    return lines
+
+def interpreter_works(interpreter):
+    # A pyenv shim can be found on the PATH without being able to run anything
+    try:
+        return subprocess.run([interpreter, "-c", "pass"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        return False
+
+def run_benchmark(benchmark, mod, interpreter):
+    # Returns (seconds, files, lines, error) for one run on a fresh copy of mod
+    work_dir = tempfile.mkdtemp(prefix="hoi4benchmark_")
+    try:
+        work_mod = os.path.join(work_dir, "mod")
+        shutil.copytree(mod, work_mod)
+        invocations, files = benchmark(work_mod)
+        lines = count_lines(files)
+        seconds = 0.0
+        for arguments in invocations:
+            start = time.perf_counter()
+            process = subprocess.run([interpreter] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            seconds += time.perf_counter() - start
+            if process.returncode != 0:
+                return (seconds, len(files), lines, process.stderr.decode("utf-8", errors="replace").strip())
+        return (seconds, len(files), lines, None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def compute_scaling(results):
+    # {script: run time ratio / size ratio between the largest and smallest scale}
+    scaling = dict()
+    for script in sorted(set(x["script"] for x in results)):
+        runs = sorted((x for x in results if x["script"] == script and not x["error"]), key=lambda x: x["lines"])
+        if len(runs) < 2 or runs[0]["lines"] == 0 or runs[0]["seconds"] == 0:
+            continue
+        scaling[script] = (runs[-1]["seconds"] / runs[0]["seconds"]) / (runs[-1]["lines"] / runs[0]["lines"])
+    return scaling
+
+def compare(results, baseline, threshold):
+    # Returns a list of regression descriptions
+    regressions = list()
+    old_results = {(x["script"], x["scale"]): x for x in baseline["results"] if not x["error"]}
+    for result in results:
+        old = old_results.get((result["script"], result["scale"]))
+        if old is None or result["error"]:
+            continue
+        if result["lines_per_second"] * threshold < old["lines_per_second"]:
+            regressions.append("%s (scale %s): %.0f lines/s, was %.0f" % (result["script"], result["scale"], result["lines_per_second"], old["lines_per_second"]))
+    old_scaling = baseline.get("scaling", dict())
+    for script, value in compute_scaling(results).items():
+        if script in old_scaling and value > old_scaling[script] * threshold:
+            regressions.append("%s: scaling %.2f, was %.2f" % (script, value, old_scaling[script]))
+    return regressions
+
+#############################
+
+def main():
+    names = [name for name, interpreter, benchmark in BENCHMARKS]
+    parser = argparse.ArgumentParser(description='Time the text-processing scripts on synthetic mods and write the results to a JSON file.')
+    parser.add_argument('output', metavar='output',
+                        help='JSON file to write the results to')
+    parser.add_argument('-s', '--scales', nargs="*", type=int, required=False, default=[1, 4],
+                        help='Mod scales to benchmark, see hoi4modgenerator.py (Default: 1 4)')
+    parser.add_argument('-r', '--repeats', type=int, required=False, default=3,
+                        help='Number of runs of every script, the best one is kept (Default: 3)')
+    parser.add_argument('--scripts', nargs="*", choices=names, required=False, default=names,
+                        help='Scripts to benchmark (Default: all of %s)' % " ".join(names))
+    parser.add_argument('--python2', metavar='python2', default="python2", required=False,
+                        help='Python 2 interpreter for the python2 folder scripts. If it cannot be run, those scripts are skipped (Default: python2)')
+    parser.add_argument('--per_file', type=int, required=False, default=50,
+                        help='Number of entries in every generated file (Default: 50)')
+    parser.add_argument('-b', '--baseline', default="", required=False,
+                        help='Earlier results to compare to (Default: "")')
+    parser.add_argument('-t', '--threshold', type=float, required=False, default=1.5,
+                        help='Allowed slowdown factor when comparing to the baseline (Default: 1.5)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError):
+            sys.exit("Could not read baseline file " + args.baseline + "!")
+    interpreters = {"python2": args.python2, "python3": sys.executable}
+    benchmarks = [x for x in BENCHMARKS if x[0] in args.scripts]
+    if any(x[1] == "python2" for x in benchmarks) and not interpreter_works(args.python2):
+        skipped = [x[0] for x in benchmarks if x[1] == "python2"]
+        benchmarks = [x for x in benchmarks if x[1] != "python2"]
+        print("Python 2 interpreter " + args.python2 + " cannot be run, skipping " + ", ".join(skipped) + ". Use --python2 to set it.")
+
+    results = list()
+    mods_dir = tempfile.mkdtemp(prefix="hoi4benchmark_mods_")
+    try:
+        for scale in args.scales:
+            mod = os.path.join(mods_dir, "scale_%s" % scale)
+            counts = {name: count * scale for name, count, description in hoi4modgenerator.DEFAULT_COUNTS}
+            print("Generating mod of scale %s..." % scale)
+            hoi4modgenerator.generate_mod(mod, counts, args.per_file)
+            for name, interpreter, benchmark in benchmarks:
+                runs = [run_benchmark(benchmark, mod, interpreters[interpreter]) for x in range(args.repeats)]
+                seconds, files, lines, error = min(runs, key=lambda x: x[0])
+                error = next((x[3] for x in runs if x[3]), None)
+                result = {
+                    "script": name,
+                    "scale": scale,
+                    "files": files,
+                    "lines": lines,
+                    "seconds": seconds,
+                    "runs": [x[0] for x in runs],
+                    "files_per_second": files / seconds if seconds else 0.0,
+                    "lines_per_second": lines / seconds if seconds else 0.0,
+                    "error": error,
+                }
+                results.append(result)
+                if error:
+                    print("%s (scale %s) failed:\n%s" % (name, scale, error))
+                else:
+                    print("%s (scale %s) - %s files, %s lines in %.3fs - %.1f files/s, %.0f lines/s" % (name, scale, files, lines, seconds, result["files_per_second"], result["lines_per_second"]))
+    finally:
+        shutil.rmtree(mods_dir, ignore_errors=True)
+
+    scaling = compute_scaling(results)
+    for script, value in sorted(scaling.items()):
+        print("%s scaling: %.2f" % (script, value))
+    with open(args.output, "w") as f:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "per_file": args.per_file,
+            "results": results,
+            "scaling": scaling,
+        }, f, indent=2, sort_keys=True)
+    print("Results written to " + args.output)
+
+    failed = any(x["error"] for x in results)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression: " + regression)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,6):
+        sys.exit("Wrong Python version. Version 3.6 or higher is required to run this script!")
+    main()
@@ -3,8 +3,15 @@ import argparse
 import os
 import re
 import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
+import shutil
 import sys
 
+import hoi4pdxparser
+
 #############################
 ###
 ### HoI 4 File Formatter by Yard1, originally for Equestria at War mod
@@ -15,10 +22,20 @@ import sys
 ### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
-### usage: hoi4Formatter.py [-h] [-r] [--extensions [EXTENSIONS [EXTENSIONS ...]]]
+### usage: hoi4Formatter.py [-h] [-ws] [-ic] [-r] [-j JOBS] [-c] [-nc]
+###                         [--extensions [EXTENSIONS [EXTENSIONS ...]]] [-l]
+###                         [--max_inline MAX_INLINE]
+###                         [--inline_keys [INLINE_KEYS [INLINE_KEYS ...]]]
 ###                         input
 ###
 ### Given a file or folder, format files to follow proper PDX-style indentation. Only indentation is changed.
+### Files which are already formatted are not written to. When formatting a folder,
+### hashes of formatted files are kept in .hoi4fileformatter_cache.json in that
+### folder and files which did not change since are skipped. The cache is reset
+### when formatting options change.
+### With -l, files are tokenized instead (using hoi4pdxparser.py from the same
+### folder), so lines like a = { b = { c = 1 } } or strings containing # are
+### handled properly.
 ###
 ### positional arguments:
 ###   input                 Technology file name/folder containing files
@@ -32,9 +49,31 @@ import sys
 ###                         (Default: False)
 ###   -r, --recursive       Format files in directories recursively (Default:
 ###                         False)
+###   -j JOBS, --jobs JOBS  Number of worker processes used to format folders
+###                         (Default: CPU count)
+###   -c, --check           Only report which files would be reformatted, without
+###                         writing them. Exits with 1 if any would (Default:
+###                         False)
+###   -nc, --no_cache       Do not read or write the .hoi4fileformatter_cache.json
+###                         cache of already formatted files in the input folder
+###                         (Default: False)
 ###   --extensions [EXTENSIONS [EXTENSIONS ...]]
 ###                         Which file extensions should be formatted (Default:
 ###                         .txt .gfx)
+###   -l, --lexer           Tokenize files instead of formatting them line by line
+###                         - every statement and closing brace goes on its own
+###                         line, spacing around operators is normalized. Handles
+###                         several braces, strings with # and comments on one
+###                         line. -ws and -ic are ignored (Default: False)
+###   --max_inline MAX_INLINE
+###                         Lexer: blocks without nested blocks or comments with at
+###                         most this many statements are written on one line, -1
+###                         keeps such blocks on one line only if they already
+###                         were (Default: -1)
+###   --inline_keys [INLINE_KEYS [INLINE_KEYS ...]]
+###                         Lexer: blocks with these keys are always written on
+###                         one line if they have no nested blocks or comments
+###                         (Default: rgb hsv color color_ui)
 ###
 #############################
 
@@ -48,75 +87,335 @@ def readable_dir(prospective_dir):
 
 #############################
 
-def formatfile(name, remove_whitespace, ignore_comments):
-    print("Reading file " + name + "...")
-    with open(name, "r") as f:
-        lines = f.read().splitlines()
-    names = list()
-    new_lines = list()
+COMMENT_LINE_REGEX = re.compile(r"^\s*#")
+STRING_REGEX = re.compile(r'\".*?\"')
+WRITE_BUFFER_SIZE = 1024 * 1024
+FORMATTER_VERSION = 1
+CACHE_FILE_NAME = ".hoi4fileformatter_cache.json"
+
+def format_lines(lines, remove_whitespace, ignore_comments):
     open_blocks = 0
     for line in lines:
-        if ignore_comments and re.match("^\s*#", line):
-            new_lines.append(line)
+        if ignore_comments and COMMENT_LINE_REGEX.match(line):
+            yield line
             continue
         if remove_whitespace:
-            line = re.sub(r"\s*$", "", line)
-            new_lines.append(line)
+            yield line.rstrip()
             continue
         line = line.strip()
-        if line == "}":
-            line = ('\t' * (open_blocks-1)) + line
+        if not line:
+            yield line
+        elif line == "}":
+            yield ('\t' * (open_blocks-1)) + line
+        else:
+            yield ('\t' * open_blocks) + line
+        if '"' in line:
+            line = STRING_REGEX.sub('', line)
+        open_blocks += line.count('{') - line.count('}')
+
+def _find_inline_block_end(tokens, start, max_inline, is_inline_key):
+    # Returns the index of the closing brace if the block opened at start should
+    # be written on one line, None otherwise. Blocks with nested blocks or
+    # comments are never written on one line.
+    items = 0
+    one_line = True
+    previous = None
+    for idx in range(start + 1, len(tokens)):
+        kind = tokens[idx][0]
+        if kind == "close":
+            if is_inline_key:
+                return idx
+            if max_inline < 0:
+                return idx if one_line else None
+            return idx if items <= max_inline else None
+        if kind == "open" or kind == "comment":
+            return None
+        if kind == "newline":
+            one_line = False
+            continue
+        if kind != "operator" and previous != "operator":
+            items += 1
+        previous = kind
+    return None
+
+def format_tokens(text, max_inline=-1, inline_keys=()):
+    # One pass over the token stream. Every statement goes on its own line, blocks
+    # are split unless they qualify to be written on one line (they were on one
+    # line already if max_inline is -1, or have at most max_inline statements, or
+    # their key is in inline_keys). Operators are surrounded by single spaces,
+    # trailing comments stay on their line and blank lines are kept.
+    inline_keys = {x.lower() for x in inline_keys}
+    # Plain (type, value) tuples - building Token tuples would double the run time
+    tokens = [(x.lastgroup, x.group()) for x in hoi4pdxparser.TOKEN_REGEX.finditer(text) if x.lastgroup != "whitespace"]
+    lines = list()
+    parts = list()
+    line_depth = 0
+    depth = 0
+    newlines = 0
+    previous = None
+    previous_is_bare = False
+    key = None
+    idx = 0
+    count = len(tokens)
+
+    def start_line():
+        if parts:
+            lines.append(('\t' * line_depth) + " ".join(parts))
+            del parts[:]
+        if lines:
+            if newlines > 1:
+                lines.extend([""] * (newlines - 1))
+        elif newlines > 0:
+            # Blank lines before the first line, like the line based formatting keeps
+            lines.extend([""] * newlines)
+
+    while idx < count:
+        kind, value = tokens[idx]
+        if kind == "newline":
+            newlines += 1
+            idx += 1
+            continue
+        is_bare = False
+        if kind == "comment":
+            if not parts or newlines > 0:
+                start_line()
+                line_depth = depth
+            parts.append(value)
+        elif kind == "operator":
+            parts.append(value)
+        elif kind == "open":
+            if previous not in ("operator", "word", "string") or newlines > 0:
+                start_line()
+                line_depth = depth
+            # Both the key and a value before the brace count (color = rgb { ... })
+            is_inline_key = key is not None and key.lower() in inline_keys
+            if previous in ("word", "string") and tokens[idx - 1][1].lower() in inline_keys:
+                is_inline_key = True
+            end = _find_inline_block_end(tokens, idx, max_inline, is_inline_key)
+            if end is not None:
+                values = [x[1] for x in tokens[idx + 1:end] if x[0] != "newline"]
+                parts.append("{ %s }" % " ".join(values) if values else "{ }")
+                idx = end
+                kind = "close"
+            else:
+                parts.append("{")
+                depth += 1
+        elif kind == "close":
+            depth = max(depth - 1, 0)
+            start_line()
+            line_depth = depth
+            parts.append("}")
+        else:
+            next_idx = idx + 1
+            while next_idx < count and tokens[next_idx][0] == "newline":
+                next_idx += 1
+            next_kind = tokens[next_idx][0] if next_idx < count else None
+            if previous == "operator":
+                parts.append(value)
+            else:
+                is_bare = next_kind != "operator"
+                if not (is_bare and previous_is_bare and newlines == 0):
+                    start_line()
+                    line_depth = depth
+                parts.append(value)
+                if not is_bare:
+                    key = value
+        previous = kind
+        previous_is_bare = is_bare
+        newlines = 0
+        idx += 1
+    newlines = 0
+    start_line()
+    return "".join(line + "\n" for line in lines)
+
+def formatfile_lexer(name, lexer, check=False):
+    # lexer is (max_inline, inline_keys); the whole file is formatted in memory
+    with open(name, "r", newline="") as f:
+        text = f.read()
+    new_text = format_tokens(text.replace("\r\n", "\n"), *lexer)
+    if new_text == text:
+        return False
+    if not check:
+        temp_name = name + ".tmp"
+        try:
+            with open(temp_name, "w", newline="") as out:
+                out.write(new_text)
+            shutil.copymode(name, temp_name)
+            os.replace(temp_name, name)
+        except:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+    return True
+
+def formatfile(name, remove_whitespace, ignore_comments, verbose=True, check=False, lexer=None):
+    # Returns whether the file was (or in check mode, would be) changed
+    if verbose:
+        print("Reading file " + name + "...")
+    if lexer is not None:
+        return formatfile_lexer(name, lexer, check)
+    temp_name = name + ".tmp"
+    has_changed = False
+    try:
+        with open(name, "r") as f:
+            lines, raw_lines = itertools.tee(f)
+            pairs = zip(raw_lines, format_lines((line.rstrip("\n") for line in lines), remove_whitespace, ignore_comments))
+            if check:
+                return any(new_line + "\n" != line for line, new_line in pairs)
+            with open(temp_name, "w", buffering=WRITE_BUFFER_SIZE) as out:
+                write = out.write
+                for line, new_line in pairs:
+                    new_line += "\n"
+                    if new_line != line:
+                        has_changed = True
+                    write(new_line)
+        if has_changed:
+            shutil.copymode(name, temp_name)
+            os.replace(temp_name, name)
         else:
-            line = ('\t' * open_blocks) + line
-        line = re.sub(r"\s*$", "", line)
-        new_lines.append(line)
-        open_blocks = open_blocks + re.sub(r'\".*?\"', '', line).count('{')
-        open_blocks = open_blocks - re.sub(r'\".*?\"', '', line).count('}')
-    with open(name, "w") as f:
-        f.writelines(str(line) + "\n" for line in new_lines)
+            os.remove(temp_name)
+    except:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    return has_changed
+
+def file_entry(name):
+    st = os.stat(name)
+    with open(name, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return [st.st_size, st.st_mtime_ns, digest]
+
+def format_job(job):
+    # entry is the cached [size, mtime_ns, sha1] of the file as last produced by
+    # the formatter - unchanged files are skipped without being formatted
+    name, remove_whitespace, ignore_comments, check, lexer, entry = job
+    try:
+        if entry is not None:
+            st = os.stat(name)
+            if [st.st_size, st.st_mtime_ns] == entry[:2]:
+                return (name, False, None, entry)
+            new_entry = file_entry(name)
+            if new_entry[2] == entry[2]:
+                return (name, False, None, new_entry)
+        has_changed = formatfile(name, remove_whitespace, ignore_comments, verbose=False, check=check, lexer=lexer)
+        if check and has_changed:
+            return (name, True, None, None)
+        return (name, has_changed, None, file_entry(name))
+    except Exception as e:
+        return (name, False, "%s: %s" % (type(e).__name__, e), None)
+
+def format_files(names, remove_whitespace, ignore_comments, jobs=None, check=False, entries=None, lexer=None):
+    # Yields (name, has_changed, error, entry) in the order of names
+    entries = entries or dict()
+    format_jobs = [(name, remove_whitespace, ignore_comments, check, lexer, entries.get(name)) for name in names]
+    if jobs == 1 or len(format_jobs) < 2:
+        for job in format_jobs:
+            yield format_job(job)
+        return
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap(format_job, format_jobs, chunksize=8):
+            yield result
+
+def cache_options(remove_whitespace, ignore_comments, extensions, lexer=None):
+    if lexer is not None:
+        lexer = [lexer[0], sorted(lexer[1])]
+    return [FORMATTER_VERSION, remove_whitespace, ignore_comments, sorted(extensions), lexer]
+
+def load_cache(name, options):
+    # Returns {relative path: entry}, empty if the cache was made with other options
+    try:
+        with open(name, "r") as f:
+            cache = json.load(f)
+        if cache["options"] == options:
+            return cache["files"]
+    except:
+        pass
+    return dict()
+
+def save_cache(name, options, files):
+    try:
+        with open(name, "w") as f:
+            json.dump({"options": options, "files": files}, f, sort_keys=True)
+    except OSError:
+        print("Could not save cache file " + name + "!")
 
 #############################
-if not sys.version_info >= (3,0):
-    sys.exit("Wrong Python version. Version 3.0 or higher is required to run this script!")
-parser = argparse.ArgumentParser(description='Given a file or folder, format files to follow proper PDX-style indentation. Only indentation is changed.')
-parser.add_argument('input', metavar='input',
-                    help='Technology file name/folder containing files')
-parser.add_argument( '-ws', '--whitespace', action='store_true', required=False, default=False,
-                    help='ONLY remove whitespace at the end of the line without formatting (Default: False)')
-parser.add_argument( '-ic', '--ignore_comments', action='store_true', required=False, default=False,
-                    help='Ignore lines which start with # (or whitespace #) (Default: False)')
-parser.add_argument( '-r', '--recursive', action='store_true', required=False, default=False,
-                    help='Format files in directories recursively (Default: False)')
-parser.add_argument( "--extensions", nargs="*", type=str, required=False,default=[".txt", ".gfx"],
-                    help='Which file extensions should be formatted (Default: .txt .gfx)')
-
-args = parser.parse_args()
-counter = 0
-names_global = list()
-is_dir = False
-try:
-    dir = readable_dir(args.input)
-    is_dir = True
-except:
-    print("Not a directory, treating as file.")
-if is_dir:
-    if args.recursive:
-        for file in glob.glob(dir+"/**/*.*", recursive=True):
-            if os.path.splitext(file)[1] in args.extensions:
-                try:
-                    formatfile(file, args.whitespace, args.ignore_comments)
-                    counter += 1
-                except:
-                    pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a file or folder, format files to follow proper PDX-style indentation. Only indentation is changed.')
+    parser.add_argument('input', metavar='input',
+                        help='Technology file name/folder containing files')
+    parser.add_argument( '-ws', '--whitespace', action='store_true', required=False, default=False,
+                        help='ONLY remove whitespace at the end of the line without formatting (Default: False)')
+    parser.add_argument( '-ic', '--ignore_comments', action='store_true', required=False, default=False,
+                        help='Ignore lines which start with # (or whitespace #) (Default: False)')
+    parser.add_argument( '-r', '--recursive', action='store_true', required=False, default=False,
+                        help='Format files in directories recursively (Default: False)')
+    parser.add_argument( '-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes used to format folders (Default: CPU count)')
+    parser.add_argument( '-c', '--check', action='store_true', required=False, default=False,
+                        help='Only report which files would be reformatted, without writing them. Exits with 1 if any would (Default: False)')
+    parser.add_argument( '-nc', '--no_cache', action='store_true', required=False, default=False,
+                        help='Do not read or write the %s cache of already formatted files in the input folder (Default: False)' % CACHE_FILE_NAME)
+    parser.add_argument( "--extensions", nargs="*", type=str, required=False,default=[".txt", ".gfx"],
+                        help='Which file extensions should be formatted (Default: .txt .gfx)')
+    parser.add_argument( '-l', '--lexer', action='store_true', required=False, default=False,
+                        help='Tokenize files instead of formatting them line by line - every statement and closing brace goes on its own line, spacing around operators is normalized. Handles several braces, strings with # and comments on one line. -ws and -ic are ignored (Default: False)')
+    parser.add_argument( '--max_inline', type=int, required=False, default=-1,
+                        help='Lexer: blocks without nested blocks or comments with at most this many statements are written on one line, -1 keeps such blocks on one line only if they already were (Default: -1)')
+    parser.add_argument( "--inline_keys", nargs="*", type=str, required=False, default=["rgb", "hsv", "color", "color_ui"],
+                        help='Lexer: blocks with these keys are always written on one line if they have no nested blocks or comments (Default: rgb hsv color color_ui)')
+
+    args = parser.parse_args()
+    lexer = (args.max_inline, args.inline_keys) if args.lexer else None
+    is_dir = False
+    try:
+        dir = readable_dir(args.input)
+        is_dir = True
+    except:
+        print("Not a directory, treating as file.")
+    if is_dir:
+        if args.recursive:
+            files = glob.glob(dir+"/**/*.*", recursive=True)
+        else:
+            files = glob.glob(dir+"/*.*")
+        files = sorted(file for file in files if os.path.splitext(file)[1] in args.extensions)
+        cache_name = os.path.join(dir, CACHE_FILE_NAME)
+        options = cache_options(args.whitespace, args.ignore_comments, args.extensions, lexer)
+        cached_files = dict() if args.no_cache else load_cache(cache_name, options)
+        entries = {file: cached_files.get(os.path.relpath(file, dir)) for file in files}
+        results = format_files(files, args.whitespace, args.ignore_comments, args.jobs, args.check, entries, lexer)
     else:
-        for file in glob.glob(dir+"/*.*"):
-            if os.path.splitext(file)[1] in args.extensions:
-                try:
-                    formatfile(file, args.whitespace, args.ignore_comments)
-                    counter += 1
-                except:
-                    pass
-else:
-    formatfile(args.input, args.whitespace, args.ignore_comments)
-    counter += 1
-print("Finished, %s files formatted" % counter)
+        results = [format_job((args.input, args.whitespace, args.ignore_comments, args.check, lexer, None))]
+    changed = list()
+    unchanged = 0
+    errors = list()
+    new_cached_files = dict()
+    for file, has_changed, error, entry in results:
+        if entry is not None:
+            new_cached_files[os.path.relpath(file, args.input)] = entry
+        if error:
+            errors.append((file, error))
+        elif has_changed:
+            changed.append(file)
+            print(("Would reformat file " if args.check else "Formatted file ") + file)
+        else:
+            unchanged += 1
+    if is_dir and not args.no_cache:
+        save_cache(cache_name, options, new_cached_files)
+    if errors:
+        print("\n%s files could not be formatted:" % len(errors))
+        for file, error in errors:
+            print("%s - %s" % (file, error))
+    if args.check:
+        print("Finished, %s files would be reformatted, %s already formatted, %s failed" % (len(changed), unchanged, len(errors)))
+    else:
+        print("Finished, %s files formatted, %s already formatted, %s failed" % (len(changed), unchanged, len(errors)))
+    if errors or (args.check and changed):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,0):
+        sys.exit("Wrong Python version. Version 3.0 or higher is required to run this script!")
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import multiprocessing
+import os
+import re
+import sys
+
+import hoi4pdxparser
+
+#############################
+###
+### HoI 4 Localisation Checker by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Finds localisation keys which are never used and keys which are defined more
+### than once in the same language. Every script, GUI and GFX file is read once
+### (in a process pool) and split into the set of identifiers it contains, so
+### checking a key is a single set lookup no matter how large the mod is. Keys
+### used inside other localisation values ($KEY$) count as used. Keys ending with
+### _desc, _DEF or _ADJ also count as used if the key without the suffix is (eg.
+### focus and idea descriptions, country names). Definitions in localisation/
+### replace override the other ones and are not reported as duplicates.
+###
+### usage: hoi4localisationchecker.py [-h] [-j JOBS]
+###                                   [-r [{unused,duplicate,conflicting} ...]]
+###                                   [-x EXCLUDE] [-l [LANGUAGES ...]]
+###                                   mod_path
+###
+### Given a mod folder, report unused, duplicate and conflicting localisation
+### keys.
+###
+### positional arguments:
+###   mod_path              Path to the root mod folder
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -j JOBS, --jobs JOBS  Number of worker processes (Default: CPU count)
+###   -r [{unused,duplicate,conflicting} ...], --reports [{unused,duplicate,conflicting} ...]
+###                         Which reports to print. unused - keys not used by any
+###                         script, GUI, GFX or localisation file; duplicate -
+###                         keys defined more than once in a language with the
+###                         same value; conflicting - keys defined more than once
+###                         in a language with different values (Default: all)
+###   -x EXCLUDE, --exclude EXCLUDE
+###                         Regular expression - matching keys are never reported
+###                         as unused (eg. "^[A-Z]{3}_" for country names)
+###                         (Default: "")
+###   -l [LANGUAGES ...], --languages [LANGUAGES ...]
+###                         Languages to check (Default: every language found)
+###
+#############################
+
+REPORTS = ("unused", "duplicate", "conflicting")
+SCRIPT_EXTENSIONS = (".txt", ".gfx", ".gui")
+LOCALISATION_EXTENSIONS = (".yml",)
+IMPLICIT_SUFFIXES = ("_desc", "_DEF", "_ADJ")
+
+# Comments are matched (and thrown away) so commented out keys do not count as used
+IDENTIFIER_REGEX = re.compile(r'#[^\n]*|([^\s{}=<>!"#\[\]$|]+)')
+LOC_ENTRY_REGEX = re.compile(r'^\s*([^#\s:]+):[0-9]*\s*"(.*)"')
+LOC_LANGUAGE_REGEX = re.compile(r'^\s*l_(\w+)\s*:')
+LOC_FILE_LANGUAGE_REGEX = re.compile(r"_l_(\w+)\.yml$")
+LOC_REFERENCE_REGEX = re.compile(r"\$([^$|\s]+)(?:\|[^$]*)?\$")
+
+Definition = collections.namedtuple("Definition", "relpath line value")
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+#############################
+
+def read_identifiers(name):
+    try:
+        text = hoi4pdxparser.read_file(name)
+    except OSError:
+        print("Could not read file " + name + "!")
+        return set()
+    identifiers = set(IDENTIFIER_REGEX.findall(text))
+    identifiers.discard("")
+    return identifiers
+
+def read_localisation(name):
+    # Returns (language, [(key, line, value)], keys used in values)
+    entries = list()
+    references = set()
+    try:
+        lines = hoi4pdxparser.read_file(name).splitlines()
+    except OSError:
+        print("Could not read file " + name + "!")
+        return (None, entries, references)
+    language = None
+    for line_number, line in enumerate(lines, 1):
+        match = LOC_ENTRY_REGEX.match(line)
+        if match:
+            entries.append((match.group(1), line_number, match.group(2)))
+            references.update(LOC_REFERENCE_REGEX.findall(match.group(2)))
+        elif language is None:
+            match = LOC_LANGUAGE_REGEX.match(line)
+            if match:
+                language = match.group(1)
+    if language is None:
+        match = LOC_FILE_LANGUAGE_REGEX.search(name)
+        if match:
+            language = match.group(1)
+    return (language, entries, references)
+
+def find_mod_files(mod_path):
+    scripts = list()
+    localisation = list()
+    for root, dirs, filenames in os.walk(mod_path):
+        dirs[:] = sorted(x for x in dirs if not x.startswith("."))
+        for filename in sorted(filenames):
+            extension = os.path.splitext(filename)[1].lower()
+            relpath = os.path.relpath(os.path.join(root, filename), mod_path).replace("\\", "/")
+            if extension in LOCALISATION_EXTENSIONS:
+                localisation.append(relpath)
+            elif extension in SCRIPT_EXTENSIONS:
+                scripts.append(relpath)
+    return scripts, localisation
+
+def is_used(key, used):
+    if key in used:
+        return True
+    for suffix in IMPLICIT_SUFFIXES:
+        if key.endswith(suffix) and key[:-len(suffix)] in used:
+            return True
+    return False
+
+def is_replace(relpath):
+    return "/replace/" in "/%s" % relpath.lower()
+
+def check_mod(mod_path, languages=None, exclude="", jobs=None):
+    # Returns (definitions, unused, duplicate, conflicting), where definitions is
+    # {language: {key: [Definition]}} and the others are sorted (language, key) lists
+    scripts, localisation = find_mod_files(mod_path)
+    used = set()
+    definitions = collections.defaultdict(dict)
+    with multiprocessing.Pool(jobs) as pool:
+        for identifiers in pool.imap_unordered(read_identifiers, [os.path.join(mod_path, x) for x in scripts], chunksize=16):
+            used |= identifiers
+        results = pool.imap(read_localisation, [os.path.join(mod_path, x) for x in localisation], chunksize=4)
+        for relpath, (language, entries, references) in zip(localisation, results):
+            used |= references
+            if language is None or (languages and language not in languages):
+                continue
+            language_definitions = definitions[language]
+            for key, line, value in entries:
+                language_definitions.setdefault(key, []).append(Definition(relpath, line, value))
+
+    exclude_regex = re.compile(exclude) if exclude else None
+    unused = list()
+    duplicate = list()
+    conflicting = list()
+    for language in sorted(definitions):
+        for key, key_definitions in sorted(definitions[language].items()):
+            if not is_used(key, used) and not (exclude_regex and exclude_regex.search(key)):
+                unused.append((language, key))
+            if len(key_definitions) > 1 and not any(is_replace(x.relpath) for x in key_definitions):
+                if len(set(x.value for x in key_definitions)) > 1:
+                    conflicting.append((language, key))
+                else:
+                    duplicate.append((language, key))
+    return (definitions, unused, duplicate, conflicting)
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a mod folder, report unused, duplicate and conflicting localisation keys.')
+    parser.add_argument('mod_path', metavar='mod_path',
+                        help='Path to the root mod folder')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes (Default: CPU count)')
+    parser.add_argument('-r', '--reports', nargs="*", choices=REPORTS, required=False, default=list(REPORTS),
+                        help='Which reports to print. unused - keys not used by any script, GUI, GFX or localisation file; duplicate - keys defined more than once in a language with the same value; conflicting - keys defined more than once in a language with different values (Default: all)')
+    parser.add_argument('-x', '--exclude', required=False, default="",
+                        help='Regular expression - matching keys are never reported as unused (eg. "^[A-Z]{3}_" for country names) (Default: "")')
+    parser.add_argument('-l', '--languages', nargs="*", required=False, default=[],
+                        help='Languages to check (Default: every language found)')
+    args = parser.parse_args()
+
+    try:
+        readable_dir(args.mod_path)
+    except:
+        sys.exit("%s is not a directory or does not exist." % args.mod_path)
+    try:
+        re.compile(args.exclude)
+    except re.error as e:
+        sys.exit("Invalid --exclude regular expression: %s" % e)
+
+    print("Checking localisation of %s..." % args.mod_path)
+    definitions, unused, duplicate, conflicting = check_mod(args.mod_path, args.languages, args.exclude, args.jobs)
+    found = {"unused": unused, "duplicate": duplicate, "conflicting": conflicting}
+    for report in REPORTS:
+        if report not in args.reports:
+            continue
+        print("\n%s %s keys:" % (len(found[report]), report.capitalize()))
+        for language, key in found[report]:
+            print("%s (%s):" % (key, language))
+            for definition in definitions[language][key]:
+                if report == "conflicting":
+                    print('\t%s:%s "%s"' % (definition.relpath, definition.line, definition.value))
+                else:
+                    print("\t%s:%s" % (definition.relpath, definition.line))
+    keys = sum(len(x) for x in definitions.values())
+    print("\nFinished, %s keys in %s languages checked" % (keys, len(definitions)))
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,6):
+        sys.exit("Wrong Python version. Version 3.6 or higher is required to run this script!")
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import multiprocessing
+import os
+import re
+import sys
+
+import hoi4pdxparser
+import hoi4newspaperheaderadded
+
+#############################
+###
+### HoI 4 Localisation Rewriter by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Rewrites localisation values of keys selected from script files, following
+### rules from a rules file (in PDX script format). Every script file is parsed
+### once (through the parse cache) for all rules, and every localisation file in
+### every language is read once - files which do not define any selected key are
+### skipped after a single search of their raw bytes. Files are only written if
+### they changed.
+###
+### A rule selects keys by:
+###   folder      Script folder, relative to the mod folder (Default: events)
+###   type        Key of the top-level block, eg. news_event (Default: any)
+###   path        Path of the block the field is in, relative to the top-level
+###               block, eg. option - keys are separated by /, * matches any key
+###               (Default: the top-level block itself)
+###   field       Key whose value is the localisation key, eg. title. If the value
+###               is a block, its text values are used (triggered titles and
+###               descriptions)
+###   key_suffix  Appended to the value to get the localisation key, eg. _desc
+###               (Default: "")
+### and changes their values with any of (applied in this order):
+###   replace, with  Regular expression and its replacement
+###   prefix         Added to the start of the value, unless it is already there
+###   suffix         Added to the end of the value, unless it is already there
+### Rules are applied in the order they are written in.
+###
+### Example rules file:
+###   rule = {
+###       type = news_event
+###       field = title
+###       prefix = "[This.GetNewspaperHeader]"
+###   }
+###   rule = {
+###       folder = common/national_focus
+###       type = focus_tree
+###       path = focus
+###       field = id
+###       key_suffix = _desc
+###       replace = "\[Root\.GetOldName\]"
+###       with = "[Root.GetName]"
+###   }
+###
+### usage: hoi4localisationrewriter.py [-h] [-c CACHE] [-j JOBS] [-n]
+###                                    mod_path rules
+###
+### Given a mod folder and a rules file, rewrite the localisation values of the
+### keys selected by the rules.
+###
+### positional arguments:
+###   mod_path              Path to the root mod folder
+###   rules                 Rules file
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -c CACHE, --cache CACHE
+###                         Parse cache folder (Default: MOD_PATH/.hoi4cache)
+###   -j JOBS, --jobs JOBS  Number of worker processes, 1 to run in this process
+###                         (Default: CPU count)
+###   -n, --dry_run         Only print which files would be modified (Default:
+###                         False)
+###
+#############################
+
+RULE_FIELDS = ("folder", "type", "path", "field", "key_suffix", "replace", "with", "prefix", "suffix")
+ACTION_FIELDS = ("replace", "prefix", "suffix")
+
+LOC_LINE_REGEX = re.compile(r'^(\s*([^#\s:]+):[0-9]*\s*")(.*)("[^"]*)$')
+
+Rule = collections.namedtuple("Rule", "folder type path field key_suffix replace replace_with prefix suffix")
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+class RuleError(Exception):
+    pass
+
+#############################
+
+def read_rules(name):
+    rules = list()
+    for node in hoi4pdxparser.parse_file(name):
+        if node.key is None or node.key.lower() != "rule" or not isinstance(node.value, list):
+            raise RuleError("line %s: expected rule = { ... }" % node.line)
+        values = dict()
+        for child in node.value:
+            if child.key is None or child.key.lower() not in RULE_FIELDS or isinstance(child.value, list):
+                raise RuleError("line %s: unknown rule field %s" % (child.line, child.key or child.value))
+            values[child.key.lower()] = hoi4pdxparser.unquote(child.value)
+        if "field" not in values:
+            raise RuleError("line %s: rule has no field" % node.line)
+        if not any(x in values for x in ACTION_FIELDS):
+            raise RuleError("line %s: rule has none of %s" % (node.line, ", ".join(ACTION_FIELDS)))
+        if ("replace" in values) != ("with" in values):
+            raise RuleError("line %s: replace and with must be used together" % node.line)
+        replace = None
+        if "replace" in values:
+            try:
+                replace = re.compile(values["replace"])
+            except re.error as e:
+                raise RuleError("line %s: invalid replace regular expression: %s" % (node.line, e))
+        path = values.get("path", "")
+        rules.append(Rule(values.get("folder", "events").replace("\\", "/").strip("/"),
+                          values["type"].lower() if "type" in values else None,
+                          tuple(x.lower() for x in path.split("/") if x),
+                          values["field"].lower(),
+                          values.get("key_suffix", ""),
+                          replace,
+                          values.get("with", ""),
+                          values.get("prefix", ""),
+                          values.get("suffix", "")))
+    return rules
+
+def _path_matches(path, rule_path):
+    if len(path) != len(rule_path):
+        return False
+    return all(y == "*" or (x is not None and x.lower() == y) for x, y in zip(path, rule_path))
+
+def select_keys(tree, rules):
+    # Yields (rule index, localisation key) for every key selected by the rules
+    for block in tree:
+        if block.key is None or not isinstance(block.value, list):
+            continue
+        block_type = block.key.lower()
+        block_rules = [(idx, rule) for idx, rule in rules if rule.type is None or rule.type == block_type]
+        if not block_rules:
+            continue
+        for path, node in hoi4pdxparser.walk(block.value):
+            if node.key is None:
+                continue
+            field = node.key.lower()
+            for idx, rule in block_rules:
+                if rule.field != field or not _path_matches(path, rule.path):
+                    continue
+                if isinstance(node.value, list):
+                    values = [x.value for x in hoi4pdxparser.find(node.value, "text") if not isinstance(x.value, list)]
+                else:
+                    values = [node.value]
+                for value in values:
+                    yield (idx, hoi4pdxparser.unquote(value) + rule.key_suffix)
+
+def rewrite_value(value, rules):
+    for rule in rules:
+        if rule.replace is not None:
+            value = rule.replace.sub(rule.replace_with, value)
+        if rule.prefix and not value.startswith(rule.prefix):
+            value = rule.prefix + value
+        if rule.suffix and not value.endswith(rule.suffix):
+            value = value + rule.suffix
+    return value
+
+def rewrite_lines(lines, key_rules):
+    new_lines = list()
+    has_changed = False
+    for line in lines:
+        match = LOC_LINE_REGEX.match(line)
+        if match and match.group(2) in key_rules:
+            value = rewrite_value(match.group(3), key_rules[match.group(2)])
+            if value != match.group(3):
+                line = match.group(1) + value + match.group(4)
+                has_changed = True
+        new_lines.append(line)
+    return (new_lines, has_changed)
+
+def rewrite_file(name, key_rules, loc_keys_re, dry_run=False):
+    # Returns None if the file was skipped, otherwise whether it was (or would be) modified
+    with open(name, "rb") as f:
+        data = f.read()
+    if not loc_keys_re.search(data):
+        return None
+    new_lines, has_changed = rewrite_lines(hoi4pdxparser.decode(data).splitlines(), key_rules)
+    if has_changed and not dry_run:
+        with open(name, "w", encoding="utf-8-sig") as f:
+            f.writelines(str(line) + "\n" for line in new_lines)
+    return has_changed
+
+_worker_args = None
+
+def _init_worker(key_rules, dry_run):
+    # The selected keys are sent to every worker once instead of with every file
+    global _worker_args
+    _worker_args = (key_rules, hoi4newspaperheaderadded.get_loc_keys_re(key_rules.keys()), dry_run)
+
+def _rewrite_file_worker(name):
+    return (name, rewrite_file(name, *_worker_args))
+
+def find_localisation_files(loc_path):
+    files = list()
+    for root, dirs, filenames in os.walk(loc_path):
+        dirs.sort()
+        files.extend(os.path.join(root, x) for x in sorted(filenames) if x.endswith(".yml"))
+    return files
+
+def rewrite_mod(mod_path, rules, jobs=None, cache=None, dry_run=False):
+    # Returns (selected keys, localisation files read, modified files)
+    rules_by_folder = collections.OrderedDict()
+    for idx, rule in enumerate(rules):
+        rules_by_folder.setdefault(rule.folder, list()).append((idx, rule))
+    if cache is None:
+        cache = hoi4pdxparser.ParseCache(hoi4pdxparser.default_cache_dir(mod_path))
+    key_rule_indexes = dict()
+    for folder, folder_rules in rules_by_folder.items():
+        files = hoi4pdxparser.find_files(os.path.join(mod_path, folder), (".txt",), recursive=False)
+        files = [x for x in files if os.path.isfile(x)]
+        for name, tree in cache.load_many(files, jobs):
+            for idx, key in select_keys(tree, folder_rules):
+                key_rule_indexes.setdefault(key, set()).add(idx)
+    cache.save()
+    key_rules = {key: [rules[x] for x in sorted(indexes)] for key, indexes in key_rule_indexes.items()}
+    if not key_rules:
+        return (0, 0, [])
+
+    loc_files = find_localisation_files(os.path.join(mod_path, "localisation"))
+    modified = list()
+    skipped = 0
+    pool = None
+    if jobs == 1:
+        _init_worker(key_rules, dry_run)
+        results = map(_rewrite_file_worker, loc_files)
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (key_rules, dry_run))
+        results = pool.imap(_rewrite_file_worker, loc_files, chunksize=4)
+    try:
+        for name, has_changed in results:
+            if has_changed is None:
+                skipped += 1
+            elif has_changed:
+                modified.append(name)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return (len(key_rules), len(loc_files) - skipped, modified)
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a mod folder and a rules file, rewrite the localisation values of the keys selected by the rules.')
+    parser.add_argument('mod_path', metavar='mod_path',
+                        help='Path to the root mod folder')
+    parser.add_argument('rules', metavar='rules',
+                        help='Rules file')
+    parser.add_argument('-c', '--cache', required=False, default="",
+                        help='Parse cache folder (Default: MOD_PATH/.hoi4cache)')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes, 1 to run in this process (Default: CPU count)')
+    parser.add_argument('-n', '--dry_run', action='store_true', required=False, default=False,
+                        help='Only print which files would be modified (Default: False)')
+    args = parser.parse_args()
+
+    try:
+        readable_dir(args.mod_path)
+    except:
+        sys.exit("%s is not a directory or does not exist." % args.mod_path)
+    try:
+        rules = read_rules(args.rules)
+    except OSError:
+        sys.exit("Could not read rules file %s!" % args.rules)
+    except RuleError as e:
+        sys.exit("Invalid rules file %s, %s" % (args.rules, e))
+    print("Read %s rules from %s" % (len(rules), args.rules))
+
+    cache = hoi4pdxparser.ParseCache(args.cache or hoi4pdxparser.default_cache_dir(args.mod_path))
+    keys, read, modified = rewrite_mod(args.mod_path, rules, args.jobs, cache, args.dry_run)
+    for name in modified:
+        if args.dry_run:
+            print("File %s would be modified" % name)
+        else:
+            print("File %s modified successfully!" % name)
+    print("Finished, %s keys selected, %s localisation files read, %s modified" % (keys, read, len(modified)))
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,6):
+        sys.exit("Wrong Python version. Version 3.6 or higher is required to run this script!")
+    main()
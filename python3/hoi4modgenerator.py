@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+import argparse
+import os
+import random
+import shutil
+import sys
+
+#############################
+###
+### HoI 4 Synthetic Mod Generator by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Generates a synthetic mod to test and benchmark the other scripts on (see
+### hoi4benchmark.py). The same seed and sizes always give the same mod. Only
+### part of the localisation and GFX entries are generated and some lines are
+### indented wrong, so every script has something to do.
+###
+### usage: hoi4modgenerator.py [-h] [-s SCALE] [--events EVENTS]
+###                            [--focuses FOCUSES] [--ideas IDEAS]
+###                            [--techs TECHS] [--localisation LOCALISATION]
+###                            [--gfx GFX] [--per_file PER_FILE] [--seed SEED]
+###                            [-o]
+###                            output
+###
+### Given an output folder, generate a synthetic mod with event, national_focus,
+### idea, technology, localisation and GFX files.
+###
+### positional arguments:
+###   output                Folder to generate the mod in
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -s SCALE, --scale SCALE
+###                         Multiplies the default number of files of every type
+###                         (Default: 1)
+###   --events EVENTS       Number of event files (Default: 10 * SCALE)
+###   --focuses FOCUSES     Number of national_focus files (Default: 2 * SCALE)
+###   --ideas IDEAS         Number of idea files (Default: 4 * SCALE)
+###   --techs TECHS         Number of technology files (Default: 4 * SCALE)
+###   --localisation LOCALISATION
+###                         Number of localisation files (Default: 4 * SCALE)
+###   --gfx GFX             Number of GFX files besides goals.gfx and
+###                         goals_shine.gfx (Default: 2 * SCALE)
+###   --per_file PER_FILE   Number of events, focuses, ideas, technologies or
+###                         sprites in every file (Default: 50)
+###   --seed SEED           Random seed (Default: 0)
+###   -o, --overwrite       Delete the output folder first if it already exists
+###
+#############################
+
+EVENT_FOLDER = "events"
+FOCUS_FOLDER = "common/national_focus"
+IDEA_FOLDER = "common/ideas"
+TECH_FOLDER = "common/technologies"
+LOC_FOLDER = "localisation"
+GFX_FOLDER = "interface"
+
+# Share of localisation keys and GFX entries which are already defined
+DEFINED_SHARE = 0.5
+# Share of lines indented wrong
+MISINDENTED_SHARE = 0.2
+
+# (name, default count, help)
+DEFAULT_COUNTS = (
+    ("events", 10, "event files"),
+    ("focuses", 2, "national_focus files"),
+    ("ideas", 4, "idea files"),
+    ("techs", 4, "technology files"),
+    ("localisation", 4, "localisation files"),
+    ("gfx", 2, "GFX files besides goals.gfx and goals_shine.gfx"),
+)
+
+#############################
+
+def indent(rng, depth):
+    if rng.random() < MISINDENTED_SHARE:
+        return rng.choice(["", " ", "    ", "\t\t\t"])
+    return "\t" * depth
+
+def write_file(name, lines, encoding="utf-8"):
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    with open(name, "w", encoding=encoding) as f:
+        f.writelines(line + "\n" for line in lines)
+    return len(lines)
+
+def event_lines(rng, file_idx, per_file, loc_keys):
+    namespace = "generated_%s" % file_idx
+    lines = ["add_namespace = %s" % namespace, ""]
+    for idx in range(1, per_file + 1):
+        event_id = "%s.%s" % (namespace, idx)
+        is_news = idx % 5 == 0
+        lines.append("%s = {" % ("news_event" if is_news else "country_event"))
+        lines.append("%sid = %s" % (indent(rng, 1), event_id))
+        if idx % 7 == 0:
+            lines.append("%stitle = {" % indent(rng, 1))
+            for suffix in ("a", "b"):
+                lines.append("%stext = %s.t.%s" % (indent(rng, 2), event_id, suffix))
+                lines.append("%strigger = { has_country_flag = flag_%s_%s }" % (indent(rng, 2), idx, suffix))
+                loc_keys.append(("%s.t.%s" % (event_id, suffix), is_news))
+            lines.append("%s}" % indent(rng, 1))
+        else:
+            lines.append("%stitle = %s.t # title" % (indent(rng, 1), event_id))
+            loc_keys.append(("%s.t" % event_id, is_news))
+        lines.append("%sdesc = %s.d" % (indent(rng, 1), event_id))
+        loc_keys.append(("%s.d" % event_id, False))
+        lines.append("%spicture = GFX_report_event_generic" % indent(rng, 1))
+        lines.append("%sis_triggered_only = yes" % indent(rng, 1))
+        for option in ("a", "b")[:rng.randint(1, 2)]:
+            lines.append("%soption = {" % indent(rng, 1))
+            lines.append("%sname = %s.%s" % (indent(rng, 2), event_id, option))
+            loc_keys.append(("%s.%s" % (event_id, option), False))
+            lines.append("%sadd_political_power = %s" % (indent(rng, 2), rng.randint(-100, 100)))
+            lines.append("%s}" % indent(rng, 1))
+        lines.append("}")
+        lines.append("")
+    return lines
+
+def focus_lines(rng, file_idx, per_file, loc_keys, sprites):
+    tree_id = "generated_focus_tree_%s" % file_idx
+    lines = ["focus_tree = {", "%sid = %s" % (indent(rng, 1), tree_id),
+             "%scountry = { factor = 0 }" % indent(rng, 1)]
+    for idx in range(per_file):
+        focus_id = "GEN_%s_focus_%s" % (file_idx, idx)
+        lines.append("%sfocus = {" % indent(rng, 1))
+        lines.append("%sid = %s" % (indent(rng, 2), focus_id))
+        lines.append("%sicon = GFX_goal_%s" % (indent(rng, 2), focus_id))
+        sprites.append(("GFX_goal_%s" % focus_id, "gfx/interface/goals/%s.dds" % focus_id))
+        if idx > 0:
+            lines.append("%sprerequisite = { focus = GEN_%s_focus_%s }" % (indent(rng, 2), file_idx, rng.randrange(idx)))
+        lines.append("%sx = %s" % (indent(rng, 2), idx % 20))
+        lines.append("%sy = %s" % (indent(rng, 2), idx // 20))
+        lines.append("%scost = 10" % indent(rng, 2))
+        lines.append("%scompletion_reward = {" % indent(rng, 2))
+        lines.append("%sadd_political_power = 50" % indent(rng, 3))
+        lines.append("%s}" % indent(rng, 2))
+        lines.append("%s}" % indent(rng, 1))
+        loc_keys.append((focus_id, False))
+        loc_keys.append((focus_id + "_desc", False))
+    lines.append("}")
+    return lines
+
+def idea_lines(rng, file_idx, per_file, loc_keys):
+    lines = ["ideas = {", "%scountry = {" % indent(rng, 1)]
+    for idx in range(per_file):
+        idea_id = "generated_idea_%s_%s" % (file_idx, idx)
+        lines.append("%s%s = {" % ("\t\t", idea_id))
+        if idx % 3 == 0:
+            lines.append("%spicture = generated_picture_%s" % ("\t\t\t", idx))
+        lines.append("%smodifier = {" % indent(rng, 3))
+        lines.append("%sstability_factor = 0.%s" % (indent(rng, 4), rng.randint(1, 9)))
+        lines.append("%s}" % indent(rng, 3))
+        lines.append("%s}" % "\t\t")
+        loc_keys.append((idea_id, False))
+        loc_keys.append((idea_id + "_desc", False))
+    lines.append("%s}" % "\t")
+    lines.append("}")
+    return lines
+
+def tech_lines(rng, file_idx, per_file):
+    lines = ["technologies = {"]
+    for idx in range(per_file):
+        tech_id = "generated_tech_%s_%s" % (file_idx, idx)
+        lines.append("\t%s = {" % tech_id)
+        lines.append("%sresearch_cost = %s" % (indent(rng, 2), rng.choice(["1", "1.5", "2"])))
+        lines.append("%sstart_year = %s" % (indent(rng, 2), 1936 + idx % 10))
+        if idx + 1 < per_file:
+            lines.append("%spath = {" % indent(rng, 2))
+            lines.append("%sleads_to_tech = generated_tech_%s_%s" % (indent(rng, 3), file_idx, idx + 1))
+            lines.append("%sresearch_cost_coeff = 1" % indent(rng, 3))
+            lines.append("%s}" % indent(rng, 2))
+        lines.append("%scategories = { infantry_weapons }" % indent(rng, 2))
+        lines.append("\t}")
+    lines.append("}")
+    return lines
+
+def sprite_lines(sprites):
+    lines = ["spriteTypes = {"]
+    for name, texture in sprites:
+        lines.append("\tSpriteType = {")
+        lines.append("\t\tname = \"%s\"" % name)
+        lines.append("\t\ttexturefile = \"%s\"" % texture)
+        lines.append("\t}")
+    lines.append("}")
+    return lines
+
+def generate_mod(output, counts, per_file=50, seed=0):
+    # Returns {folder relative to the mod: (files, lines)}
+    rng = random.Random(seed)
+    stats = dict()
+
+    def add_stats(folder, line_count):
+        files, lines = stats.get(folder, (0, 0))
+        stats[folder] = (files + 1, lines + line_count)
+
+    loc_keys = list()
+    for idx in range(counts["events"]):
+        add_stats(EVENT_FOLDER, write_file(os.path.join(output, EVENT_FOLDER, "generated_events_%s.txt" % idx),
+                                           event_lines(rng, idx, per_file, loc_keys)))
+    goal_sprites = list()
+    for idx in range(counts["focuses"]):
+        add_stats(FOCUS_FOLDER, write_file(os.path.join(output, FOCUS_FOLDER, "generated_focus_%s.txt" % idx),
+                                           focus_lines(rng, idx, per_file, loc_keys, goal_sprites)))
+    for idx in range(counts["ideas"]):
+        add_stats(IDEA_FOLDER, write_file(os.path.join(output, IDEA_FOLDER, "generated_ideas_%s.txt" % idx),
+                                          idea_lines(rng, idx, per_file, loc_keys)))
+    for idx in range(counts["techs"]):
+        add_stats(TECH_FOLDER, write_file(os.path.join(output, TECH_FOLDER, "generated_techs_%s.txt" % idx),
+                                          tech_lines(rng, idx, per_file)))
+
+    # Only some of the keys are localised, spread evenly over the files
+    defined_keys = [x for x in loc_keys if rng.random() < DEFINED_SHARE]
+    loc_count = max(counts["localisation"], 1)
+    for idx in range(loc_count):
+        lines = ["l_english:"]
+        for key, is_news in defined_keys[idx::loc_count]:
+            lines.append(" %s:0 \"%s%s\"" % (key, "Breaking news: " if is_news else "", key.replace("_", " ")))
+        add_stats(LOC_FOLDER, write_file(os.path.join(output, LOC_FOLDER, "generated_%s_l_english.yml" % idx),
+                                         lines, encoding="utf-8-sig"))
+
+    add_stats(GFX_FOLDER, write_file(os.path.join(output, GFX_FOLDER, "goals.gfx"), sprite_lines(goal_sprites)))
+    shine_sprites = [("%s_shine" % name, texture) for name, texture in goal_sprites if rng.random() < DEFINED_SHARE]
+    add_stats(GFX_FOLDER, write_file(os.path.join(output, GFX_FOLDER, "goals_shine.gfx"), sprite_lines(shine_sprites)))
+    for idx in range(counts["gfx"]):
+        sprites = [("GFX_generated_%s_%s" % (idx, x), "gfx/interface/generated/%s.dds" % x) for x in range(per_file)]
+        add_stats(GFX_FOLDER, write_file(os.path.join(output, GFX_FOLDER, "generated_%s.gfx" % idx), sprite_lines(sprites)))
+    return stats
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given an output folder, generate a synthetic mod with event, national_focus, idea, technology, localisation and GFX files.')
+    parser.add_argument('output', metavar='output',
+                        help='Folder to generate the mod in')
+    parser.add_argument('-s', '--scale', type=int, required=False, default=1,
+                        help='Multiplies the default number of files of every type (Default: 1)')
+    for name, count, description in DEFAULT_COUNTS:
+        parser.add_argument('--%s' % name, type=int, required=False, default=None,
+                            help='Number of %s (Default: %s * SCALE)' % (description, count))
+    parser.add_argument('--per_file', type=int, required=False, default=50,
+                        help='Number of events, focuses, ideas, technologies or sprites in every file (Default: 50)')
+    parser.add_argument('--seed', type=int, required=False, default=0,
+                        help='Random seed (Default: 0)')
+    parser.add_argument('-o', '--overwrite', action='store_true', required=False, default=False,
+                        help='Delete the output folder first if it already exists')
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        if not args.overwrite:
+            sys.exit("Folder " + args.output + " already exists. Use -o parameter if you want to overwrite.")
+        shutil.rmtree(args.output)
+    counts = dict()
+    for name, count, description in DEFAULT_COUNTS:
+        counts[name] = getattr(args, name) if getattr(args, name) is not None else count * args.scale
+    print("Generating mod in %s..." % args.output)
+    stats = generate_mod(args.output, counts, args.per_file, args.seed)
+    for folder, (files, lines) in sorted(stats.items()):
+        print("%s - %s files, %s lines" % (folder, files, lines))
+    print("Finished, %s files, %s lines" % (sum(x[0] for x in stats.values()), sum(x[1] for x in stats.values())))
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,6):
+        sys.exit("Wrong Python version. Version 3.6 or higher is required to run this script!")
+    main()
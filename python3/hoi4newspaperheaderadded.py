@@ -5,6 +5,7 @@ import sys
 import re
 import collections
 import glob
+import multiprocessing
 
 #############################
 ###
@@ -16,7 +17,13 @@ import glob
 ### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
 ### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ###
-### usage: hoi4newspaperheaderadded.py [-h] [--scripted_loc scripted_loc] mod_path
+### Event and localisation files are processed in parallel. Localisation files
+### which do not define any news event title are skipped after a single search of
+### their raw bytes, and files are only written if they changed.
+###
+### usage: hoi4newspaperheaderadded.py [-h] [--scripted_loc scripted_loc]
+###                                    [-j JOBS]
+###                                    mod_path
 ### 
 ### Given a mod folder, add a scripted localisation call to every news event title
 ### (including triggered titles).
@@ -30,6 +37,8 @@ import glob
 ###                         The full string (including brackets) to prefix
 ###                         localisation values with (Default:
 ###                         [This.GetNewspaperHeader])
+###   -j JOBS, --jobs JOBS  Number of worker processes, 1 to run in this process
+###                         (Default: CPU count)
 ### 
 #############################
 
@@ -43,23 +52,17 @@ def readable_dir(prospective_dir):
 
 #############################
 
-def read_event_file(name, loc_set):
-    print("Reading file " + name + "...")
-    lines = []
-    try:
-        with open(name, "r") as f:
-            lines = f.read().splitlines()
-    except:
+def read_lines(name, encodings):
+    for encoding in encodings:
         try:
-            with open(name, "r", encoding='utf-8') as f:
-                lines = f.read().splitlines()
+            with open(name, "r", encoding=encoding) as f:
+                return f.read().splitlines()
         except:
-            try:
-                with open(name, "r", encoding='utf-8-sig') as f:
-                    lines = f.read().splitlines()
-            except:
-                print("Could not read file " + name + "!")
+            pass
+    print("Could not read file " + name + "!")
+    return []
 
+def find_news_titles(lines, loc_set):
     open_blocks = 0
     is_in_news_event = False
     is_in_title = False
@@ -85,19 +88,13 @@ def read_event_file(name, loc_set):
             is_in_title = False
         if is_in_news_event and open_blocks == 0:
             is_in_news_event = False
+    return loc_set
 
-    print("File " + name + " read successfully!")
-    return
+def get_scripted_loc_re(scripted_loc):
+    scripted_loc_re_string = r'(\s*?[^\s]*?:[0-9]+\s*)(\")(?!' + re.escape(scripted_loc) + r')'
+    return re.compile(scripted_loc_re_string, re.IGNORECASE)
 
-def read_loc_file(name, loc_set, scripted_loc_re, scripted_loc):
-    print("Reading file " + name + "...")
-    lines = []
-    try:
-        with open(name, "r", encoding='utf-8-sig') as f:
-            lines = f.read().splitlines()
-    except:
-        print("Could not read file " + name + "!")
-    print("File " + name + " read successfully!")
+def add_scripted_loc(lines, loc_set, scripted_loc_re, scripted_loc):
     new_lines = []
     has_changed = False
     for line in lines:
@@ -105,51 +102,125 @@ def read_loc_file(name, loc_set, scripted_loc_re, scripted_loc):
         if match:
             loc_key = match.group(1).strip()
             if loc_key in loc_set:
-                line = scripted_loc_re.sub("\\1\\2" + scripted_loc, line)
-                has_changed = True
+                new_line = scripted_loc_re.sub("\\1\\2" + scripted_loc, line)
+                if new_line != line:
+                    line = new_line
+                    has_changed = True
         new_lines.append(line)
+    return (new_lines, has_changed)
+
+def _keys_trie_re(trie):
+    alternatives = [re.escape(bytes((x,))) + _keys_trie_re(trie[x]) for x in sorted(x for x in trie if x is not None)]
+    if not alternatives:
+        return b""
+    if len(alternatives) == 1 and None not in trie:
+        return alternatives[0]
+    return b"(?:" + b"|".join(alternatives) + b")" + (b"?" if None in trie else b"")
+
+def get_loc_keys_re(loc_set):
+    # One search over the raw bytes of a file for a definition of any of the keys.
+    # The keys are merged into a trie first, so the regex does not try every key
+    # at every position
+    trie = dict()
+    for key in loc_set:
+        node = trie
+        for byte in key.encode("utf-8"):
+            node = node.setdefault(byte, dict())
+        node[None] = None
+    return re.compile(rb"^[ \t]*" + _keys_trie_re(trie) + rb":[0-9]", re.MULTILINE)
+
+def read_event_file(name):
+    lines = read_lines(name, [None, 'utf-8', 'utf-8-sig'])
+    return find_news_titles(lines, set())
+
+def read_loc_file(name, loc_set, scripted_loc_re, scripted_loc, loc_keys_re=None):
+    # Returns None if the file was skipped, otherwise whether it was modified
+    if loc_keys_re is not None:
+        try:
+            with open(name, "rb") as f:
+                if not loc_keys_re.search(f.read()):
+                    return None
+        except OSError:
+            pass
+    lines = read_lines(name, ['utf-8-sig'])
+    new_lines, has_changed = add_scripted_loc(lines, loc_set, scripted_loc_re, scripted_loc)
     if has_changed:
         with open(name, "w", encoding="utf-8-sig") as f:
             f.writelines(str(line) + "\n" for line in new_lines)
-        print("File " + name + " modified successfully!")
-    return
-###################################################################
-parser = argparse.ArgumentParser(description='Given a mod folder, add a scripted localisation call to every news event title (including triggered titles).')
-parser.add_argument('mod_path', metavar='mod_path',
-                    help='Path to the root mod folder')
-parser.add_argument( '--scripted_loc', metavar='scripted_loc', default="[This.GetNewspaperHeader]", required=False,
-                    help='The full string (including brackets) to prefix localisation values with (Default: [This.GetNewspaperHeader])')
-
-args = parser.parse_args()
+    return has_changed
 
-events_path = os.path.join(args.mod_path, 'events')
-loc_path = os.path.join(args.mod_path, 'localisation')
+_worker_args = None
 
-try:
-    dir = readable_dir(events_path)
-except:
-    print("{0} is not a directory or does not exist." % events_path)
+def _init_loc_worker(loc_set, scripted_loc):
+    # The key set and regexes are sent to every worker once instead of with every file
+    global _worker_args
+    _worker_args = (loc_set, get_scripted_loc_re(scripted_loc), scripted_loc, get_loc_keys_re(loc_set))
 
-try:
-    dir = readable_dir(loc_path)
-except:
-    print("{0} is not a directory or does not exist." % loc_path)
-
-loc_set = set()
+def _read_loc_file_worker(name):
+    return (name, read_loc_file(name, *_worker_args))
+###################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Given a mod folder, add a scripted localisation call to every news event title (including triggered titles).')
+    parser.add_argument('mod_path', metavar='mod_path',
+                        help='Path to the root mod folder')
+    parser.add_argument( '--scripted_loc', metavar='scripted_loc', default="[This.GetNewspaperHeader]", required=False,
+                        help='The full string (including brackets) to prefix localisation values with (Default: [This.GetNewspaperHeader])')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes, 1 to run in this process (Default: CPU count)')
 
-for file in glob.glob(os.path.join(events_path, '*.txt')):
-    read_event_file(file, loc_set)
+    args = parser.parse_args()
 
-scripted_loc = args.scripted_loc.strip()
-scripted_loc_re_string = r'(\s*?[^\s]*?:[0-9]+\s*)(\")(?!' + re.escape(scripted_loc) + r')'
-scripted_loc_re = re.compile(scripted_loc_re_string, re.IGNORECASE)
+    events_path = os.path.join(args.mod_path, 'events')
+    loc_path = os.path.join(args.mod_path, 'localisation')
 
-for file in glob.glob(os.path.join(loc_path, '*.yml'), recursive=True):
-    read_loc_file(file, loc_set, scripted_loc_re, scripted_loc)
+    try:
+        dir = readable_dir(events_path)
+    except:
+        print("{0} is not a directory or does not exist.".format(events_path))
 
-try:
-    dir = readable_dir(os.path.join(loc_path, "replace"))
-    for file in glob.glob(os.path.join(loc_path, "replace", '*.yml'), recursive=True):
-        read_loc_file(file, loc_set, scripted_loc_re, scripted_loc)
-except:
-    pass
+    try:
+        dir = readable_dir(loc_path)
+    except:
+        print("{0} is not a directory or does not exist.".format(loc_path))
+
+    loc_set = set()
+
+    event_files = glob.glob(os.path.join(events_path, '*.txt'))
+    print("Reading %s event files..." % len(event_files))
+    if args.jobs == 1:
+        for file in event_files:
+            loc_set |= read_event_file(file)
+    else:
+        with multiprocessing.Pool(args.jobs) as pool:
+            for news_titles in pool.imap_unordered(read_event_file, event_files, chunksize=8):
+                loc_set |= news_titles
+    print("%s news event titles found" % len(loc_set))
+    if not loc_set:
+        return
+
+    scripted_loc = args.scripted_loc.strip()
+
+    loc_files = glob.glob(os.path.join(loc_path, '*.yml'), recursive=True)
+    loc_files += glob.glob(os.path.join(loc_path, "replace", '*.yml'), recursive=True)
+    skipped = 0
+    pool = None
+    if args.jobs == 1:
+        _init_loc_worker(loc_set, scripted_loc)
+        results = map(_read_loc_file_worker, loc_files)
+    else:
+        pool = multiprocessing.Pool(args.jobs, _init_loc_worker, (loc_set, scripted_loc))
+        results = pool.imap(_read_loc_file_worker, loc_files, chunksize=4)
+    try:
+        for file, has_changed in results:
+            if has_changed is None:
+                skipped += 1
+            elif has_changed:
+                print("File " + file + " modified successfully!")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    print("%s localisation files read, %s skipped" % (len(loc_files) - skipped, skipped))
+
+if __name__ == "__main__":
+    main()
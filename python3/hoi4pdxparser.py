@@ -0,0 +1,346 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import hashlib
+import multiprocessing
+import json
+import os
+import re
+import sys
+import zlib
+
+#############################
+###
+### HoI 4 PDX Script Parser and Parse Cache by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Shared module - the other Python 3 scripts import it from the same folder.
+### Parsed script trees are cached on disk in a content-addressed cache, keyed by
+### path, size, mtime and a SHA-1 of the file contents. Trees are stored as
+### zlib-compressed JSON, so warm runs only stat files and load the cache. Caches
+### live inside mod folders, which are downloaded and shared, so they must not be
+### able to run code when loaded (unlike pickles) - a malformed cache file is
+### simply treated as a miss.
+###
+### A tree is a list of Node(key, op, value, line, start, end) tuples, where value
+### is either a string or another tree. Bare values (eg. provinces = { 1 2 3 })
+### have key and op set to None. start and end are character offsets of the value
+### in the decoded file.
+###
+### usage: hoi4pdxparser.py [-h] [-c CACHE] [-j JOBS] [--extensions [EXTENSIONS [EXTENSIONS ...]]]
+###                         input
+###
+### Given a file or folder, parse PDX script files and store them in the parse
+### cache (warming it for the other scripts).
+###
+### positional arguments:
+###   input                 File or folder (searched recursively) to parse
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -c CACHE, --cache CACHE
+###                         Cache folder (Default: INPUT/.hoi4cache for folders,
+###                         .hoi4cache next to the file otherwise)
+###   -j JOBS, --jobs JOBS  Number of worker processes (Default: CPU count)
+###   --extensions [EXTENSIONS [EXTENSIONS ...]]
+###                         Which file extensions should be parsed (Default: .txt
+###                         .gfx .gui)
+###
+#############################
+
+CACHE_VERSION = 2
+CACHE_FOLDER_NAME = ".hoi4cache"
+DIGEST_REGEX = re.compile(r"[0-9a-f]{40}")
+
+TOKEN_REGEX = re.compile(r"""
+    (?P<newline>\n)
+   |(?P<whitespace>[ \t\r\f\v]+)
+   |(?P<comment>\#[^\n]*)
+   |(?P<string>"[^"\n]*"?)
+   |(?P<open>\{)
+   |(?P<close>\})
+   |(?P<operator><=|>=|!=|==|=|<|>)
+   |(?P<word>(?:[^\s{}=<>!"\#]|!(?!=))+)
+""", re.VERBOSE)
+
+Token = collections.namedtuple("Token", "type value line start end")
+Node = collections.namedtuple("Node", "key op value line start end")
+
+#############################
+
+def decode(data):
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+def read_file(name):
+    with open(name, "rb") as f:
+        return decode(f.read())
+
+def tokenize(text, keep_comments=False, keep_newlines=False):
+    line = 1
+    for match in TOKEN_REGEX.finditer(text):
+        kind = match.lastgroup
+        if kind == "newline":
+            if keep_newlines:
+                yield Token(kind, "\n", line, match.start(), match.end())
+            line += 1
+        elif kind == "whitespace":
+            continue
+        elif kind == "comment" and not keep_comments:
+            continue
+        else:
+            yield Token(kind, match.group(), line, match.start(), match.end())
+
+def parse(text):
+    root = list()
+    stack = list()
+    current = root
+    key = None
+    op = None
+    for token in tokenize(text):
+        kind = token.type
+        if kind == "word" or kind == "string":
+            if key is not None and op is not None:
+                current.append(Node(key.value, op, token.value, key.line, token.start, token.end))
+                key = None
+                op = None
+            else:
+                if key is not None:
+                    current.append(Node(None, None, key.value, key.line, key.start, key.end))
+                key = token
+        elif kind == "operator":
+            if key is not None:
+                op = token.value
+        elif kind == "open":
+            stack.append((current, key, op, token))
+            current = list()
+            key = None
+            op = None
+        elif kind == "close":
+            if key is not None:
+                current.append(Node(None, None, key.value, key.line, key.start, key.end))
+                key = None
+                op = None
+            if not stack:
+                continue
+            block = current
+            current, block_key, block_op, open_token = stack.pop()
+            if block_key is None:
+                current.append(Node(None, None, block, open_token.line, open_token.start, token.end))
+            else:
+                current.append(Node(block_key.value, block_op, block, block_key.line, open_token.start, token.end))
+    if key is not None:
+        current.append(Node(None, None, key.value, key.line, key.start, key.end))
+    while stack:
+        block = current
+        current, block_key, block_op, open_token = stack.pop()
+        block_name = block_key.value if block_key is not None else None
+        line = block_key.line if block_key is not None else open_token.line
+        current.append(Node(block_name, block_op, block, line, open_token.start, len(text)))
+    return root
+
+def parse_file(name):
+    return parse(read_file(name))
+
+def find(tree, key):
+    key = key.lower()
+    for node in tree:
+        if node.key is not None and node.key.lower() == key:
+            yield node
+
+def get_value(tree, key, default=None):
+    return next((node.value for node in find(tree, key)), default)
+
+def walk(tree, path=()):
+    for node in tree:
+        yield (path, node)
+        if isinstance(node.value, list):
+            yield from walk(node.value, path + (node.key,))
+
+def unquote(value):
+    if isinstance(value, str) and len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+#############################
+
+def default_cache_dir(name):
+    if os.path.isdir(name):
+        return os.path.join(name, CACHE_FOLDER_NAME)
+    return os.path.join(os.path.dirname(os.path.abspath(name)), CACHE_FOLDER_NAME)
+
+def _object_path(cache_dir, digest):
+    return os.path.join(cache_dir, "objects", digest[:2], "%s.%s" % (digest, CACHE_VERSION))
+
+def _write_atomic(name, data):
+    temp_name = "%s.%s.tmp" % (name, os.getpid())
+    with open(temp_name, "wb") as f:
+        f.write(data)
+    os.replace(temp_name, name)
+
+def _to_tree(data):
+    # Rebuilds Nodes from the JSON arrays, rejecting anything that is not a tree
+    tree = list()
+    for key, op, value, line, start, end in data:
+        if isinstance(value, list):
+            value = _to_tree(value)
+        elif not isinstance(value, str):
+            raise ValueError("invalid node value")
+        tree.append(Node(key, op, value, line, start, end))
+    return tree
+
+def _load_object(cache_dir, digest):
+    try:
+        with open(_object_path(cache_dir, digest), "rb") as f:
+            return _to_tree(json.loads(zlib.decompress(f.read()).decode("utf-8")))
+    except Exception:
+        return None
+
+def _store_object(cache_dir, digest, tree):
+    name = _object_path(cache_dir, digest)
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    _write_atomic(name, zlib.compress(json.dumps(tree, separators=(",", ":")).encode("utf-8")))
+
+def _load_changed(cache_dir, path):
+    # Runs both in-process and in pool workers; returns the new index entry
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    # Touched or copied files with known contents are still cache hits
+    tree = _load_object(cache_dir, digest)
+    hit = tree is not None
+    if not hit:
+        tree = parse(decode(data))
+        _store_object(cache_dir, digest, tree)
+    return (path, (st.st_size, st.st_mtime_ns, digest), tree, hit)
+
+def _load_changed_worker(job):
+    return _load_changed(*job)
+
+class ParseCache():
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index = dict()
+        self.hits = 0
+        self.misses = 0
+        self.has_changed = False
+        try:
+            with open(self.index_path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+            if data["version"] == CACHE_VERSION:
+                self.index = {path: (int(size), int(mtime), digest) for path, (size, mtime, digest) in data["index"].items() if DIGEST_REGEX.fullmatch(digest)}
+        except Exception:
+            pass
+
+    def _lookup_unchanged(self, path):
+        entry = self.index.get(path)
+        if entry is None:
+            return None
+        st = os.stat(path)
+        if entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            return None
+        return _load_object(self.cache_dir, entry[2])
+
+    def _update(self, path, entry, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.index.get(path) != entry:
+            self.index[path] = entry
+            self.has_changed = True
+
+    def load(self, name):
+        path = os.path.abspath(name)
+        tree = self._lookup_unchanged(path)
+        if tree is not None:
+            self.hits += 1
+            return tree
+        path, entry, tree, hit = _load_changed(self.cache_dir, path)
+        self._update(path, entry, hit)
+        return tree
+
+    def load_many(self, names, jobs=None):
+        # Yields (name, tree) in the order given, parsing misses in a process pool
+        paths = [os.path.abspath(name) for name in names]
+        trees = dict()
+        changed = list()
+        for path in paths:
+            tree = self._lookup_unchanged(path)
+            if tree is not None:
+                self.hits += 1
+                trees[path] = tree
+            else:
+                changed.append((self.cache_dir, path))
+        if len(changed) > 1 and jobs != 1:
+            with multiprocessing.Pool(jobs) as pool:
+                results = pool.imap(_load_changed_worker, changed, chunksize=8)
+                for path, entry, tree, hit in results:
+                    self._update(path, entry, hit)
+                    trees[path] = tree
+        else:
+            for job in changed:
+                path, entry, tree, hit = _load_changed(*job)
+                self._update(path, entry, hit)
+                trees[path] = tree
+        for name, path in zip(names, paths):
+            yield (name, trees[path])
+
+    def save(self):
+        if not self.has_changed:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path in [x for x in self.index if not os.path.exists(x)]:
+            del self.index[path]
+        _write_atomic(self.index_path, zlib.compress(json.dumps({"version": CACHE_VERSION, "index": self.index}, separators=(",", ":")).encode("utf-8")))
+        self.has_changed = False
+
+def find_files(name, extensions, recursive=True):
+    if not os.path.isdir(name):
+        return [name]
+    files = list()
+    for root, dirs, filenames in os.walk(name):
+        dirs[:] = sorted(x for x in dirs if x != CACHE_FOLDER_NAME)
+        if not recursive:
+            dirs[:] = []
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] in extensions:
+                files.append(os.path.join(root, filename))
+    return files
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a file or folder, parse PDX script files and store them in the parse cache (warming it for the other scripts).')
+    parser.add_argument('input', metavar='input',
+                        help='File or folder (searched recursively) to parse')
+    parser.add_argument('-c', '--cache', required=False, default="",
+                        help='Cache folder (Default: INPUT/.hoi4cache for folders, .hoi4cache next to the file otherwise)')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes (Default: CPU count)')
+    parser.add_argument("--extensions", nargs="*", type=str, required=False, default=[".txt", ".gfx", ".gui"],
+                        help='Which file extensions should be parsed (Default: .txt .gfx .gui)')
+    args = parser.parse_args()
+
+    cache = ParseCache(args.cache or default_cache_dir(args.input))
+    files = find_files(args.input, args.extensions)
+    print("Parsing %s files..." % len(files))
+    nodes = 0
+    for name, tree in cache.load_many(files, args.jobs):
+        nodes += sum(1 for x in walk(tree))
+    cache.save()
+    print("Finished, %s files (%s nodes) - %s cache hits, %s parsed" % (len(files), nodes, cache.hits, cache.misses))
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,5):
+        sys.exit("Wrong Python version. Version 3.5 or higher is required to run this script!")
+    main()
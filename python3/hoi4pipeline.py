@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+import argparse
+import multiprocessing
+import os
+import sys
+import traceback
+
+import hoi4fileformatter
+import hoi4newspaperheaderadded
+import focusgfxshine
+
+#############################
+###
+### HoI 4 Mod Pipeline by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Runs several transforms over a mod in a single walk. Every file is read once,
+### all transforms that apply to it are run in the given order in a process pool
+### and the file is written once, only if it changed. Transforms that need data
+### from other files (eg. news event titles for the newspaper header) collect it
+### while those files are processed - files they modify are processed afterwards.
+###
+### What is shared between transforms is the read and decoded text of every file,
+### not a hoi4pdxparser tree. The transforms reuse the line and regex based code of
+### hoi4fileformatter.py, hoi4newspaperheaderadded.py and focusgfxshine.py, so the
+### output is the same as running those scripts one after another, and every
+### transform gets the text as left by the previous one (eg. after formatting),
+### which a tree parsed once would no longer match.
+###
+### usage: hoi4pipeline.py [-h] [-j JOBS] [-ws] [-ic]
+###                        [--extensions [EXTENSIONS [EXTENSIONS ...]]]
+###                        [--scripted_loc scripted_loc] [--goals goals]
+###                        [--goals_shine goals_shine]
+###                        mod_path transforms [transforms ...]
+###
+### Given a mod folder, run the given transforms over it in one pass.
+###
+### positional arguments:
+###   mod_path              Path to the root mod folder
+###   transforms            Transforms to run, in order: format,
+###                         newspaper_header, focus_shine
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -j JOBS, --jobs JOBS  Number of worker processes (Default: CPU count)
+###   -ws, --whitespace     format: ONLY remove whitespace at the end of the line
+###                         without formatting (Default: False)
+###   -ic, --ignore_comments
+###                         format: Ignore lines which start with # (or
+###                         whitespace #) (Default: False)
+###   --extensions [EXTENSIONS [EXTENSIONS ...]]
+###                         format: Which file extensions should be formatted
+###                         (Default: .txt .gfx)
+###   --scripted_loc scripted_loc
+###                         newspaper_header: The full string (including
+###                         brackets) to prefix localisation values with
+###                         (Default: [This.GetNewspaperHeader])
+###   --goals goals         focus_shine: Goals file, relative to the mod folder
+###                         (Default: interface/goals.gfx)
+###   --goals_shine goals_shine
+###                         focus_shine: Goals shine file, relative to the mod
+###                         folder (Default: interface/goals_shine.gfx)
+###
+#############################
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+#############################
+
+class Transform():
+    # Transforms get and return the decoded text of a file, see the header for why
+    # it is not a parse tree.
+    # needs_context - apply() needs data collected from other files, so files
+    # it applies to are processed after all the others
+    name = ""
+    needs_context = False
+
+    def applies_to(self, relpath):
+        return False
+
+    def collects_from(self, relpath):
+        return False
+
+    def collect(self, relpath, text):
+        return None
+
+    def merge(self, context, data):
+        return context
+
+    def apply(self, relpath, text, context):
+        return text
+
+class FormatTransform(Transform):
+    name = "format"
+
+    def __init__(self, extensions, remove_whitespace, ignore_comments):
+        self.extensions = tuple(extensions)
+        self.remove_whitespace = remove_whitespace
+        self.ignore_comments = ignore_comments
+
+    def applies_to(self, relpath):
+        return os.path.splitext(relpath)[1] in self.extensions
+
+    def apply(self, relpath, text, context):
+        return "".join(str(line) + "\n" for line in hoi4fileformatter.format_lines(text.splitlines(), self.remove_whitespace, self.ignore_comments))
+
+class NewspaperHeaderTransform(Transform):
+    name = "newspaper_header"
+    needs_context = True
+
+    def __init__(self, scripted_loc):
+        self.scripted_loc = scripted_loc.strip()
+
+    def applies_to(self, relpath):
+        folder = relpath.rsplit("/", 1)[0]
+        return relpath.endswith(".yml") and folder in ("localisation", "localisation/replace")
+
+    def collects_from(self, relpath):
+        return relpath.startswith("events/") and relpath.count("/") == 1 and relpath.endswith(".txt")
+
+    def collect(self, relpath, text):
+        return hoi4newspaperheaderadded.find_news_titles(text.splitlines(), set())
+
+    def merge(self, context, data):
+        return (context or set()) | data
+
+    def apply(self, relpath, text, context):
+        if not context:
+            return text
+        scripted_loc_re = hoi4newspaperheaderadded.get_scripted_loc_re(self.scripted_loc)
+        new_lines, has_changed = hoi4newspaperheaderadded.add_scripted_loc(text.splitlines(), context, scripted_loc_re, self.scripted_loc)
+        if not has_changed:
+            return text
+        return "".join(str(line) + "\n" for line in new_lines)
+
+class FocusShineTransform(Transform):
+    name = "focus_shine"
+    needs_context = True
+
+    def __init__(self, goals, goals_shine):
+        self.goals = goals.replace("\\", "/")
+        self.goals_shine = goals_shine.replace("\\", "/")
+
+    def applies_to(self, relpath):
+        return relpath == self.goals_shine
+
+    def collects_from(self, relpath):
+        return relpath == self.goals
+
+    def collect(self, relpath, text):
+        return text
+
+    def merge(self, context, data):
+        return data
+
+    def apply(self, relpath, text, context):
+        if context is None:
+            return text
+        goals_matches = focusgfxshine.find_missing_shines(context, text)
+        if not goals_matches:
+            return text
+        return focusgfxshine.add_shine_defs(text, goals_matches)
+
+TRANSFORMS = ("format", "newspaper_header", "focus_shine")
+
+#############################
+
+def process_file(job):
+    mod_path, relpath, transforms, contexts = job
+    name = os.path.join(mod_path, relpath)
+    try:
+        with open(name, "rb") as f:
+            data = f.read()
+        if data.startswith(b"\xef\xbb\xbf"):
+            encoding = "utf-8-sig"
+        else:
+            try:
+                data.decode("utf-8")
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "cp1252"
+        original_text = data.decode(encoding, errors="replace")
+        text = original_text
+        collected = dict()
+        for idx, transform in enumerate(transforms):
+            if transform.applies_to(relpath):
+                text = transform.apply(relpath, text, contexts[idx])
+            if transform.collects_from(relpath):
+                collected[idx] = transform.collect(relpath, text)
+        has_changed = text != original_text
+        if has_changed:
+            with open(name, "w", encoding=encoding, newline="") as f:
+                f.write(text)
+        return (relpath, has_changed, collected, None)
+    except Exception:
+        return (relpath, False, dict(), traceback.format_exc())
+
+def run_pipeline(mod_path, transforms, jobs=None):
+    first_stage = list()
+    second_stage = list()
+    for root, dirs, filenames in os.walk(mod_path):
+        dirs[:] = sorted(x for x in dirs if not x.startswith("."))
+        for filename in sorted(filenames):
+            relpath = os.path.relpath(os.path.join(root, filename), mod_path).replace("\\", "/")
+            applied = [x for x in transforms if x.applies_to(relpath)]
+            if not applied and not any(x.collects_from(relpath) for x in transforms):
+                continue
+            if any(x.needs_context for x in applied):
+                second_stage.append(relpath)
+            else:
+                first_stage.append(relpath)
+
+    contexts = [None] * len(transforms)
+    changed = list()
+    errors = list()
+    with multiprocessing.Pool(jobs) as pool:
+        for stage in (first_stage, second_stage):
+            stage_jobs = [(mod_path, relpath, transforms, contexts) for relpath in stage]
+            for relpath, has_changed, collected, error in pool.imap(process_file, stage_jobs, chunksize=16):
+                if error:
+                    errors.append((relpath, error))
+                    continue
+                if has_changed:
+                    changed.append(relpath)
+                for idx, data in collected.items():
+                    contexts[idx] = transforms[idx].merge(contexts[idx], data)
+    return (len(first_stage) + len(second_stage), changed, errors)
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a mod folder, run the given transforms over it in one pass.')
+    parser.add_argument('mod_path', metavar='mod_path',
+                        help='Path to the root mod folder')
+    parser.add_argument('transforms', nargs="+", choices=TRANSFORMS,
+                        help='Transforms to run, in order: %s' % ", ".join(TRANSFORMS))
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes (Default: CPU count)')
+    parser.add_argument( '-ws', '--whitespace', action='store_true', required=False, default=False,
+                        help='format: ONLY remove whitespace at the end of the line without formatting (Default: False)')
+    parser.add_argument( '-ic', '--ignore_comments', action='store_true', required=False, default=False,
+                        help='format: Ignore lines which start with # (or whitespace #) (Default: False)')
+    parser.add_argument( "--extensions", nargs="*", type=str, required=False, default=[".txt", ".gfx"],
+                        help='format: Which file extensions should be formatted (Default: .txt .gfx)')
+    parser.add_argument( '--scripted_loc', metavar='scripted_loc', default="[This.GetNewspaperHeader]", required=False,
+                        help='newspaper_header: The full string (including brackets) to prefix localisation values with (Default: [This.GetNewspaperHeader])')
+    parser.add_argument('--goals', metavar='goals', default="interface/goals.gfx", required=False,
+                        help='focus_shine: Goals file, relative to the mod folder (Default: interface/goals.gfx)')
+    parser.add_argument('--goals_shine', metavar='goals_shine', default="interface/goals_shine.gfx", required=False,
+                        help='focus_shine: Goals shine file, relative to the mod folder (Default: interface/goals_shine.gfx)')
+    args = parser.parse_args()
+
+    try:
+        readable_dir(args.mod_path)
+    except:
+        sys.exit("%s is not a directory or does not exist." % args.mod_path)
+
+    transforms = list()
+    for name in args.transforms:
+        if name == "format":
+            transforms.append(FormatTransform(args.extensions, args.whitespace, args.ignore_comments))
+        elif name == "newspaper_header":
+            transforms.append(NewspaperHeaderTransform(args.scripted_loc))
+        elif name == "focus_shine":
+            transforms.append(FocusShineTransform(args.goals, args.goals_shine))
+
+    print("Running %s on %s..." % (", ".join(args.transforms), args.mod_path))
+    processed, changed, errors = run_pipeline(args.mod_path, transforms, args.jobs)
+    for relpath in changed:
+        print("File %s modified" % relpath)
+    for relpath, error in errors:
+        print("File %s failed:\n%s" % (relpath, error))
+    print("Finished, %s files processed, %s modified, %s failed" % (processed, len(changed), len(errors)))
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,6):
+        sys.exit("Wrong Python version. Version 3.6 or higher is required to run this script!")
+    main()
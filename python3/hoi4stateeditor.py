@@ -0,0 +1,414 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import multiprocessing
+import os
+import re
+import sys
+import traceback
+
+import hoi4pdxparser
+
+#############################
+###
+### HoI 4 State Editor by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Bulk edits state history files. Files are parsed with hoi4pdxparser and only
+### the edited values are replaced in the original text, so comments, formatting
+### and everything else are kept as they are. Files are processed in parallel and
+### only written if they changed. Supersedes hoi4statemanpowermultiplier.py
+### (-op manpower multiply X).
+###
+### Fields are paths of keys inside the state block, separated by /
+### (eg. history/buildings/arms_factory). These aliases can be used as well:
+###   owner, controller   history/owner, history/controller
+###   category            state_category
+###   infrastructure, industrial_complex, arms_factory, dockyard, air_base,
+###   anti_air_building, synthetic_refinery, fuel_silo, radar_station
+###                       history/buildings/...
+### A field which is missing is added (set and add, starting from 0).
+###
+### Filters are FIELD=VALUE, FIELD!=VALUE, or FIELD<VALUE, FIELD<=VALUE,
+### FIELD>VALUE, FIELD>=VALUE for numbers. VALUE can be a comma separated list of
+### values and number ranges (eg. owner=GER,ITA or id=1-50,120). A state is edited
+### only if it matches every filter.
+###
+### usage: hoi4stateeditor.py [-h] [-op FIELD OPERATION VALUE] [-f FILTER]
+###                           [-j JOBS] [-n]
+###                           input
+###
+### Given a state history file or folder, apply the given operations to every state
+### matching the filters.
+###
+### positional arguments:
+###   input                 State history file name/folder containing files
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -op FIELD OPERATION VALUE, --operation FIELD OPERATION VALUE
+###                         Operation to apply, can be given several times
+###                         (applied in order). OPERATION is one of: set, add,
+###                         multiply
+###   -f FILTER, --filter FILTER
+###                         Only edit states matching the filter, can be given
+###                         several times (eg. -f owner=GER -f "manpower>100000")
+###   -j JOBS, --jobs JOBS  Number of worker processes, 1 to run in this process
+###                         (Default: CPU count)
+###   -n, --dry_run         Only print what would be changed (Default: False)
+###
+#############################
+
+OPERATIONS = ("set", "add", "multiply")
+FIELD_ALIASES = {
+    "owner": "history/owner",
+    "controller": "history/controller",
+    "category": "state_category",
+}
+for building in ("infrastructure", "industrial_complex", "arms_factory", "dockyard", "air_base", "anti_air_building", "synthetic_refinery", "fuel_silo", "radar_station"):
+    FIELD_ALIASES[building] = "history/buildings/" + building
+
+FILTER_REGEX = re.compile(r"^\s*([\w/.]+?)\s*(!=|<=|>=|=|<|>)\s*(.*?)\s*$")
+RANGE_REGEX = re.compile(r"^(-?[0-9.]+)-(-?[0-9.]+)$")
+
+Operation = collections.namedtuple("Operation", "field path operation value")
+Filter = collections.namedtuple("Filter", "field path operator values")
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+class StateError(Exception):
+    pass
+
+#############################
+
+def parse_field(field):
+    field = FIELD_ALIASES.get(field.lower(), field)
+    return tuple(x.lower() for x in field.split("/") if x)
+
+def parse_operation(field, operation, value):
+    if operation not in OPERATIONS:
+        raise StateError("unknown operation %s - must be one of: %s" % (operation, ", ".join(OPERATIONS)))
+    if operation != "set":
+        to_number(value)
+    return Operation(field, parse_field(field), operation, value)
+
+def parse_filter(text):
+    match = FILTER_REGEX.match(text)
+    if not match:
+        raise StateError("invalid filter %s" % text)
+    field, operator, value = match.groups()
+    if operator in ("=", "!="):
+        values = [x.strip() for x in value.split(",") if x.strip()]
+    else:
+        values = [to_number(value)]
+    return Filter(field, parse_field(field), operator, values)
+
+def to_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        raise StateError("%s is not a number" % value)
+
+def format_number(number, like):
+    # Values keep being integers if they were integers
+    if isinstance(like, int) or (isinstance(like, str) and "." not in like):
+        return str(int(round(number)))
+    return ("%.3f" % number).rstrip("0").rstrip(".")
+
+def find_state(tree):
+    return next((node for node in hoi4pdxparser.find(tree, "state") if isinstance(node.value, list)), None)
+
+def find_fields(tree, path):
+    # Nodes with plain values at the given path
+    for node in hoi4pdxparser.find(tree, path[0]):
+        if len(path) == 1:
+            if not isinstance(node.value, list):
+                yield node
+        elif isinstance(node.value, list):
+            yield from find_fields(node.value, path[1:])
+
+def get_values(state, path):
+    return [hoi4pdxparser.unquote(x.value) for x in find_fields(state.value, path)]
+
+def _value_matches(value, target):
+    if value.lower() == target.lower():
+        return True
+    match = RANGE_REGEX.match(target)
+    if match:
+        try:
+            return to_number(match.group(1)) <= to_number(value) <= to_number(match.group(2))
+        except StateError:
+            return False
+    return False
+
+def matches(state, filters):
+    for state_filter in filters:
+        values = get_values(state, state_filter.path)
+        if state_filter.operator == "=":
+            if not any(_value_matches(x, y) for x in values for y in state_filter.values):
+                return False
+        elif state_filter.operator == "!=":
+            if any(_value_matches(x, y) for x in values for y in state_filter.values):
+                return False
+        else:
+            target = state_filter.values[0]
+            numbers = list()
+            for value in values:
+                try:
+                    numbers.append(to_number(value))
+                except StateError:
+                    pass
+            compare = {"<": lambda x: x < target, "<=": lambda x: x <= target, ">": lambda x: x > target, ">=": lambda x: x >= target}[state_filter.operator]
+            if not any(compare(x) for x in numbers):
+                return False
+    return True
+
+def apply_operation(old_value, operation):
+    if operation.operation == "set":
+        return operation.value
+    old_number = to_number(old_value)
+    if operation.operation == "add":
+        return format_number(old_number + to_number(operation.value), old_value)
+    return format_number(old_number * to_number(operation.value), old_value)
+
+def _find_block(state, path):
+    # Deepest existing block along path, and the keys which are missing below it
+    block = state
+    for idx, key in enumerate(path[:-1]):
+        child = next((x for x in hoi4pdxparser.find(block.value, key) if isinstance(x.value, list)), None)
+        if child is None:
+            return (block, path[idx:])
+        block = child
+    return (block, path[-1:])
+
+def _render_inline(fields):
+    return " ".join("%s = { %s }" % (key, _render_inline(value)) if isinstance(value, dict) else "%s = %s" % (key, value) for key, value in fields.items())
+
+def _render_lines(fields, indent):
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            yield "%s%s = {" % (indent, key)
+            yield from _render_lines(value, indent + "\t")
+            yield "%s}" % indent
+        else:
+            yield "%s%s = %s" % (indent, key, value)
+
+def _insertion(text, block, fields):
+    # (offset, text) adding fields ({key: value or {key: ...}}) at the end of block.
+    # Missing fields sharing a missing parent are nested in a single new block
+    close = block.end - 1
+    if text[close:close + 1] != "}":
+        raise StateError("block %s at line %s is not closed" % (block.key, block.line))
+    newline = "\r\n" if "\r\n" in text else "\n"
+    line_start = text.rfind("\n", 0, close) + 1
+    indent = text[line_start:close]
+    if indent.strip():
+        # One-liner, eg. buildings = { infrastructure = 3 }
+        return (close, _render_inline(fields) + " ")
+    return (line_start, "".join(x + newline for x in _render_lines(fields, indent + "\t")))
+
+def edit_text(text, edits):
+    # edits are (start, end, replacement), applied back to front so offsets stay valid
+    order = sorted(range(len(edits)), key=lambda x: (edits[x][0], edits[x][1], x), reverse=True)
+    for start, end, replacement in (edits[x] for x in order):
+        text = text[:start] + replacement + text[end:]
+    return text
+
+def edit_state(text, operations, filters=()):
+    # Returns (new text, [(old value, new value)] for every operation), or
+    # (text, None) if the file has no state matching the filters
+    state = find_state(hoi4pdxparser.parse(text))
+    if state is None or not matches(state, filters):
+        return (text, None)
+    values = dict()
+    added = collections.OrderedDict()
+    changes = list()
+    for operation in operations:
+        nodes = list(find_fields(state.value, operation.path))
+        if nodes:
+            old_values = list()
+            new_values = list()
+            for node in nodes:
+                old_value = values[node.start][1] if node.start in values else hoi4pdxparser.unquote(node.value)
+                new_value = apply_operation(old_value, operation)
+                values[node.start] = (node, new_value)
+                old_values.append(old_value)
+                new_values.append(new_value)
+            changes.append((old_values, new_values))
+        elif operation.path in added or operation.operation == "set" or (operation.operation == "add" and to_number(operation.value) != 0):
+            old_value = added.get(operation.path)
+            new_value = apply_operation(old_value if old_value is not None else "0", operation)
+            added[operation.path] = new_value
+            changes.append(([old_value] if old_value is not None else [], [new_value]))
+        else:
+            changes.append(([], []))
+
+    edits = list()
+    for node, new_value in values.values():
+        if new_value != hoi4pdxparser.unquote(node.value):
+            if node.value.startswith('"') and not new_value.startswith('"'):
+                new_value = '"%s"' % new_value
+            edits.append((node.start, node.end, new_value))
+    insertions = collections.OrderedDict()
+    for path, new_value in added.items():
+        block, keys = _find_block(state, path)
+        fields = insertions.setdefault(block.start, (block, collections.OrderedDict()))[1]
+        for key in keys[:-1]:
+            fields = fields.setdefault(key, collections.OrderedDict())
+            if not isinstance(fields, dict):
+                raise StateError("%s is used both as a value and as a block" % "/".join(path))
+        if isinstance(fields.get(keys[-1]), dict):
+            raise StateError("%s is used both as a value and as a block" % "/".join(path))
+        fields[keys[-1]] = new_value
+    for block, fields in insertions.values():
+        offset, insert = _insertion(text, block, fields)
+        edits.append((offset, offset, insert))
+    return (edit_text(text, edits), changes)
+
+#############################
+
+def read_state_file(name):
+    # Returns (text, encoding), keeping the encoding (and BOM) to write the file back with
+    with open(name, "rb") as f:
+        data = f.read()
+    if data.startswith(b"\xef\xbb\xbf"):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            data.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "cp1252"
+    return (data.decode(encoding, errors="replace"), encoding)
+
+def write_state_file(name, text, encoding):
+    with open(name, "w", encoding=encoding, newline="") as f:
+        f.write(text)
+
+def process_file(job):
+    # Returns (name, has_changed, changes, error)
+    name, operations, filters, dry_run = job
+    try:
+        text, encoding = read_state_file(name)
+        new_text, changes = edit_state(text, operations, filters)
+        has_changed = new_text != text
+        if has_changed and not dry_run:
+            write_state_file(name, new_text, encoding)
+        return (name, has_changed, changes, None)
+    except StateError as e:
+        return (name, False, None, str(e))
+    except Exception:
+        return (name, False, None, traceback.format_exc())
+
+def find_state_files(name):
+    if not os.path.isdir(name):
+        return [name]
+    return sorted(os.path.join(name, x) for x in os.listdir(name) if x.lower().endswith(".txt"))
+
+def run_map(function, jobs_list, jobs=None):
+    if jobs == 1 or len(jobs_list) < 2:
+        yield from map(function, jobs_list)
+        return
+    with multiprocessing.Pool(jobs) as pool:
+        yield from pool.imap(function, jobs_list, chunksize=16)
+
+def sum_numbers(values):
+    total = 0
+    for value in values:
+        try:
+            total += to_number(value)
+        except StateError:
+            return None
+    return total
+
+def edit_states(files, operations, filters, jobs=None, dry_run=False):
+    # Returns (matched, modified, errors, [(old total, new total, states changed)] for every operation)
+    matched = 0
+    modified = list()
+    errors = list()
+    totals = [[0, 0, 0] for x in operations]
+    for name, has_changed, changes, error in run_map(process_file, [(x, operations, filters, dry_run) for x in files], jobs):
+        if error:
+            errors.append((name, error))
+            continue
+        if changes is None:
+            continue
+        matched += 1
+        if has_changed:
+            modified.append(name)
+        for total, (old_values, new_values) in zip(totals, changes):
+            if old_values != new_values:
+                total[2] += 1
+            for idx, values in ((0, old_values), (1, new_values)):
+                number = sum_numbers(values)
+                if number is None or total[idx] is None:
+                    total[idx] = None
+                else:
+                    total[idx] += number
+    return (matched, modified, errors, totals)
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a state history file or folder, apply the given operations to every state matching the filters.')
+    parser.add_argument('input', metavar='input',
+                        help='State history file name/folder containing files')
+    parser.add_argument('-op', '--operation', nargs=3, action='append', metavar=('FIELD', 'OPERATION', 'VALUE'), required=False, default=[],
+                        help='Operation to apply, can be given several times (applied in order). OPERATION is one of: %s' % ", ".join(OPERATIONS))
+    parser.add_argument('-f', '--filter', action='append', required=False, default=[],
+                        help='Only edit states matching the filter, can be given several times (eg. -f owner=GER -f "manpower>100000")')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes, 1 to run in this process (Default: CPU count)')
+    parser.add_argument('-n', '--dry_run', action='store_true', required=False, default=False,
+                        help='Only print what would be changed (Default: False)')
+    args = parser.parse_args()
+
+    if not args.operation:
+        parser.error("at least one -op is required")
+    try:
+        operations = [parse_operation(*x) for x in args.operation]
+        filters = [parse_filter(x) for x in args.filter]
+    except StateError as e:
+        sys.exit("Invalid argument: %s" % e)
+    if not os.path.exists(args.input):
+        sys.exit("%s does not exist." % args.input)
+
+    files = find_state_files(args.input)
+    print("Editing %s state files..." % len(files))
+    matched, modified, errors, totals = edit_states(files, operations, filters, args.jobs, args.dry_run)
+    for name in modified:
+        if args.dry_run:
+            print("File %s would be modified" % name)
+        else:
+            print("File %s modified successfully!" % name)
+    for name, error in errors:
+        print("File %s failed: %s" % (name, error))
+    for operation, (old_total, new_total, changed) in zip(operations, totals):
+        description = "%s %s %s" % (operation.field, operation.operation, operation.value)
+        if old_total is None or new_total is None:
+            print("%s: changed in %s states" % (description, changed))
+        else:
+            print("%s: total %s -> %s, changed in %s states" % (description, format_number(old_total, 0), format_number(new_total, 0), changed))
+    print("Finished, %s state files read, %s matched, %s modified, %s failed" % (len(files), matched, len(modified), len(errors)))
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,5):
+        sys.exit("Wrong Python version. Version 3.5 or higher is required to run this script!")
+    main()
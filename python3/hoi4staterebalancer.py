@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import csv
+import os
+import sys
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("Requires numpy pip package to be installed. Run:\npip install numpy\nor\npip3 install numpy\ndepending on your installation and start the script again.\nMore info on installing packages: https://docs.python.org/3/installing/index.html")
+
+import hoi4pdxparser
+import hoi4stateeditor
+
+#############################
+###
+### HoI 4 State Rebalancer by Yard1, originally for Equestria at War mod
+### Requires numpy pip package to be installed (pip install numpy / pip3 install numpy). More info on installing packages: https://docs.python.org/3/installing/index.html
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Rebalances state history files to per-country targets, eg. "GER should have
+### 80 million manpower and 40 military factories in total". Every state is loaded
+### into a table (in parallel) and the target of every country is split among the
+### states it owns in proportion to their current values (or to another field with
+### -w, eg. manpower). Values are rounded to integers with the largest remainder
+### method, so the totals are hit exactly. Only the changed values are edited (see
+### hoi4stateeditor.py) and only the affected state files are written. Fields a
+### state does not have yet are added, all in one block (eg. a state without
+### buildings getting arms_factory and industrial_complex targets gets a single
+### buildings block with both).
+###
+### Fields can be given as paths or with the aliases of hoi4stateeditor.py (eg.
+### manpower, industrial_complex, arms_factory, dockyard). A targets .csv file has
+### the columns: country tag;field;total (eg. GER;arms_factory;40).
+###
+### usage: hoi4staterebalancer.py [-h] [-t TAG FIELD TOTAL] [-tf TARGETS_FILE]
+###                               [-w WEIGHT] [-j JOBS] [-n]
+###                               input
+###
+### Given a state history folder and per-country targets, rebalance the states of
+### every country to its targets.
+###
+### positional arguments:
+###   input                 State history file name/folder containing files
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -t TAG FIELD TOTAL, --target TAG FIELD TOTAL
+###                         Total of FIELD all states owned by TAG should have,
+###                         can be given several times
+###   -tf TARGETS_FILE, --targets_file TARGETS_FILE
+###                         .csv file with targets (tag;field;total), one per line
+###                         (Default: "")
+###   -w WEIGHT, --weight WEIGHT
+###                         Split targets in proportion to this field instead of
+###                         the current values of the target field. Countries whose
+###                         states all have 0 get equal shares (Default: "")
+###   -j JOBS, --jobs JOBS  Number of worker processes, 1 to run in this process
+###                         (Default: CPU count)
+###   -n, --dry_run         Only print what would be changed (Default: False)
+###
+#############################
+
+OWNER_PATH = hoi4stateeditor.parse_field("owner")
+
+Target = collections.namedtuple("Target", "tag field path total")
+
+class StateTable():
+    # One row per state, one numpy column per field
+    def __init__(self, names, owners, columns):
+        self.names = names
+        self.owners = np.array(owners, dtype=object)
+        self.columns = columns
+
+#############################
+
+def read_targets(name):
+    targets = list()
+    with open(name, encoding="utf-8-sig", newline="") as f:
+        for line_number, row in enumerate(csv.reader(f, delimiter=";"), 1):
+            if not row or not "".join(row).strip() or row[0].strip().startswith("#"):
+                continue
+            if len(row) < 3:
+                raise hoi4stateeditor.StateError("%s line %s: expected tag;field;total" % (name, line_number))
+            targets.append(parse_target(*row[:3]))
+    return targets
+
+def parse_target(tag, field, total):
+    total = hoi4stateeditor.to_number(total.strip())
+    if total < 0:
+        raise hoi4stateeditor.StateError("target %s %s must not be negative" % (tag, field))
+    return Target(tag.strip().upper(), field.strip(), hoi4stateeditor.parse_field(field.strip()), int(round(total)))
+
+def load_state(job):
+    # Returns (name, owner, [value of every path], error)
+    name, paths = job
+    try:
+        text, encoding = hoi4stateeditor.read_state_file(name)
+        state = hoi4stateeditor.find_state(hoi4pdxparser.parse(text))
+        if state is None:
+            return (name, None, None, None)
+        owners = hoi4stateeditor.get_values(state, OWNER_PATH)
+        values = list()
+        for path in paths:
+            path_values = hoi4stateeditor.get_values(state, path)
+            values.append(hoi4stateeditor.to_number(path_values[0]) if path_values else 0)
+        return (name, owners[0].upper() if owners else None, values, None)
+    except hoi4stateeditor.StateError as e:
+        return (name, None, None, str(e))
+    except Exception as e:
+        return (name, None, None, "%s: %s" % (type(e).__name__, e))
+
+def load_states(files, paths, jobs=None):
+    names = list()
+    owners = list()
+    rows = list()
+    errors = list()
+    for name, owner, values, error in hoi4stateeditor.run_map(load_state, [(x, paths) for x in files], jobs):
+        if error:
+            errors.append((name, error))
+        elif values is not None:
+            names.append(name)
+            owners.append(owner)
+            rows.append(values)
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(paths))
+    return (StateTable(names, owners, {path: data[:, idx] for idx, path in enumerate(paths)}), errors)
+
+def allocate(totals, weights, groups):
+    # Splits totals[group] among the rows of every group in proportion to weights,
+    # rounding with the largest remainder method so every group sums to its total.
+    # Groups whose weights are all 0 are split equally
+    group_count = len(totals)
+    weight_sums = np.bincount(groups, weights=weights, minlength=group_count)
+    equal = weight_sums[groups] <= 0
+    weights = np.where(equal, 1.0, weights)
+    weight_sums = np.bincount(groups, weights=weights, minlength=group_count)
+    quotas = totals[groups] * weights / weight_sums[groups]
+    values = np.floor(quotas)
+    remainders = np.rint(totals - np.bincount(groups, weights=values, minlength=group_count)).astype(np.int64)
+    # Rank rows inside their group by fractional part, largest first (ties by row order)
+    order = np.lexsort((np.arange(len(groups)), -(quotas - values), groups))
+    group_starts = np.searchsorted(groups[order], np.arange(group_count))
+    ranks = np.empty(len(groups), dtype=np.int64)
+    ranks[order] = np.arange(len(groups)) - group_starts[groups[order]]
+    values += ranks < remainders[groups]
+    return values.astype(np.int64)
+
+def rebalance(table, targets, weight_path=None):
+    # Returns {path: new values} (-1 for states a path has no target in) and
+    # [(target, states, old total, new total, states changed)]
+    new_columns = dict()
+    summary = list()
+    paths = collections.OrderedDict((x.path, None) for x in targets)
+    for path in paths:
+        path_targets = [x for x in targets if x.path == path]
+        group_of_tag = {x.tag: idx for idx, x in enumerate(path_targets)}
+        groups = np.array([group_of_tag.get(x, -1) for x in table.owners], dtype=np.int64)
+        rows = groups >= 0
+        current = table.columns[path]
+        weights = table.columns[weight_path] if weight_path is not None else current
+        totals = np.array([x.total for x in path_targets], dtype=np.float64)
+        new_values = current.astype(np.int64)
+        new_values[rows] = allocate(totals, weights[rows], groups[rows])
+        new_columns[path] = np.where(rows, new_values, -1)
+        old_totals = np.bincount(groups[rows], weights=current[rows], minlength=len(path_targets))
+        new_totals = np.bincount(groups[rows], weights=new_values[rows], minlength=len(path_targets))
+        changed = np.bincount(groups[rows], weights=(new_values[rows] != current[rows]), minlength=len(path_targets))
+        states = np.bincount(groups[rows], minlength=len(path_targets))
+        for idx, target in enumerate(path_targets):
+            summary.append((target, int(states[idx]), old_totals[idx], new_totals[idx], int(changed[idx])))
+    return (new_columns, summary)
+
+def state_operations(table, new_columns, fields):
+    # Returns [(name, operations)] for every state with a changed value
+    jobs = list()
+    for row, name in enumerate(table.names):
+        operations = list()
+        for path, new_values in new_columns.items():
+            if new_values[row] >= 0 and new_values[row] != table.columns[path][row]:
+                operations.append(hoi4stateeditor.parse_operation(fields[path], "set", str(int(new_values[row]))))
+        if operations:
+            jobs.append((name, operations))
+    return jobs
+
+def write_states(jobs_list, jobs=None, dry_run=False):
+    modified = list()
+    errors = list()
+    for name, has_changed, changes, error in hoi4stateeditor.run_map(hoi4stateeditor.process_file, [(name, operations, (), dry_run) for name, operations in jobs_list], jobs):
+        if error:
+            errors.append((name, error))
+        elif has_changed:
+            modified.append(name)
+    return (modified, errors)
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a state history folder and per-country targets, rebalance the states of every country to its targets.')
+    parser.add_argument('input', metavar='input',
+                        help='State history file name/folder containing files')
+    parser.add_argument('-t', '--target', nargs=3, action='append', metavar=('TAG', 'FIELD', 'TOTAL'), required=False, default=[],
+                        help='Total of FIELD all states owned by TAG should have, can be given several times')
+    parser.add_argument('-tf', '--targets_file', required=False, default="",
+                        help='.csv file with targets (tag;field;total), one per line (Default: "")')
+    parser.add_argument('-w', '--weight', required=False, default="",
+                        help='Split targets in proportion to this field instead of the current values of the target field. Countries whose states all have 0 get equal shares (Default: "")')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes, 1 to run in this process (Default: CPU count)')
+    parser.add_argument('-n', '--dry_run', action='store_true', required=False, default=False,
+                        help='Only print what would be changed (Default: False)')
+    args = parser.parse_args()
+
+    try:
+        targets = [parse_target(*x) for x in args.target]
+        if args.targets_file:
+            targets += read_targets(args.targets_file)
+    except OSError:
+        sys.exit("Could not read targets file %s!" % args.targets_file)
+    except hoi4stateeditor.StateError as e:
+        sys.exit("Invalid target: %s" % e)
+    if not targets:
+        parser.error("at least one target is required (-t or -tf)")
+    seen = set()
+    for target in targets:
+        if (target.tag, target.path) in seen:
+            sys.exit("Target %s %s given more than once" % (target.tag, target.field))
+        seen.add((target.tag, target.path))
+    if not os.path.exists(args.input):
+        sys.exit("%s does not exist." % args.input)
+
+    fields = collections.OrderedDict((x.path, x.field) for x in targets)
+    weight_path = hoi4stateeditor.parse_field(args.weight) if args.weight else None
+    paths = list(fields)
+    if weight_path is not None and weight_path not in fields:
+        paths.append(weight_path)
+
+    files = hoi4stateeditor.find_state_files(args.input)
+    print("Loading %s state files..." % len(files))
+    table, errors = load_states(files, paths, args.jobs)
+    for name, error in errors:
+        print("File %s failed: %s" % (name, error))
+    if errors:
+        sys.exit("Not rebalancing - every state file has to be read.")
+
+    new_columns, summary = rebalance(table, targets, weight_path)
+    for target, states, old_total, new_total, changed in summary:
+        if not states:
+            print("%s %s: no states owned, skipped" % (target.tag, target.field))
+        else:
+            print("%s %s: total %s -> %s, changed in %s states" % (target.tag, target.field, int(old_total), int(new_total), changed))
+    modified, errors = write_states(state_operations(table, new_columns, fields), args.jobs, args.dry_run)
+    for name in modified:
+        if args.dry_run:
+            print("File %s would be modified" % name)
+        else:
+            print("File %s modified successfully!" % name)
+    for name, error in errors:
+        print("File %s failed: %s" % (name, error))
+    print("Finished, %s states loaded, %s modified, %s failed" % (len(table.names), len(modified), len(errors)))
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,5):
+        sys.exit("Wrong Python version. Version 3.5 or higher is required to run this script!")
+    main()
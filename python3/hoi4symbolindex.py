@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+import argparse
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+
+import hoi4pdxparser
+
+#############################
+###
+### HoI 4 Mod Symbol Index by Yard1, originally for Equestria at War mod
+### Written in Python 3.6
+###
+### Copyright (c) 2018 Antoni Baum (Yard1)
+### Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+### The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+### THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+###
+### Indexes every event, focus, idea, technology, localisation key and GFX sprite
+### defined or referenced in a mod, with file and line, in an SQLite database.
+### Only files whose mtime or size changed since the last run are re-indexed.
+### Other scripts can look symbols up with the SymbolIndex class (or with a plain
+### SQL query on the symbols table, indexed on kind and name - see SCHEMA_VERSION).
+###
+### usage: hoi4symbolindex.py [-h] [-db DATABASE] [-c CACHE] [-j JOBS]
+###                           [-q KIND NAME]
+###                           mod_path
+###
+### Given a mod folder, update the symbol index of the mod and optionally look up a
+### symbol.
+###
+### positional arguments:
+###   mod_path              Path to the root mod folder
+###
+### optional arguments:
+###   -h, --help            show this help message and exit
+###   -db DATABASE, --database DATABASE
+###                         SQLite database to write to (Default:
+###                         MOD_PATH/.hoi4cache/symbols.sqlite)
+###   -c CACHE, --cache CACHE
+###                         Parse cache folder (Default: MOD_PATH/.hoi4cache)
+###   -j JOBS, --jobs JOBS  Number of worker processes (Default: CPU count)
+###   -q KIND NAME, --query KIND NAME
+###                         Print definitions and references of a symbol. KIND is
+###                         one of: event, focus, idea, technology,
+###                         localisation, sprite
+###
+#############################
+
+KINDS = ("event", "focus", "idea", "technology", "localisation", "sprite")
+SCRIPT_EXTENSIONS = (".txt", ".gfx", ".gui")
+LOCALISATION_EXTENSIONS = (".yml",)
+
+EVENT_TYPES = {"country_event", "news_event", "state_event", "unit_leader_event", "operative_leader_event"}
+EVENT_REFERENCE_KEYS = EVENT_TYPES | {"event_target_event"}
+FOCUS_REFERENCE_KEYS = {"focus", "has_completed_focus", "complete_national_focus", "unlock_national_focus", "uncomplete_national_focus"}
+IDEA_REFERENCE_KEYS = {"has_idea", "add_ideas", "remove_ideas", "idea", "add_idea", "remove_idea"}
+TECHNOLOGY_REFERENCE_KEYS = {"has_tech", "set_technology", "leads_to_tech", "technology"}
+NOT_A_SYMBOL_KEYS = {"popup", "days", "limit"}
+LOCALISATION_REFERENCE_KEYS = {"title", "desc", "name", "text", "custom_effect_tooltip", "custom_trigger_tooltip", "tooltip", "localization_key"}
+
+LOC_KEY_REGEX = re.compile(r'^\s*([^#\s:]+):[0-9]*\s*"')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    line INTEGER NOT NULL,
+    is_definition INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_kind_name ON symbols (kind, name, is_definition);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);
+"""
+# The databases are read without this module by python2/hoi4ideagfxentry.py and
+# python2/hoi4localisationadder.py, which keep their own copies of
+# SCHEMA_VERSION and IS_DEFINED_QUERY and refuse databases of other versions
+# (PRAGMA user_version). Any change to SCHEMA has to bump SCHEMA_VERSION and
+# update those scripts. Databases of other versions are rebuilt from scratch.
+SCHEMA_VERSION = 1
+IS_DEFINED_QUERY = "SELECT 1 FROM symbols WHERE kind = ? AND name = ? AND is_definition = 1 LIMIT 1"
+
+def readable_dir(prospective_dir):
+  if not os.path.isdir(prospective_dir):
+    raise Exception("readable_dir:{0} is not a valid path".format(prospective_dir))
+  if os.access(prospective_dir, os.R_OK):
+    return prospective_dir
+  else:
+    raise Exception("readable_dir:{0} is not a readable dir".format(prospective_dir))
+
+#############################
+
+def _values(node):
+    # Plain values of a node - "key = value", "key = { a b c }" or "key = { a = 1 b = 2 }"
+    if isinstance(node.value, list):
+        for child in node.value:
+            if not isinstance(child.value, list):
+                if child.key is None:
+                    yield (child.value, child.line)
+                elif child.key.lower() not in NOT_A_SYMBOL_KEYS:
+                    yield (child.key, child.line)
+    else:
+        yield (node.value, node.line)
+
+def _tree_definitions(relpath, tree):
+    folder = relpath.replace("\\", "/").lower()
+    if folder.startswith("events/"):
+        for node in tree:
+            if node.key is not None and node.key.lower() in EVENT_TYPES and isinstance(node.value, list):
+                event_id = hoi4pdxparser.get_value(node.value, "id")
+                if isinstance(event_id, str):
+                    yield ("event", event_id, node.line)
+    elif folder.startswith("common/national_focus/"):
+        for path, node in hoi4pdxparser.walk(tree):
+            if node.key is not None and node.key.lower() in ("focus", "shared_focus") and isinstance(node.value, list):
+                focus_id = hoi4pdxparser.get_value(node.value, "id")
+                if isinstance(focus_id, str):
+                    yield ("focus", focus_id, node.line)
+    elif folder.startswith("common/ideas/"):
+        for ideas in hoi4pdxparser.find(tree, "ideas"):
+            for category in ideas.value if isinstance(ideas.value, list) else []:
+                for idea in category.value if isinstance(category.value, list) else []:
+                    if idea.key is not None and isinstance(idea.value, list):
+                        yield ("idea", idea.key, idea.line)
+    elif folder.startswith("common/technologies/"):
+        for technologies in hoi4pdxparser.find(tree, "technologies"):
+            for technology in technologies.value if isinstance(technologies.value, list) else []:
+                if technology.key is not None and isinstance(technology.value, list) and not technology.key.startswith("@"):
+                    yield ("technology", technology.key, technology.line)
+    if folder.endswith(".gfx"):
+        for path, node in hoi4pdxparser.walk(tree):
+            if node.key is not None and node.key.lower().endswith("spritetype") and isinstance(node.value, list):
+                name = hoi4pdxparser.get_value(node.value, "name")
+                if isinstance(name, str):
+                    yield ("sprite", hoi4pdxparser.unquote(name), node.line)
+
+def _tree_references(relpath, tree):
+    is_event_file = relpath.replace("\\", "/").lower().startswith("events/")
+    is_gfx_file = relpath.lower().endswith(".gfx")
+    for path, node in hoi4pdxparser.walk(tree):
+        if node.key is None:
+            continue
+        key = node.key.lower()
+        if key in EVENT_REFERENCE_KEYS and not (is_event_file and not path):
+            if isinstance(node.value, list):
+                event_id = hoi4pdxparser.get_value(node.value, "id")
+                if isinstance(event_id, str):
+                    yield ("event", event_id, node.line)
+            else:
+                yield ("event", node.value, node.line)
+        elif key in FOCUS_REFERENCE_KEYS and not isinstance(node.value, list):
+            yield ("focus", node.value, node.line)
+        elif key in IDEA_REFERENCE_KEYS:
+            for value, line in _values(node):
+                yield ("idea", value, line)
+        elif key in TECHNOLOGY_REFERENCE_KEYS:
+            for value, line in _values(node):
+                yield ("technology", value, line)
+        if key in LOCALISATION_REFERENCE_KEYS and not is_gfx_file and not isinstance(node.value, list):
+            yield ("localisation", hoi4pdxparser.unquote(node.value), node.line)
+        if not isinstance(node.value, list):
+            value = hoi4pdxparser.unquote(node.value)
+            if value.startswith("GFX_") and not (key == "name" and path and path[-1].lower().endswith("spritetype")):
+                yield ("sprite", value, node.line)
+
+def tree_symbols(relpath, tree):
+    symbols = [(kind, name, line, 1) for kind, name, line in _tree_definitions(relpath, tree)]
+    symbols.extend((kind, name, line, 0) for kind, name, line in _tree_references(relpath, tree))
+    return symbols
+
+def read_localisation_symbols(name):
+    symbols = list()
+    try:
+        text = hoi4pdxparser.read_file(name)
+    except OSError:
+        print("Could not read file " + name + "!")
+        return symbols
+    for line_number, line in enumerate(text.splitlines(), 1):
+        match = LOC_KEY_REGEX.match(line)
+        if match:
+            symbols.append(("localisation", match.group(1), line_number, 1))
+    return symbols
+
+#############################
+
+class SymbolIndex():
+    def __init__(self, database):
+        self.database = database
+        directory = os.path.dirname(os.path.abspath(database))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(database)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS symbols; DROP TABLE IF EXISTS files;")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, mod_path, jobs=None, cache=None):
+        known = {path: (file_id, mtime_ns, size) for file_id, path, mtime_ns, size in self.connection.execute("SELECT id, path, mtime_ns, size FROM files")}
+        found = set()
+        changed_scripts = list()
+        changed_localisation = list()
+        for root, dirs, filenames in os.walk(mod_path):
+            dirs[:] = sorted(x for x in dirs if not x.startswith("."))
+            for filename in sorted(filenames):
+                extension = os.path.splitext(filename)[1].lower()
+                if extension not in SCRIPT_EXTENSIONS and extension not in LOCALISATION_EXTENSIONS:
+                    continue
+                name = os.path.join(root, filename)
+                relpath = os.path.relpath(name, mod_path).replace("\\", "/")
+                found.add(relpath)
+                st = os.stat(name)
+                if known.get(relpath, (None, None, None))[1:] == (st.st_mtime_ns, st.st_size):
+                    continue
+                if extension in LOCALISATION_EXTENSIONS:
+                    changed_localisation.append((relpath, name, st))
+                else:
+                    changed_scripts.append((relpath, name, st))
+        removed = [path for path in known if path not in found]
+
+        with self.connection:
+            for path in removed:
+                self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            if cache is None:
+                cache = hoi4pdxparser.ParseCache(hoi4pdxparser.default_cache_dir(mod_path))
+            trees = cache.load_many([x[1] for x in changed_scripts], jobs)
+            for (relpath, name, st), (_, tree) in zip(changed_scripts, trees):
+                self._store(relpath, st, tree_symbols(relpath, tree))
+            cache.save()
+            if changed_localisation:
+                with multiprocessing.Pool(jobs) as pool:
+                    results = pool.imap(read_localisation_symbols, [x[1] for x in changed_localisation], chunksize=4)
+                    for (relpath, name, st), symbols in zip(changed_localisation, results):
+                        self._store(relpath, st, symbols)
+        return (len(changed_scripts) + len(changed_localisation), len(removed))
+
+    def _store(self, relpath, st, symbols):
+        self.connection.execute("DELETE FROM files WHERE path = ?", (relpath,))
+        file_id = self.connection.execute("INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)", (relpath, st.st_mtime_ns, st.st_size)).lastrowid
+        self.connection.executemany("INSERT INTO symbols (kind, name, file_id, line, is_definition) VALUES (?, ?, ?, ?, ?)",
+                                    ((kind, name, file_id, line, is_definition) for kind, name, line, is_definition in symbols))
+
+    def _find(self, kind, name, is_definition):
+        return self.connection.execute("SELECT files.path, symbols.line FROM symbols JOIN files ON files.id = symbols.file_id WHERE symbols.kind = ? AND symbols.name = ? AND symbols.is_definition = ? ORDER BY files.path, symbols.line",
+                                       (kind, name, is_definition)).fetchall()
+
+    def definitions(self, kind, name):
+        return self._find(kind, name, 1)
+
+    def references(self, kind, name):
+        return self._find(kind, name, 0)
+
+    def is_defined(self, kind, name):
+        return self.connection.execute(IS_DEFINED_QUERY, (kind, name)).fetchone() is not None
+
+    def names(self, kind, is_definition=1):
+        return {x[0] for x in self.connection.execute("SELECT DISTINCT name FROM symbols WHERE kind = ? AND is_definition = ?", (kind, is_definition))}
+
+    def counts(self):
+        return self.connection.execute("SELECT kind, SUM(is_definition), SUM(1 - is_definition) FROM symbols GROUP BY kind ORDER BY kind").fetchall()
+
+def default_database(mod_path):
+    return os.path.join(mod_path, hoi4pdxparser.CACHE_FOLDER_NAME, "symbols.sqlite")
+
+#############################
+
+def main():
+    parser = argparse.ArgumentParser(description='Given a mod folder, update the symbol index of the mod and optionally look up a symbol.')
+    parser.add_argument('mod_path', metavar='mod_path',
+                        help='Path to the root mod folder')
+    parser.add_argument('-db', '--database', required=False, default="",
+                        help='SQLite database to write to (Default: MOD_PATH/.hoi4cache/symbols.sqlite)')
+    parser.add_argument('-c', '--cache', required=False, default="",
+                        help='Parse cache folder (Default: MOD_PATH/.hoi4cache)')
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes (Default: CPU count)')
+    parser.add_argument('-q', '--query', nargs=2, metavar=('KIND', 'NAME'), required=False,
+                        help='Print definitions and references of a symbol. KIND is one of: %s' % ", ".join(KINDS))
+    args = parser.parse_args()
+
+    try:
+        readable_dir(args.mod_path)
+    except:
+        sys.exit("%s is not a directory or does not exist." % args.mod_path)
+    if args.query and args.query[0] not in KINDS:
+        sys.exit("Unknown symbol kind %s - must be one of: %s" % (args.query[0], ", ".join(KINDS)))
+
+    index = SymbolIndex(args.database or default_database(args.mod_path))
+    cache = hoi4pdxparser.ParseCache(args.cache or hoi4pdxparser.default_cache_dir(args.mod_path))
+    print("Updating index %s..." % index.database)
+    updated, removed = index.update(args.mod_path, args.jobs, cache)
+    print("Index updated, %s files re-indexed, %s removed" % (updated, removed))
+    for kind, definitions, references in index.counts():
+        print("%s: %s definitions, %s references" % (kind, definitions, references))
+    if args.query:
+        kind, name = args.query
+        for title, rows in (("Definitions", index.definitions(kind, name)), ("References", index.references(kind, name))):
+            print("%s of %s %s:" % (title, kind, name))
+            for path, line in rows:
+                print("\t%s:%s" % (path, line))
+    index.close()
+
+if __name__ == "__main__":
+    if not sys.version_info >= (3,5):
+        sys.exit("Wrong Python version. Version 3.5 or higher is required to run this script!")
+    main()